@@ -0,0 +1,107 @@
+# admin_cache.py - Per-chat admin list cache
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from telegram import Bot, ChatMember, Update
+from telegram.ext import ContextTypes
+from config import Config
+from helpers.logger import get_logger
+
+logger = get_logger(__name__)
+
+ADMIN_STATUSES = (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+
+class AdminCache:
+    """Cache each chat's administrators from a single get_chat_administrators call.
+
+    Entries live for ttl seconds and are dropped as soon as a chat_member or
+    my_chat_member update shows someone gaining, losing or changing admin
+    rights. Concurrent misses for one chat share a single in-flight fetch.
+    """
+
+    def __init__(self, ttl: int = Config.ADMIN_CACHE_TTL, max_chats: int = 10000):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.entries: 'OrderedDict[int, tuple]' = OrderedDict()
+        self.inflight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_admins(self, bot: Bot, chat_id: int) -> Dict[int, ChatMember]:
+        """Return a user_id -> ChatMember mapping of the chat's administrators"""
+        entry = self.entries.get(chat_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(chat_id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        pending = self.inflight.get(chat_id)
+        if pending is None:
+            pending = asyncio.get_running_loop().create_future()
+            self.inflight[chat_id] = pending
+            try:
+                members = await bot.get_chat_administrators(chat_id)
+                admins = {member.user.id: member for member in members}
+                # An invalidation during the fetch means the result may already be stale
+                if self.inflight.get(chat_id) is pending:
+                    self.store(chat_id, admins)
+                pending.set_result(admins)
+            except Exception as e:
+                pending.set_exception(e)
+                # Mark the exception retrieved when nobody else was waiting on it
+                pending.exception()
+            finally:
+                if not pending.done():
+                    # The fetching task itself was cancelled
+                    pending.cancel()
+                if self.inflight.get(chat_id) is pending:
+                    del self.inflight[chat_id]
+        return await asyncio.shield(pending)
+
+    def store(self, chat_id: int, admins: Dict[int, ChatMember]):
+        """Cache an admin mapping for one chat"""
+        self.entries[chat_id] = (time.monotonic() + self.ttl, admins)
+        self.entries.move_to_end(chat_id)
+        while len(self.entries) > self.max_chats:
+            self.entries.popitem(last=False)
+
+    async def get_admin(self, bot: Bot, chat_id: int, user_id: int) -> Optional[ChatMember]:
+        """Return the user's admin ChatMember, or None if they are not an admin"""
+        return (await self.get_admins(bot, chat_id)).get(user_id)
+
+    async def is_admin(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        """Check if a user is an administrator or the owner of a chat"""
+        return await self.get_admin(bot, chat_id, user_id) is not None
+
+    async def has_permission(self, bot: Bot, chat_id: int, user_id: int, permission: str) -> bool:
+        """Check a specific admin right such as 'can_restrict_members'"""
+        member = await self.get_admin(bot, chat_id, user_id)
+        if member is None:
+            return False
+        if member.status == ChatMember.OWNER:
+            return True
+        return bool(getattr(member, permission, False))
+
+    def invalidate(self, chat_id: int):
+        """Drop a chat's cached admins and detach any in-flight fetch"""
+        self.entries.pop(chat_id, None)
+        self.inflight.pop(chat_id, None)
+
+    async def handle_member_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Invalidate on promotions, demotions and rights changes"""
+        member_update = update.chat_member or update.my_chat_member
+        if member_update is None:
+            return
+
+        # Covers promotion, demotion and edits of an existing admin's rights
+        old, new = member_update.old_chat_member, member_update.new_chat_member
+        if old.status in ADMIN_STATUSES or new.status in ADMIN_STATUSES:
+            self.invalidate(member_update.chat.id)
+            logger.debug(f"Admin cache invalidated for chat {member_update.chat.id}")
+
+
+# Global admin cache
+admin_cache = AdminCache()
@@ -1 +1,109 @@
 # antiflood.py - Anti-flood protection
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import Config
+
+
+class FloodPolicy:
+    """Flood limit for a chat: more than `limit` messages within `window` seconds"""
+
+    __slots__ = ('limit', 'window')
+
+    def __init__(self, limit: int = Config.DEFAULT_FLOOD_LIMIT, window: float = Config.DEFAULT_FLOOD_TIME):
+        self.limit = limit
+        self.window = float(window)
+
+
+COUNT_MASK = 0xFFFF
+
+
+class FloodControl:
+    """Sliding-window flood detector with constant work and memory per (chat, user).
+
+    Each sender is a single packed int keyed by another packed int: the
+    start of the current fixed window in milliseconds, the count in the
+    previous window and the count in the current one. The sliding count is
+    estimated by weighting the previous window by how much of it still
+    overlaps the sliding window, which is accurate enough for flood control
+    and never stores per-message timestamps.
+
+    Entries live in one LRU ordered by last activity, so idle senders are
+    evicted from the front in O(1) as new messages arrive and the table
+    never grows beyond max_entries.
+    """
+
+    def __init__(self, default_policy: Optional[FloodPolicy] = None, max_entries: int = 1_000_000):
+        self.default_policy = default_policy or FloodPolicy()
+        self.policies: Dict[int, FloodPolicy] = {}
+        self.max_entries = max_entries
+        # chat_id << 64 | user_id -> window_start_ms << 32 | previous_count << 16 | current_count
+        self.entries: 'OrderedDict[int, int]' = OrderedDict()
+
+    def set_policy(self, chat_id: int, limit: int, window: float):
+        """Override the flood limit for one chat"""
+        self.policies[chat_id] = FloodPolicy(limit, window)
+
+    def clear_policy(self, chat_id: int):
+        """Revert a chat to the default flood limit"""
+        self.policies.pop(chat_id, None)
+
+    def check(self, chat_id: int, user_id: int, now: Optional[float] = None) -> bool:
+        """Record a message and return True if the sender is now flooding"""
+        now_ms = int((time.monotonic() if now is None else now) * 1000)
+        policy = self.policies.get(chat_id, self.default_policy)
+        window_ms = int(policy.window * 1000)
+        key = chat_id << 64 | user_id
+        entries = self.entries
+
+        packed = entries.get(key)
+        if packed is None:
+            entries[key] = now_ms << 32 | 1
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self.evict_idle(now_ms)
+            return 1 > policy.limit
+
+        start = packed >> 32
+        previous = (packed >> 16) & COUNT_MASK
+        current = packed & COUNT_MASK
+        elapsed = now_ms - start
+        if elapsed >= window_ms:
+            # Roll forward; two or more windows of silence forget the history
+            windows = elapsed // window_ms
+            previous = current if windows == 1 else 0
+            current = 0
+            start += windows * window_ms
+            elapsed -= windows * window_ms
+        if current < COUNT_MASK:
+            current += 1
+
+        entries[key] = start << 32 | previous << 16 | current
+        entries.move_to_end(key)
+        self.evict_idle(now_ms)
+
+        return previous * (1.0 - elapsed / window_ms) + current > policy.limit
+
+    def evict_idle(self, now_ms: int, budget: int = 2):
+        """Drop up to `budget` of the least recently active idle senders"""
+        entries = self.entries
+        for _ in range(budget):
+            if not entries:
+                return
+            key = next(iter(entries))
+            policy = self.policies.get(key >> 64, self.default_policy)
+            # The window start trails the last message by at most one window
+            if now_ms - (entries[key] >> 32) < 3000 * policy.window:
+                return
+            del entries[key]
+
+    def reset(self, chat_id: int, user_id: int):
+        """Forget a sender's history, e.g. after they were muted"""
+        self.entries.pop(chat_id << 64 | user_id, None)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+# Global flood detector
+flood_control = FloodControl()
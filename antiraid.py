@@ -0,0 +1,294 @@
+# antiraid.py - Join-burst raid detection and batched lockdown
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from telegram import Bot, ChatPermissions, Update
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes
+from config import Config
+from helpers.logger import get_logger
+from metrics import RAID_ACTIONS, RAIDS_DETECTED
+from purge import MAX_DELETE_BATCH, purger
+from ratelimit import PRIORITY_DEFAULT, priority
+
+logger = get_logger(__name__)
+
+RAID_ACTIONS_ALLOWED = ('restrict', 'ban', 'kick')
+
+
+class RaidPolicy:
+    """Raid threshold for a chat: more than `limit` joins within `window` seconds"""
+
+    __slots__ = ('limit', 'window', 'action', 'duration')
+
+    def __init__(self, limit: int = Config.DEFAULT_RAID_LIMIT, window: float = Config.DEFAULT_RAID_TIME,
+                 action: str = Config.DEFAULT_RAID_ACTION, duration: float = Config.RAID_MODE_DURATION):
+        if action not in RAID_ACTIONS_ALLOWED:
+            raise ValueError(f"Raid action must be one of {', '.join(RAID_ACTIONS_ALLOWED)}")
+        self.limit = limit
+        self.window = float(window)
+        self.action = action
+        self.duration = float(duration)
+
+
+class JoinRate:
+    """Joins of one chat counted in a ring of fixed-width time buckets.
+
+    The window is split into BUCKETS slots, so the count covers the window
+    to within one bucket and a chat costs a dozen ints however many
+    members join. The last few joiners are kept so the burst that trips
+    the threshold can be acted on too, not only the joins after it.
+    """
+
+    BUCKETS = 10
+
+    __slots__ = ('width', 'last', 'counts', 'recent')
+
+    def __init__(self, window: float, limit: int):
+        self.width = window / self.BUCKETS
+        self.last = 0
+        self.counts = [0] * self.BUCKETS
+        self.recent: Deque[Tuple[float, int, Optional[int]]] = deque(maxlen=limit + 1)
+
+    def record(self, now: float, joins: int) -> int:
+        """Count joins at now and return the total within the window"""
+        index = int(now / self.width)
+        gap = index - self.last
+        if gap >= self.BUCKETS:
+            self.counts = [0] * self.BUCKETS
+        else:
+            for skipped in range(self.last + 1, self.last + gap + 1):
+                self.counts[skipped % self.BUCKETS] = 0
+        if gap > 0:
+            self.last = index
+        self.counts[self.last % self.BUCKETS] += joins
+        return sum(self.counts)
+
+    def idle_since(self) -> float:
+        return (self.last + 1) * self.width
+
+
+class RaidBatch:
+    """Joiners and service messages waiting for the next batch of API calls"""
+
+    __slots__ = ('user_ids', 'message_ids', 'task', 'immediate')
+
+    def __init__(self, immediate: bool = False):
+        self.user_ids: List[int] = []
+        self.message_ids: List[int] = []
+        self.task: Optional[asyncio.Task] = None
+        # The batch that tripped detection goes out at once instead of waiting for company
+        self.immediate = immediate
+
+
+class AntiRaid:
+    """Detect join bursts and lock raided chats down in batches.
+
+    Every join is counted in the chat's JoinRate. Once more than the
+    policy's limit join within its window, the chat is in raid mode for
+    the policy's duration, extended by every further join; a timer ends
+    it once the chat has been quiet that long. In raid mode
+    joiners are not handled one by one: they are collected for
+    batch_delay seconds (or until max_batch are waiting, or their join
+    messages fill one deleteMessages call), then the whole
+    batch is restricted, banned or kicked concurrently and its join
+    service messages are deleted with bulk deleteMessages calls. The
+    joiners that tripped the threshold are handled at once.
+    """
+
+    def __init__(self, default_policy: Optional[RaidPolicy] = None, batch_delay: float = Config.RAID_BATCH_DELAY,
+                 max_batch: int = 200, concurrency: int = Config.RAID_ACTION_CONCURRENCY, max_chats: int = 100000):
+        self.default_policy = default_policy or RaidPolicy()
+        self.policies: Dict[int, RaidPolicy] = {}
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        self.concurrency = max(concurrency, 1)
+        self.max_chats = max_chats
+        self.rates: 'OrderedDict[int, JoinRate]' = OrderedDict()
+        self.raid_until: Dict[int, float] = {}
+        self.raid_timers: Dict[int, asyncio.TimerHandle] = {}
+        self.batches: Dict[int, RaidBatch] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.actioned = 0
+
+    def set_policy(self, chat_id: int, policy: RaidPolicy):
+        """Override the raid policy for one chat"""
+        self.policies[chat_id] = policy
+        self.rates.pop(chat_id, None)
+
+    def clear_policy(self, chat_id: int):
+        self.policies.pop(chat_id, None)
+        self.rates.pop(chat_id, None)
+
+    def in_raid(self, chat_id: int, now: Optional[float] = None) -> bool:
+        until = self.raid_until.get(chat_id)
+        if until is None:
+            return False
+        if until <= (time.monotonic() if now is None else now):
+            self.finish_raid(chat_id)
+            return False
+        return True
+
+    def end_raid(self, chat_id: int):
+        """Leave raid mode early, e.g. when an admin turns it off"""
+        self.raid_until.pop(chat_id, None)
+        timer = self.raid_timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def finish_raid(self, chat_id: int):
+        self.end_raid(chat_id)
+        logger.info(f"🛡️ Raid mode ended in chat {chat_id}")
+
+    def watch_raid(self, chat_id: int, delay: float):
+        """Check delay seconds from now whether the chat's raid mode has run out"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Without a loop the next in_raid() check ends raid mode instead
+            return
+        self.raid_timers[chat_id] = loop.call_later(max(delay, 0), self.check_raid, chat_id)
+
+    def check_raid(self, chat_id: int):
+        # Joins push raid_until back without touching the timer, so it re-arms for the remainder
+        self.raid_timers.pop(chat_id, None)
+        until = self.raid_until.get(chat_id)
+        if until is None:
+            return
+        remaining = until - time.monotonic()
+        if remaining > 0:
+            self.watch_raid(chat_id, remaining)
+        else:
+            self.finish_raid(chat_id)
+
+    def record_joins(self, chat_id: int, user_ids: List[int], message_id: Optional[int] = None,
+                     now: Optional[float] = None) -> bool:
+        """Count joins and return True if the chat is now in raid mode"""
+        now = time.monotonic() if now is None else now
+        policy = self.policies.get(chat_id, self.default_policy)
+        rate = self.rates.get(chat_id)
+        if rate is None:
+            self.evict_idle(now)
+            rate = self.rates[chat_id] = JoinRate(policy.window, policy.limit)
+        else:
+            self.rates.move_to_end(chat_id)
+        joins = rate.record(now, len(user_ids))
+
+        if self.in_raid(chat_id, now):
+            self.raid_until[chat_id] = max(self.raid_until[chat_id], now + policy.duration)
+            return True
+        if joins <= policy.limit:
+            rate.recent.extend((now, user_id, message_id) for user_id in user_ids)
+            return False
+
+        self.raid_until[chat_id] = now + policy.duration
+        self.watch_raid(chat_id, policy.duration)
+        RAIDS_DETECTED.inc()
+        logger.warning(f"🚨 Raid detected in chat {chat_id}: {joins} joins within {policy.window:.0f}s, raid mode on")
+        # The joins that tripped the threshold belong to the raid as well
+        batch = self.batches.setdefault(chat_id, RaidBatch(immediate=True))
+        for joined_at, user_id, earlier_message_id in rate.recent:
+            if now - joined_at <= policy.window:
+                batch.user_ids.append(user_id)
+                if earlier_message_id is not None:
+                    batch.message_ids.append(earlier_message_id)
+        rate.recent.clear()
+        return True
+
+    def evict_idle(self, now: float, budget: int = 2):
+        """Drop up to `budget` least recently joined chats whose window has passed"""
+        for _ in range(budget):
+            if not self.rates:
+                return
+            chat_id, rate = next(iter(self.rates.items()))
+            if len(self.rates) <= self.max_chats and now - rate.idle_since() < rate.width * JoinRate.BUCKETS:
+                return
+            del self.rates[chat_id]
+
+    # ====== LOCKDOWN ======
+
+    def enqueue(self, bot: Bot, chat_id: int, user_ids: List[int], message_id: Optional[int] = None):
+        """Add raiders to the chat's next batch, scheduling it if needed"""
+        batch = self.batches.setdefault(chat_id, RaidBatch())
+        batch.user_ids.extend(user_ids)
+        if message_id is not None:
+            batch.message_ids.append(message_id)
+        if batch.task is None:
+            batch.task = asyncio.get_running_loop().create_task(self.flush(bot, chat_id, batch))
+            self.tasks.add(batch.task)
+            batch.task.add_done_callback(self.tasks.discard)
+        if len(batch.user_ids) >= self.max_batch or len(batch.message_ids) >= MAX_DELETE_BATCH:
+            # A full batch takes no more joiners while its flush wakes up, they start the next one
+            del self.batches[chat_id]
+
+    async def flush(self, bot: Bot, chat_id: int, batch: RaidBatch):
+        """Wait for more raiders to pile up, then act on the whole batch"""
+        deadline = time.monotonic() + (0 if batch.immediate else self.batch_delay)
+        while (len(batch.user_ids) < self.max_batch and len(batch.message_ids) < MAX_DELETE_BATCH
+               and time.monotonic() < deadline):
+            await asyncio.sleep(min(0.05, self.batch_delay))
+        # Later joiners start the next batch
+        if self.batches.get(chat_id) is batch:
+            del self.batches[chat_id]
+
+        policy = self.policies.get(chat_id, self.default_policy)
+        user_ids = list(dict.fromkeys(batch.user_ids))
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def act(user_id: int):
+            async with limit:
+                await self.act(bot, chat_id, user_id, policy)
+
+        with priority(PRIORITY_DEFAULT):
+            await asyncio.gather(
+                *(act(user_id) for user_id in user_ids),
+                purger.purge(bot, chat_id, batch.message_ids),
+            )
+        self.actioned += len(user_ids)
+        logger.info(f"🛡️ Raid batch in chat {chat_id}: {policy.action} {len(user_ids)} members, "
+                    f"{len(batch.message_ids)} join messages deleted")
+
+    async def act(self, bot: Bot, chat_id: int, user_id: int, policy: RaidPolicy):
+        try:
+            if policy.action == 'restrict':
+                await bot.restrict_chat_member(
+                    chat_id, user_id, ChatPermissions.no_permissions(),
+                    until_date=int(time.time() + policy.duration)
+                )
+            else:
+                await bot.ban_chat_member(chat_id, user_id)
+                if policy.action == 'kick':
+                    await bot.unban_chat_member(chat_id, user_id, only_if_banned=True)
+            RAID_ACTIONS.labels(policy.action, 'ok').inc()
+        except TelegramError as e:
+            RAID_ACTIONS.labels(policy.action, 'failed').inc()
+            logger.debug(f"Raid {policy.action} of {user_id} in chat {chat_id} failed: {e}")
+
+    async def handle_joins(self, bot: Bot, chat_id: int, user_ids: List[int], message_id: Optional[int] = None,
+                           now: Optional[float] = None) -> bool:
+        """Record joins and, in raid mode, queue the joiners for lockdown. Returns True in raid mode"""
+        if not self.record_joins(chat_id, user_ids, message_id, now):
+            return False
+        self.enqueue(bot, chat_id, user_ids, message_id)
+        return True
+
+    async def handle_new_members(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Feed new_chat_members service messages into the detector"""
+        message = update.effective_message
+        if message is None or not message.new_chat_members:
+            return
+        user_ids = [user.id for user in message.new_chat_members if user.id != context.bot.id]
+        if user_ids:
+            await self.handle_joins(context.bot, message.chat_id, user_ids, message.message_id)
+
+    async def stop(self):
+        """Let queued batches finish"""
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for timer in self.raid_timers.values():
+            timer.cancel()
+        self.raid_timers.clear()
+
+
+# Global raid detector
+anti_raid = AntiRaid()
@@ -0,0 +1,77 @@
+"""Micro-benchmark for the antiflood engine.
+
+Feeds synthetic message streams through FloodControl.check and reports the
+per-message cost and the table size. Run from the repository root:
+
+    python -m benchmarks.bench_antiflood
+"""
+import random
+import time
+import tracemalloc
+
+from antiflood import FloodControl, FloodPolicy
+
+
+def stream_hot_chats(count, chats=50, users_per_chat=200):
+    """Busy groups with a stable set of active members"""
+    rng = random.Random(1)
+    now = 0.0
+    for _ in range(count):
+        now += 0.0005
+        yield -1000 - rng.randrange(chats), rng.randrange(users_per_chat), now
+
+
+def stream_many_senders(count, chats=5000):
+    """Millions of distinct senders across thousands of groups, each seen once or twice"""
+    rng = random.Random(2)
+    now = 0.0
+    for i in range(count):
+        now += 0.0001
+        yield -1000 - rng.randrange(chats), i // 2, now
+
+
+def stream_flooder(count):
+    """One spammer interleaved with normal traffic"""
+    rng = random.Random(3)
+    now = 0.0
+    for i in range(count):
+        now += 0.01
+        if i % 3 == 0:
+            yield -1, 42, now
+        else:
+            yield -1, rng.randrange(1000), now
+
+
+def feed(control, messages):
+    check = control.check
+    flagged = 0
+    for chat_id, user_id, now in messages:
+        if check(chat_id, user_id, now):
+            flagged += 1
+    return flagged
+
+
+def run(name, stream, count, max_entries=200_000):
+    messages = list(stream(count))
+
+    control = FloodControl(FloodPolicy(5, 10), max_entries=max_entries)
+    start_time = time.perf_counter()
+    flagged = feed(control, messages)
+    elapsed = time.perf_counter() - start_time
+
+    # Second pass under tracemalloc, which is too slow to time
+    tracemalloc.start()
+    feed(FloodControl(FloodPolicy(5, 10), max_entries=max_entries), messages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<16} {count:>9,} msgs  {elapsed / count * 1e6:6.2f} us/msg  "
+        f"entries={len(control):>7,}  peak={peak / 1024 / 1024:6.1f} MiB  flagged={flagged:,}"
+    )
+
+
+if __name__ == '__main__':
+    run('hot chats', stream_hot_chats, 1_000_000)
+    run('many senders', stream_many_senders, 2_000_000)
+    run('flooder', stream_flooder, 300_000)
@@ -0,0 +1,121 @@
+"""Replay a join raid against a local fake Bot API.
+
+Sends 1,000 joins into one group over 10 seconds through AntiRaid and
+reports how many joins it took to detect the raid, how long after that
+the raiders seen so far were locked down, when the last raider was
+handled and how many Bot API calls it all cost. A quiet group posts a
+message every 100ms meanwhile, to show the raid does not slow it down.
+Each of those claims is checked against a threshold at the end, and the
+run exits non-zero if one fails. Run from the repository root:
+
+    python -m benchmarks.bench_antiraid
+"""
+import asyncio
+import math
+import time
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from antiraid import AntiRaid, RaidPolicy
+from benchmarks.fake_bot_api import FakeBotAPI
+
+RAID_CHAT = -1001
+QUIET_CHAT = -1002
+JOINS = 1000
+DURATION = 10.0
+LATENCY = 0.02
+LIMIT = 10
+# Joins arrive at 100/s, so a one second batch fills one deleteMessages call
+BATCH_DELAY = 1.0
+
+
+async def quiet_chat(bot, stop, latencies):
+    while not stop.is_set():
+        start_time = time.perf_counter()
+        await bot.send_message(QUIET_CHAT, 'still here')
+        latencies.append(time.perf_counter() - start_time)
+        await asyncio.sleep(0.1)
+
+
+async def wait_for_lockdown(api, raiders):
+    """Time until the raiders seen at detection are all restricted"""
+    start_time = time.perf_counter()
+    while api.calls['restrictChatMember'] < raiders:
+        await asyncio.sleep(0.002)
+    return time.perf_counter() - start_time
+
+
+async def main():
+    api = FakeBotAPI(latency=LATENCY)
+    await api.start()
+    bot = Bot(api.token, base_url=api.base_url, request=HTTPXRequest(connection_pool_size=32))
+    await bot.initialize()
+    anti_raid = AntiRaid(RaidPolicy(limit=LIMIT, window=60, action='restrict', duration=600), batch_delay=BATCH_DELAY)
+
+    stop = asyncio.Event()
+    latencies = []
+    quiet = asyncio.create_task(quiet_chat(bot, stop, latencies))
+    await asyncio.sleep(0.5)
+    baseline = sorted(latencies)
+
+    detected_at = detected_after = None
+    start_time = time.perf_counter()
+    try:
+        for index in range(JOINS):
+            # Pace the joins evenly over DURATION, the way a join bot floods a group
+            delay = start_time + index * DURATION / JOINS - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            message_id = api.fill_chat(RAID_CHAT, 1)[0]
+            raid = await anti_raid.handle_joins(bot, RAID_CHAT, [100000 + index], message_id)
+            if raid and detected_at is None:
+                detected_at, detected_after = time.perf_counter(), index + 1
+                # The first batch covers everyone who joined up to detection
+                lockdown = asyncio.create_task(wait_for_lockdown(api, detected_after))
+
+        last_join = time.perf_counter()
+        await anti_raid.stop()
+        drained = time.perf_counter() - last_join
+    finally:
+        stop.set()
+        await quiet
+        await bot.shutdown()
+        await asyncio.sleep(0.1)
+        await api.stop()
+
+    raid_latencies = sorted(latencies[len(baseline):])
+    print(f"raid detected after {detected_after} joins, {detected_at - start_time:.2f}s into the raid")
+    print(f"first {detected_after} raiders restricted {lockdown.result() * 1000:.0f}ms after detection")
+    print(f"all {anti_raid.actioned:,} raiders handled {drained * 1000:.0f}ms after the last join")
+    print(
+        f"calls: {api.calls['restrictChatMember']:,} restrictChatMember, {api.calls['deleteMessages']:,} deleteMessages "
+        f"for {JOINS:,} join messages, {len(api.messages[RAID_CHAT]):,} left"
+    )
+    for name, values in (('quiet chat before', baseline), ('quiet chat during', raid_latencies)):
+        print(f"{name:<18} p50 {values[len(values) // 2] * 1000:6.1f}ms  max {values[-1] * 1000:6.1f}ms  ({len(values)} sends)")
+
+    # ====== CHECKS ======
+
+    quiet_before, quiet_during = baseline[len(baseline) // 2], raid_latencies[len(raid_latencies) // 2]
+    checks = [
+        (f"raid detected at join {LIMIT + 1}", detected_after == LIMIT + 1),
+        ("first raiders restricted within 0.5s of detection", lockdown.result() < 0.5),
+        (f"every raider actioned ({JOINS:,})",
+         anti_raid.actioned == JOINS and api.calls['restrictChatMember'] == JOINS),
+        (f"all raiders handled within {BATCH_DELAY + 1:.1f}s of the last join", drained < BATCH_DELAY + 1),
+        ("every join message deleted", not api.messages[RAID_CHAT]),
+        # The batch that tripped detection and the last partial batch add a call each
+        (f"about {JOINS // 100} deleteMessages calls (at most {math.ceil(JOINS / 100) + 2})",
+         math.ceil(JOINS / 100) <= api.calls['deleteMessages'] <= math.ceil(JOINS / 100) + 2),
+        ("quiet chat p50 within 1.5x + 5ms of its baseline", quiet_during <= quiet_before * 1.5 + 0.005),
+    ]
+    failed = [name for name, ok in checks if not ok]
+    for name, ok in checks:
+        print(f"{'ok' if ok else 'FAILED':<6} {name}")
+    if failed:
+        raise SystemExit(f"{len(failed)} of {len(checks)} checks failed")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,325 @@
+"""Drive a full TelegramBot with synthetic update streams against a local fake Bot API.
+
+Starts the real bot (setup, handlers, rate limiter, update scheduler,
+database in a temporary directory) pointed at FakeBotAPI through
+BOT_API_URL, then feeds updates straight into its update queue:
+
+    chat     ordinary group traffic, one message in ten a command
+    raid     a join raid on one group while other groups keep chatting
+    filters  groups with 500 filter triggers each, one message in twenty matches
+    fban     a federation ban fanned out to 2,000 chats under chat traffic
+
+For each scenario it reports throughput, p50 and p99 latency from an
+update entering the queue to its last blocking handler finishing, and
+the Bot API calls it caused per update (counted until the bot goes
+quiet, so deferred work like raid batches is included). The fake API
+answers after --latency seconds plus jitter and floods a --flood-rate
+share of calls with 429s. It runs on the same event loop as the bot, so
+its HTTP handling is part of the measured time. Run from the
+repository root:
+
+    python -m benchmarks.bench_bot
+    python -m benchmarks.bench_bot --scenarios chat,filters --updates 5000 --flood-rate 0
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+WORKDIR = tempfile.mkdtemp(prefix='bench-bot-')
+os.environ.update({
+    'BOT_TOKEN': '123456:fake-benchmark-token',
+    'DATABASE_URL': f'sqlite:///{WORKDIR}/bot.db',
+    'STATE_BACKEND': 'memory',
+    'LOG_LEVEL': 'WARNING',
+    'ENABLE_FILE_LOGGING': 'false',
+    'ENABLE_METRICS': 'false',
+    'ENABLE_HEALTH_CHECK': 'false',
+    'ENABLE_CAPTCHA': 'false',
+    'AUTO_BACKUP': 'false',
+    'USE_WEBHOOK': 'false',
+})
+
+from telegram import Update  # noqa: E402
+from telegram.ext import MessageHandler, TypeHandler, filters  # noqa: E402
+
+from benchmarks.fake_bot_api import BOT_USER, FakeBotAPI  # noqa: E402
+from bot import TelegramBot  # noqa: E402
+from config import Config  # noqa: E402
+from database.functions import add_filter, create_federation  # noqa: E402
+from database.models import close_db, db  # noqa: E402
+from federation_jobs import federation_jobs  # noqa: E402
+from matcher import TriggerMatcher  # noqa: E402
+
+SCENARIOS = ('chat', 'raid', 'filters', 'fban')
+# Runs after every other group, so it sees an update once its blocking handlers are done
+DONE_GROUP = 1000
+COMMANDS = ('/ping', '/start', '/help', '/stats', '/about')
+
+
+class UpdateFactory:
+    """Bot API update payloads with increasing ids"""
+
+    def __init__(self, seed: int = 0):
+        self.update_id = 0
+        self.message_id = 0
+        self.random = random.Random(seed)
+
+    def next_ids(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    def message(self, chat_id: int, user_id: int, text: str) -> dict:
+        update_id, message_id = self.next_ids()
+        message = {
+            'message_id': message_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': f'Group {chat_id}'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+
+    def join(self, chat_id: int, user_id: int) -> dict:
+        update_id, message_id = self.next_ids()
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'Joiner {user_id}'}
+        return {'update_id': update_id, 'message': {
+            'message_id': message_id, 'date': int(time.time()), 'new_chat_members': [user],
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': f'Group {chat_id}'}, 'from': user,
+        }}
+
+    def chatter(self, chat_ids, words) -> dict:
+        chat_id = self.random.choice(chat_ids)
+        user_id = self.random.randint(1000, 50000)
+        if self.random.random() < 0.1:
+            return self.message(chat_id, user_id, self.random.choice(COMMANDS))
+        text = ' '.join(self.random.choice(words) for _ in range(self.random.randint(3, 25)))
+        return self.message(chat_id, user_id, text)
+
+
+WORDS = [''.join(random.Random(index).choices('abcdefghijklmnopqrstuvwxyz', k=random.Random(index).randint(2, 9)))
+         for index in range(5000)]
+
+
+class FilterStandIn:
+    """Answers filter triggers the way a filters module would, there is none in this tree yet"""
+
+    def __init__(self):
+        self.matchers = {}
+        self.loading = {}
+
+    async def matcher(self, chat_id: int) -> TriggerMatcher:
+        matcher = self.matchers.get(chat_id)
+        if matcher is not None:
+            return matcher
+        # Concurrent first messages of a chat share one load instead of each running the query
+        loading = self.loading.get(chat_id)
+        if loading is None:
+            loading = self.loading[chat_id] = asyncio.get_running_loop().create_task(self.load(chat_id))
+            loading.add_done_callback(lambda _: self.loading.pop(chat_id, None))
+        return await asyncio.shield(loading)
+
+    async def load(self, chat_id: int) -> TriggerMatcher:
+        rows = await db.fetchall("SELECT keyword, reply FROM filters WHERE chat_id = ?", (chat_id,), 'bench_filters')
+        matcher = TriggerMatcher()
+        for keyword, reply in rows:
+            matcher.add_keyword((keyword, reply), keyword)
+        self.matchers[chat_id] = matcher
+        return matcher
+
+    async def handle(self, update: Update, context):
+        message = update.effective_message
+        if message is None or not message.text:
+            return
+        matches = (await self.matcher(message.chat_id)).scan(message.text)
+        if matches:
+            keyword, reply = min(matches, key=matches.get)
+            await message.reply_text(reply)
+
+
+class Harness:
+    def __init__(self, latency: float, jitter: float, flood_rate: float, rate_limit: bool):
+        self.api = FakeBotAPI(token=Config.TOKEN, latency=latency, jitter=jitter, flood_rate=flood_rate)
+        self.rate_limit = rate_limit
+        self.bot = TelegramBot()
+        self.factory = UpdateFactory()
+        self.enqueued = {}
+        self.latencies = []
+        self.done = 0
+        self.all_done = asyncio.Event()
+        self.expected = 0
+        self.filters = FilterStandIn()
+
+    async def start(self):
+        await self.api.start()
+        Config.BOT_API_URL = self.api.base_url
+        Config.GLOBAL_RATE_LIMIT_ENABLED = self.rate_limit
+        await self.bot.setup()
+        application = self.bot.application
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.filters.handle), group=10)
+        application.add_handler(TypeHandler(Update, self.record_done), group=DONE_GROUP)
+        await application.initialize()
+        await application.start()
+        await self.bot.start_jobs()
+
+    async def stop(self):
+        await self.bot.stop()
+        await close_db()
+        await asyncio.sleep(0.1)
+        await self.api.stop()
+
+    async def record_done(self, update: Update, context):
+        start = self.enqueued.pop(update.update_id, None)
+        if start is not None:
+            self.latencies.append(time.perf_counter() - start)
+            self.done += 1
+            if self.done >= self.expected:
+                self.all_done.set()
+
+    async def feed(self, updates, rate: float):
+        """Put updates on the bot's queue at `rate` per second, waiting when the queue is full"""
+        queue = self.bot.application.update_queue
+        bot = self.bot.application.bot
+        start = time.perf_counter()
+        for index, payload in enumerate(updates):
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = Update.de_json(payload, bot)
+            self.enqueued[update.update_id] = time.perf_counter()
+            await queue.put(update)
+
+    async def settle(self, quiet: float = 0.5, timeout: float = 60):
+        """Wait until the fake API has seen no calls for `quiet` seconds"""
+        deadline = time.monotonic() + timeout
+        last = sum(self.api.calls.values())
+        while time.monotonic() < deadline:
+            await asyncio.sleep(quiet)
+            calls = sum(self.api.calls.values())
+            if calls == last:
+                return
+            last = calls
+
+    async def run(self, name: str, updates: list, rate: float, during=None):
+        self.latencies = []
+        self.done = 0
+        self.expected = len(updates)
+        self.all_done.clear()
+        calls_before = Counter(self.api.calls)
+        floods_before = sum(self.api.floods.values())
+
+        start = time.perf_counter()
+        background = asyncio.create_task(during()) if during is not None else None
+        await self.feed(updates, rate)
+        await asyncio.wait_for(self.all_done.wait(), 120)
+        elapsed = time.perf_counter() - start
+        extra = await background if background is not None else None
+        await self.settle()
+
+        calls = Counter(self.api.calls)
+        calls.subtract(calls_before)
+        calls = +calls
+        latencies = sorted(self.latencies)
+        total_calls = sum(calls.values())
+        print(
+            f"{name:<8} {len(updates):>7,} {elapsed:>8.2f}s {len(updates) / elapsed:>8.0f}/s "
+            f"{latencies[len(latencies) // 2] * 1000:>8.1f}ms {latencies[int(len(latencies) * 0.99)] * 1000:>8.1f}ms "
+            f"{total_calls:>7,} {total_calls / len(updates):>9.2f} {sum(self.api.floods.values()) - floods_before:>5}"
+        )
+        print(f"{'':<8} calls: {', '.join(f'{method} {count:,}' for method, count in calls.most_common())}")
+        if extra:
+            print(f"{'':<8} {extra}")
+
+    # ====== SCENARIOS ======
+
+    async def scenario_chat(self, count: int):
+        chats = list(range(-1001000, -1001000 - 50, -1))
+        updates = [self.factory.chatter(chats, WORDS) for _ in range(count)]
+        await self.run('chat', updates, rate=1000)
+
+    async def scenario_raid(self, count: int):
+        raided = -1002000
+        chats = list(range(-1002001, -1002001 - 20, -1))
+        updates = []
+        for index in range(count):
+            if index % 4:
+                updates.append(self.factory.join(raided, 200000 + index))
+            else:
+                updates.append(self.factory.chatter(chats, WORDS))
+        await self.run('raid', updates, rate=400)
+
+    async def scenario_filters(self, count: int):
+        chats = list(range(-1003000, -1003000 - 10, -1))
+        rng = random.Random(1)
+        triggers = {}
+        for chat_id in chats:
+            # Two-word triggers, so ordinary chatter rarely matches one by chance
+            triggers[chat_id] = [f"{rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(500)]
+            for keyword in triggers[chat_id]:
+                await add_filter(chat_id, keyword, f"Filter reply for {keyword}")
+        updates = []
+        for _ in range(count):
+            update = self.factory.chatter(chats, WORDS)
+            message = update['message']
+            if 'entities' not in message and rng.random() < 0.05:
+                message['text'] += ' ' + rng.choice(triggers[message['chat']['id']])
+            updates.append(update)
+        await self.run('filters', updates, rate=1000)
+
+    async def scenario_fban(self, count: int, fed_chats: int = 2000):
+        fed_id = 'bench-fed'
+        chats = list(range(-1004000, -1004000 - 50, -1))
+        await create_federation(fed_id, 'Bench federation', BOT_USER['id'])
+
+        def join_all(connection):
+            with connection:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO federation_chats (fed_id, chat_id, joined_at) VALUES (?, ?, ?)",
+                    ((fed_id, -1005000 - index, time.time()) for index in range(fed_chats))
+                )
+
+        await db.write(join_all, 'bench_fed_chats')
+
+        async def fan_out():
+            start = time.perf_counter()
+            job = await federation_jobs.submit(fed_id, 'ban', 999999, 'bench', BOT_USER['id'])
+            while federation_jobs.get(job.job_id) is not None:
+                await asyncio.sleep(0.05)
+            return f"fban of 1 user across {fed_chats:,} chats took {time.perf_counter() - start:.2f}s ({job.done:,} done, {job.failed} failed)"
+
+        updates = [self.factory.chatter(chats, WORDS) for _ in range(count)]
+        await self.run('fban', updates, rate=500, during=fan_out)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument('--updates', type=int, default=2000, help='updates per scenario')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake Bot API latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='extra random latency, up to this many seconds')
+    parser.add_argument('--flood-rate', type=float, default=0.002, help='share of calls answered with a 429')
+    parser.add_argument('--rate-limit', action='store_true', help="keep the bot's global rate limiter on")
+    args = parser.parse_args()
+
+    harness = Harness(args.latency, args.jitter, args.flood_rate, args.rate_limit)
+    await harness.start()
+    try:
+        print(f"{'scenario':<8} {'updates':>7} {'time':>9} {'rate':>10} {'p50':>10} {'p99':>10} {'calls':>7} "
+              f"{'calls/upd':>9} {'429s':>5}")
+        for name in args.scenarios.split(','):
+            if name not in SCENARIOS:
+                raise SystemExit(f"Unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+            await getattr(harness, f'scenario_{name}')(args.updates)
+    finally:
+        await harness.stop()
+
+
+if __name__ == '__main__':
+    # Missing modules and the bot's startup lines would bury the table
+    logging.disable(logging.ERROR)
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Round-trip chats with 10,000 and 100,000 notes through export and import.
+
+Exports each chat to a compressed NDJSON file, imports it into an empty
+chat and checks every note arrived. Reports time, file size and the peak
+Python heap of each step, next to building the whole export as one JSON
+document in memory, which is what a naive /export does. The streaming
+peak stays flat as the chat grows. Run from the repository root:
+
+    python -m benchmarks.bench_export
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+WORKDIR = tempfile.mkdtemp(prefix='bench-export-')
+os.environ['DATABASE_URL'] = f'sqlite:///{WORKDIR}/bench.db'
+
+from database.export import export_data, import_data  # noqa: E402
+from database.models import close_db, db, init_db  # noqa: E402
+
+SIZES = (10000, 100000)
+NOTE = 'Read the rules before posting. Links to other groups get you warned, repeat offenders are banned. ' * 2
+
+
+def populate(connection, chat_id, count):
+    with connection:
+        connection.executemany(
+            "INSERT INTO notes (chat_id, name, content) VALUES (?, ?, ?)",
+            ((chat_id, f"note{index}", f"{NOTE}#{index}") for index in range(count))
+        )
+
+
+def naive_export(connection, chat_id):
+    """The whole chat in one JSON blob, the way an in-memory export builds it"""
+    rows = connection.execute("SELECT name, content FROM notes WHERE chat_id = ?", (chat_id,)).fetchall()
+    return gzip.compress(json.dumps({'notes': [{'name': name, 'content': content} for name, content in rows]}).encode())
+
+
+async def measure(coroutine_function):
+    """Run once for the wall time, then again under tracemalloc for the peak heap"""
+    start = time.perf_counter()
+    result = await coroutine_function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    await coroutine_function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+async def main():
+    await init_db()
+    try:
+        print(f"{'notes':>8}  {'step':<14}{'time':>9}{'peak heap':>12}{'file':>10}")
+        for source, count in enumerate(SIZES, start=1):
+            await db.write(lambda connection: populate(connection, source, count), 'bench_populate')
+            path = os.path.join(WORKDIR, f'chat{source}.ndjson.gz')
+            target = 1000 + source
+
+            blob, naive_time, naive_peak = await measure(
+                lambda: db.read(lambda connection: naive_export(connection, source), 'bench_naive'))
+            _, export_time, export_peak = await measure(lambda: export_data(path, source))
+
+            async def round_trip():
+                await db.execute("DELETE FROM notes WHERE chat_id = ?", (target,))
+                return await import_data(path, target)
+
+            counts, import_time, import_peak = await measure(round_trip)
+            imported = (await db.fetchone("SELECT COUNT(*) FROM notes WHERE chat_id = ?", (target,)))[0]
+            assert counts['notes'] == imported == count, (counts, imported)
+
+            for step, elapsed, peak, size in (
+                ('naive export', naive_time, naive_peak, len(blob)),
+                ('export', export_time, export_peak, os.path.getsize(path)),
+                ('import', import_time, import_peak, None),
+            ):
+                file_size = f"{size / 1024:8.0f}KB" if size is not None else ''
+                print(f"{count:>8,}  {step:<14}{elapsed:>8.2f}s{peak / 1048576:>10.1f}MB{file_size:>10}")
+    finally:
+        await close_db()
+
+
+if __name__ == '__main__':
+    # Keep the per-export log lines out of the table
+    logging.disable(logging.INFO)
+    asyncio.run(main())
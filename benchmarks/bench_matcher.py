@@ -0,0 +1,103 @@
+"""Benchmark the compiled trigger matcher against a per-trigger loop.
+
+Varies the number of triggers in a chat and the length of the incoming
+message. The naive baseline compiles one whole-word regex per trigger and
+searches them one after another, which is what a simple /filter
+implementation does. Run from the repository root:
+
+    python -m benchmarks.bench_matcher
+"""
+import random
+import re
+import string
+import time
+
+from matcher import TriggerMatcher
+
+WORDS = [''.join(random.Random(i).choices(string.ascii_lowercase, k=random.Random(i).randint(3, 9))) for i in range(20000)]
+
+
+def make_triggers(count, rng):
+    triggers = {}
+    for index in range(count):
+        if index % 20 == 0:
+            triggers[f"re{index}"] = ('regex', rf"{rng.choice(WORDS)}\d+")
+        elif index % 7 == 0:
+            triggers[f"kw{index}"] = ('keyword', f"{rng.choice(WORDS)} {rng.choice(WORDS)}")
+        else:
+            triggers[f"kw{index}"] = ('keyword', rng.choice(WORDS))
+    return triggers
+
+
+def make_messages(length, rng, count=200):
+    messages = []
+    for _ in range(count):
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(rng.choice(WORDS))
+        messages.append(' '.join(words)[:length])
+    return messages
+
+
+def build_naive(triggers):
+    compiled = []
+    for key, (kind, pattern) in triggers.items():
+        if kind == 'keyword':
+            compiled.append((key, re.compile(rf"(?<!\w){re.escape(pattern)}(?!\w)", re.IGNORECASE)))
+        else:
+            compiled.append((key, re.compile(pattern, re.IGNORECASE)))
+    return compiled
+
+
+def naive_match(compiled, text):
+    return [key for key, pattern in compiled if pattern.search(text)]
+
+
+def build_matcher(triggers):
+    matcher = TriggerMatcher()
+    for key, (kind, pattern) in triggers.items():
+        if kind == 'keyword':
+            matcher.add_keyword(key, pattern)
+        else:
+            matcher.add_regex(key, pattern)
+    return matcher
+
+
+def timed(function, messages, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for message in messages:
+            function(message)
+        best = min(best, time.perf_counter() - start_time)
+    return best / len(messages) * 1e6
+
+
+def main():
+    rng = random.Random(7)
+    print(f"{'triggers':>8} {'length':>6} {'naive us':>10} {'matcher us':>11} {'speedup':>8}")
+    for trigger_count in (10, 100, 500, 2000):
+        triggers = make_triggers(trigger_count, rng)
+        naive = build_naive(triggers)
+
+        start_time = time.perf_counter()
+        matcher = build_matcher(triggers)
+        matcher.match('warm up')
+        build_ms = (time.perf_counter() - start_time) * 1000
+
+        for length in (40, 400, 4000):
+            messages = make_messages(length, rng, count=200 if length < 4000 else 40)
+            naive_us = timed(lambda text: naive_match(naive, text), messages)
+            matcher_us = timed(matcher.match, messages)
+            print(f"{trigger_count:>8} {length:>6} {naive_us:>10.1f} {matcher_us:>11.1f} {naive_us / matcher_us:>7.1f}x")
+
+        # Incremental edit: add and remove one trigger, then rescan
+        start_time = time.perf_counter()
+        matcher.add_keyword('new', 'freshtrigger')
+        matcher.remove('new')
+        matcher.match('rebuild')
+        print(f"{'':>8} build {build_ms:.1f}ms, edit+rebuild {(time.perf_counter() - start_time) * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark for bulk purges against a local fake Bot API.
+
+Deletes the same message range one deleteMessage call at a time and with
+the Purger's deleteMessages batches, then purges an overlapping range to
+show already deleted ids being skipped. The fake API answers every call
+after a fixed latency, so the numbers show round trips, not Telegram's
+own limits. Run from the repository root:
+
+    python -m benchmarks.bench_purge
+"""
+import asyncio
+import time
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from purge import Purger
+
+CHAT_ID = -1001
+MESSAGES = 3000
+LATENCY = 0.02
+CONCURRENCY = 4
+
+
+async def purge_one_by_one(bot, message_ids, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def delete(message_id):
+        async with limit:
+            await bot.delete_message(CHAT_ID, message_id)
+
+    await asyncio.gather(*(delete(message_id) for message_id in message_ids))
+
+
+def report(name, api, elapsed, remaining):
+    calls = sum(api.calls[method] for method in ('deleteMessage', 'deleteMessages'))
+    print(f"{name:<22} {MESSAGES:>6,} msgs  {calls:>5,} calls  {elapsed:7.2f}s  {remaining:>5,} left")
+    api.calls.clear()
+
+
+async def main():
+    api = FakeBotAPI(latency=LATENCY)
+    await api.start()
+    # Enough connections that both approaches really have CONCURRENCY calls in flight
+    bot = Bot(api.token, base_url=api.base_url, request=HTTPXRequest(connection_pool_size=CONCURRENCY * 2))
+    await bot.initialize()
+    try:
+        message_ids = api.fill_chat(CHAT_ID, MESSAGES)
+        start_time = time.perf_counter()
+        await purge_one_by_one(bot, message_ids, CONCURRENCY)
+        report('deleteMessage', api, time.perf_counter() - start_time, len(api.messages[CHAT_ID]))
+
+        purger = Purger(concurrency=CONCURRENCY)
+        message_ids = api.fill_chat(CHAT_ID, MESSAGES)
+        start_time = time.perf_counter()
+        await purger.purge(bot, CHAT_ID, message_ids)
+        report('deleteMessages', api, time.perf_counter() - start_time, len(api.messages[CHAT_ID]))
+
+        # Half of this range was purged above, only the new half costs calls
+        overlap = range(message_ids[len(message_ids) // 2], message_ids[-1] + MESSAGES // 2 + 1)
+        api.fill_chat(CHAT_ID, MESSAGES // 2)
+        start_time = time.perf_counter()
+        result = await purger.purge(bot, CHAT_ID, overlap)
+        report(f'overlap ({result.skipped:,} known)', api, time.perf_counter() - start_time, len(api.messages[CHAT_ID]))
+    finally:
+        await bot.shutdown()
+        # Let the server notice the closed connections before the loop goes away
+        await asyncio.sleep(0.1)
+        await api.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,174 @@
+"""Local stand-in for the Telegram Bot API, for benchmarks.
+
+Serves the handful of methods the benchmarks call on http_server, with a
+per-call latency (plus up to `jitter` more), and counts calls per method.
+With flood_rate set, that share of calls is answered with a 429 and a
+retry_after of `retry_after` seconds, the way Telegram answers a bot that
+sends too fast. Point a Bot at it with base_url:
+
+    api = FakeBotAPI(latency=0.02)
+    await api.start()
+    bot = Bot(api.token, base_url=api.base_url)
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Set
+from urllib.parse import parse_qsl
+
+from http_server import HTTPRequest, HTTPResponse, HTTPServer
+
+TOKEN = '123456:fake-benchmark-token'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+def parse_parameters(request: HTTPRequest) -> Dict[str, Any]:
+    """Method parameters from a JSON or form body, form values are JSON-encoded by the client when not plain"""
+    if not request.body:
+        return {}
+    if request.headers.get('content-type', '').startswith('application/json'):
+        return json.loads(request.body)
+    parameters = {}
+    for name, value in parse_qsl(request.body.decode('utf-8')):
+        try:
+            parameters[name] = json.loads(value)
+        except ValueError:
+            parameters[name] = value
+    return parameters
+
+
+class FakeBotAPI:
+    """Bot API methods backed by in-memory chats"""
+
+    def __init__(self, token: str = TOKEN, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0,
+                 jitter: float = 0.0, flood_rate: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.floods: Counter = Counter()
+        # chat_id -> user ids reported as administrators, the bot is an admin everywhere
+        self.admins: Dict[int, Set[int]] = {}
+        # chat_id -> ids of messages that exist
+        self.messages: Dict[int, Set[int]] = {}
+        self.next_message_id: Dict[int, int] = {}
+        self.http = HTTPServer(host, port, name='fake bot api')
+        for method in ('getMe', 'sendMessage', 'editMessageText', 'deleteMessage', 'deleteMessages',
+                       'banChatMember', 'unbanChatMember', 'restrictChatMember', 'setMyCommands', 'getUpdates',
+                       'getChatMember', 'getChatAdministrators', 'answerCallbackQuery'):
+            self.http.route('POST', f'/bot{token}/{method}', self.handler(method))
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.http.host}:{self.http.port}/bot'
+
+    async def start(self):
+        await self.http.start()
+
+    async def stop(self):
+        await self.http.stop()
+
+    def fill_chat(self, chat_id: int, count: int) -> range:
+        """Pretend count messages were posted in a chat and return their ids"""
+        first = self.next_message_id.get(chat_id, 1)
+        ids = range(first, first + count)
+        self.messages.setdefault(chat_id, set()).update(ids)
+        self.next_message_id[chat_id] = first + count
+        return ids
+
+    def handler(self, method: str):
+        function = getattr(self, f'method_{method}')
+
+        async def handle(request: HTTPRequest) -> HTTPResponse:
+            self.calls[method] += 1
+            delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0)
+            if delay:
+                await asyncio.sleep(delay)
+            if self.flood_rate and method != 'getMe' and self.random.random() < self.flood_rate:
+                self.floods[method] += 1
+                body = {
+                    'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }
+                return HTTPResponse(429, json.dumps(body), content_type='application/json')
+            ok, result = function(parse_parameters(request))
+            body = {'ok': True, 'result': result} if ok else {'ok': False, 'error_code': 400, 'description': result}
+            return HTTPResponse(200 if ok else 400, json.dumps(body), content_type='application/json')
+        return handle
+
+    # ====== METHODS ======
+
+    def message(self, chat_id: int, message_id: int, text: str) -> Dict[str, Any]:
+        return {
+            'message_id': message_id, 'date': int(time.time()), 'text': text, 'from': BOT_USER,
+            'chat': {'id': chat_id, 'type': 'supergroup' if chat_id < 0 else 'private', 'title': 'Bench'},
+        }
+
+    def member(self, chat_id: int, user_id: int) -> Dict[str, Any]:
+        user = BOT_USER if user_id == BOT_USER['id'] else {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+        if user_id == BOT_USER['id'] or user_id in self.admins.get(chat_id, ()):
+            return {
+                'status': 'administrator', 'user': user, 'can_be_edited': False, 'is_anonymous': False,
+                'can_manage_chat': True, 'can_delete_messages': True, 'can_manage_video_chats': True,
+                'can_restrict_members': True, 'can_promote_members': True, 'can_change_info': True,
+                'can_invite_users': True, 'can_post_stories': True, 'can_edit_stories': True,
+                'can_delete_stories': True, 'can_pin_messages': True,
+            }
+        return {'status': 'member', 'user': user}
+
+    def method_getMe(self, parameters):
+        return True, BOT_USER
+
+    def method_sendMessage(self, parameters):
+        chat_id = int(parameters['chat_id'])
+        message_id = self.fill_chat(chat_id, 1)[0]
+        return True, self.message(chat_id, message_id, parameters.get('text', ''))
+
+    def method_editMessageText(self, parameters):
+        return True, self.message(int(parameters['chat_id']), int(parameters['message_id']), parameters.get('text', ''))
+
+    def method_deleteMessage(self, parameters):
+        messages = self.messages.get(int(parameters['chat_id']), set())
+        message_id = int(parameters['message_id'])
+        if message_id not in messages:
+            return False, 'Bad Request: message to delete not found'
+        messages.discard(message_id)
+        return True, True
+
+    def method_deleteMessages(self, parameters):
+        message_ids = parameters['message_ids']
+        if not 1 <= len(message_ids) <= 100:
+            return False, 'Bad Request: too many messages to delete'
+        # Missing messages are skipped, like the real API does
+        self.messages.get(int(parameters['chat_id']), set()).difference_update(message_ids)
+        return True, True
+
+    def method_banChatMember(self, parameters):
+        return True, True
+
+    def method_unbanChatMember(self, parameters):
+        return True, True
+
+    def method_restrictChatMember(self, parameters):
+        return True, True
+
+    def method_setMyCommands(self, parameters):
+        return True, True
+
+    def method_getUpdates(self, parameters):
+        return True, []
+
+    def method_getChatMember(self, parameters):
+        return True, self.member(int(parameters['chat_id']), int(parameters['user_id']))
+
+    def method_getChatAdministrators(self, parameters):
+        chat_id = int(parameters['chat_id'])
+        return True, [self.member(chat_id, user_id) for user_id in (BOT_USER['id'], *sorted(self.admins.get(chat_id, ())))]
+
+    def method_answerCallbackQuery(self, parameters):
+        return True, True
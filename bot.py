@@ -1,7 +1,7 @@
 import asyncio
 import logging
 from telegram import Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.ext import Application, BaseHandler, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, TypeHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 from config import Config
 from logging_config import setup_logging
@@ -9,40 +9,151 @@ from helpers.logger import get_logger
 from database.models import init_db
 from helpers.decorators import rate_limit
 from helpers.functions import extract_user_and_text, get_user_id
+from scheduler import AdmissionQueue, ChatOrderedUpdateProcessor
+from admin_cache import admin_cache
+from ratelimit import PriorityRateLimiter
+from metrics import MetricsServer, UPDATE_QUEUE_DEPTH, instrument_callback
+from health import HealthServer
+from state_store import init_state_store, close_state_store
+from federation_jobs import federation_jobs
+from captcha import captcha_pool
+from antiraid import anti_raid
+from welcome import set_welcome_command, welcome_command, welcome_pipeline
+from log_channel import log_channel
+from database.backup import backup_manager
+from profiler import profiler
+from decorators import sudo_only
+from webhook import WebhookServer
+import html
 import importlib
+import json
 import sys
+import time
 
 # Setup logging
 setup_logging()
 logger = get_logger(__name__)
 
+MODULE_NAMES = [
+    'modules.admin',
+    'modules.antiflood',
+    'modules.antiraid',
+    'modules.approval',
+    'modules.bans',
+    'modules.blocklists',
+    'modules.captcha',
+    'modules.clean_comma',
+    'modules.clean_service',
+    'modules.connections',
+    'modules.disabling',
+    'modules.federations',
+    'modules.filters',
+    'modules.formatting',
+    'modules.greetings',
+    'modules.import_export',
+    'modules.languages',
+    'modules.locks',
+    'modules.log_channels',
+    'modules.misc',
+    'modules.notes',
+    'modules.pin',
+    'modules.privacy',
+    'modules.purges',
+    'modules.reports',
+    'modules.rules',
+    'modules.topics'
+]
+
+class RetiredStub(BaseHandler):
+    """Takes a lazy stub's place when its loaded module has no handler to put there, never matches.
+
+    Removing the stub instead would change handler lists, and drop a group's
+    key from Application.handlers, while process_update may be iterating them.
+    """
+
+    def __init__(self):
+        super().__init__(self.ignore)
+
+    def check_update(self, update: object) -> bool:
+        return False
+
+    @staticmethod
+    async def ignore(update: object, context: ContextTypes.DEFAULT_TYPE):
+        pass
+
+
 class TelegramBot:
     def __init__(self):
         self.application = None
         self.modules = []
         self.commands = []
+        self.module_load_times = {}
+        self.lazy_modules = {}
+        self.lazy_handlers = {}
+        self.lazy_loading = {}
+        self.webhook_server = None
+        self.update_processor = None
+        self.rate_limiter = None
+        self.metrics_server = None
+        self.health_server = None
+        self.db_ready = False
+        self.is_setup = False
+        # Set by the supervisor when this bot runs as one of several worker processes
+        self.worker_index = None
+        self.worker_count = 1
+        self.stop_event = asyncio.Event()
 
     async def setup(self):
-        """Initialize bot and load modules"""
+        """Initialize bot and load modules, once"""
+        if self.is_setup:
+            return
         try:
-            # Create application
-            self.application = Application.builder().token(Config.TOKEN).build()
+            # Create application, the bounded update queue gives webhook and polling ingestion backpressure
+            self.update_processor = ChatOrderedUpdateProcessor(
+                Config.MAX_CONCURRENT_UPDATES, Config.MAX_PENDING_UPDATES
+            )
+            builder = (
+                Application.builder()
+                .token(Config.TOKEN)
+                .update_queue(AdmissionQueue(self.update_processor, maxsize=Config.UPDATE_QUEUE_MAX_SIZE))
+                .concurrent_updates(self.update_processor)
+            )
+            if Config.BOT_API_URL:
+                builder = builder.base_url(Config.BOT_API_URL)
+            # Always installed so Bot API calls are measured, throttling follows GLOBAL_RATE_LIMIT_ENABLED.
+            # Workers share the bot's global limit, chat limits need no split since each chat has one worker
+            self.rate_limiter = PriorityRateLimiter(
+                enabled=Config.GLOBAL_RATE_LIMIT_ENABLED,
+                rate=Config.GLOBAL_RATE_LIMIT_PER_SECOND / self.worker_count,
+                burst=Config.GLOBAL_RATE_LIMIT_BURST / self.worker_count,
+            )
+            self.application = builder.rate_limiter(self.rate_limiter).build()
+            UPDATE_QUEUE_DEPTH.set_function(
+                lambda: self.application.update_queue.qsize() + self.update_processor.queue_depth
+            )
 
             # Initialize database
             await init_db()
+            self.db_ready = True
             logger.info("Database initialized successfully")
 
+            # Connect the state shared between bot processes
+            await init_state_store()
+
             # Load all modules
             await self.load_modules()
 
             # Add basic handlers
+            known_handlers = self.handler_ids()
             self.add_basic_handlers()
+            self.instrument_handlers('core', known_handlers)
 
             # Add error handler
             self.application.add_error_handler(self.error_handler)
 
             # Set bot commands
             await self.set_bot_commands()
+            self.is_setup = True
 
         except Exception as e:
             logger.error(f"Failed to setup bot: {e}")
@@ -50,56 +161,203 @@ class TelegramBot:
 
     async def load_modules(self):
         """Load all command modules"""
-        module_names = [
-            'modules.admin',
-            'modules.antiflood',
-            'modules.antiraid',
-            'modules.approval',
-            'modules.bans',
-            'modules.blocklists',
-            'modules.captcha',
-            'modules.clean_comma',
-            'modules.clean_service',
-            'modules.connections',
-            'modules.disabling',
-            'modules.federations',
-            'modules.filters',
-            'modules.formatting',
-            'modules.greetings',
-            'modules.import_export',
-            'modules.languages',
-            'modules.locks',
-            'modules.log_channels',
-            'modules.misc',
-            'modules.notes',
-            'modules.pin',
-            'modules.privacy',
-            'modules.purges',
-            'modules.reports',
-            'modules.rules',
-            'modules.topics'
-        ]
+        manifest = self.load_module_manifest() if Config.LAZY_LOAD_MODULES else None
 
-        for module_name in module_names:
+        for module_name in MODULE_NAMES:
+            if manifest and module_name in manifest:
+                await self.register_lazy_module(module_name, manifest[module_name])
+            else:
+                await self.load_module(module_name)
+
+        if self.module_load_times:
+            slowest = sorted(self.module_load_times.items(), key=lambda item: item[1], reverse=True)[:5]
+            logger.info(
+                "⏱️ Slowest module imports: "
+                + ", ".join(f"{name} ({elapsed * 1000:.1f}ms)" for name, elapsed in slowest)
+            )
+
+    async def load_module(self, module_name: str):
+        """Import a module, register its handlers and record its import time"""
+        try:
+            # Import module
+            start_time = time.perf_counter()
+            module = importlib.import_module(module_name)
+            self.module_load_times[module_name] = time.perf_counter() - start_time
+
+            # Register handlers if module has the function
+            known_handlers = self.handler_ids()
+            if hasattr(module, 'register_handlers'):
+                module.register_handlers(self.application)
+            self.instrument_handlers(module_name, known_handlers)
+
+            # Collect commands for help
+            if hasattr(module, 'COMMANDS'):
+                self.commands.extend(module.COMMANDS)
+
+            self.modules.append(module)
+            logger.info(f"✅ Loaded module: {module_name} ({self.module_load_times[module_name] * 1000:.1f}ms)")
+            return module
+
+        except ImportError as e:
+            logger.error(f"❌ Module {module_name} not found: {e}")
+        except Exception as e:
+            logger.error(f"❌ Failed to load module {module_name}: {e}")
+        return None
+
+    def handler_ids(self) -> set:
+        """Ids of every handler currently registered"""
+        return {id(handler) for handlers in self.application.handlers.values() for handler in handlers}
+
+    def instrument_handlers(self, module_name: str, known_handlers: set) -> set:
+        """Time handlers registered since known_handlers was taken and return their ids"""
+        new_handlers = set()
+        for handlers in self.application.handlers.values():
+            for handler in handlers:
+                if id(handler) in known_handlers:
+                    continue
+                new_handlers.add(id(handler))
+                # Conversation handlers have no single callback to wrap
+                if Config.ENABLE_METRICS and callable(getattr(handler, 'callback', None)):
+                    handler.callback = instrument_callback(handler.callback, module_name)
+                if profiler.enabled and callable(getattr(handler, 'callback', None)):
+                    name = getattr(handler.callback, '__name__', 'callback')
+                    handler.callback = profiler.wrap_handler(handler.callback, f"{module_name}.{name}")
+        return new_handlers
+
+    def load_module_manifest(self):
+        """Read the prebuilt command manifest used for lazy module loading"""
+        try:
+            with open(Config.MODULE_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            return manifest.get('modules', {})
+        except FileNotFoundError:
+            logger.warning(
+                f"⚠️ Module manifest {Config.MODULE_MANIFEST_FILE} not found, loading all modules eagerly. "
+                f"Run devtools/build_manifest.py to generate it."
+            )
+        except Exception as e:
+            logger.error(f"❌ Failed to read module manifest: {e}")
+        return None
+
+    async def register_lazy_module(self, module_name: str, entry: dict):
+        """Register lightweight stubs that import the real module on first use"""
+        try:
+            stubs = [
+                (spec.get('group', 0), self.build_lazy_stub(spec, self.make_lazy_callback(module_name, spec.get('group', 0))))
+                for spec in entry.get('handlers', [])
+            ]
+        except Exception as e:
+            logger.error(f"❌ Invalid manifest entry for {module_name}: {e}, loading eagerly")
+            await self.load_module(module_name)
+            return
+
+        for group, handler in stubs:
+            self.application.add_handler(handler, group)
+
+        self.lazy_modules[module_name] = stubs
+        self.commands.extend(entry.get('help', []))
+        logger.info(f"💤 Deferred module: {module_name} ({len(stubs)} stubs)")
+
+    def make_lazy_callback(self, module_name: str, group: int):
+        """Create the callback used by a lazy stub handler"""
+        async def stub_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            await self.dispatch_lazy_update(module_name, group, update, context)
+        return stub_callback
+
+    def build_lazy_stub(self, spec: dict, callback):
+        """Build a stub handler mirroring one handler from the manifest"""
+        kind = spec.get('kind')
+        if kind == 'command':
+            return CommandHandler(spec['commands'], callback)
+        if kind == 'callback':
+            return CallbackQueryHandler(callback, pattern=spec.get('pattern'))
+        if kind == 'message':
+            return MessageHandler(self.resolve_manifest_filters(spec.get('filters')), callback)
+        # Unknown handler types match every update, so the module loads on first traffic
+        return TypeHandler(Update, callback)
+
+    @staticmethod
+    def resolve_manifest_filters(names):
+        """Turn manifest filter names like 'StatusUpdate.NEW_CHAT_MEMBERS' into a combined filter"""
+        combined = None
+        for name in names or []:
+            resolved = filters
+            for part in name.split('.'):
+                resolved = getattr(resolved, part, None)
+                if resolved is None:
+                    return filters.ALL
+            combined = resolved if combined is None else combined | resolved
+        return combined if combined is not None else filters.ALL
+
+    async def dispatch_lazy_update(self, module_name: str, group: int, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Load a deferred module and hand it the update that triggered the load"""
+        if await self.ensure_module_loaded(module_name) is None:
+            return
+
+        # The stub matched in this group, so dispatch to the module's first matching handler here.
+        # Later groups see the newly registered handlers as the application keeps iterating.
+        module_handlers = self.lazy_handlers.get(module_name, ())
+        for handler in self.application.handlers.get(group, []):
+            if id(handler) not in module_handlers:
+                continue
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                await handler.handle_update(update, self.application, check, context)
+                break
+
+    async def ensure_module_loaded(self, module_name: str):
+        """Import a deferred module exactly once, even if several updates race for it"""
+        pending = self.lazy_loading.get(module_name)
+        if pending is None:
+            pending = asyncio.get_running_loop().create_future()
+            self.lazy_loading[module_name] = pending
             try:
-                # Import module
-                module = importlib.import_module(module_name)
+                # Import off the event loop, handler registration stays on it
+                start_time = time.perf_counter()
+                module = await asyncio.to_thread(importlib.import_module, module_name)
+                self.module_load_times[module_name] = time.perf_counter() - start_time
 
-                # Register handlers if module has the function
+                known_handlers = self.handler_ids()
                 if hasattr(module, 'register_handlers'):
                     module.register_handlers(self.application)
-
-                # Collect commands for help
-                if hasattr(module, 'COMMANDS'):
-                    self.commands.extend(module.COMMANDS)
+                self.place_module_handlers(self.lazy_modules.pop(module_name, []), known_handlers)
+                self.lazy_handlers[module_name] = self.instrument_handlers(module_name, known_handlers)
 
                 self.modules.append(module)
-                logger.info(f"✅ Loaded module: {module_name}")
-
-            except ImportError as e:
-                logger.error(f"❌ Module {module_name} not found: {e}")
+                logger.info(f"✅ Lazily loaded module: {module_name} ({self.module_load_times[module_name] * 1000:.1f}ms)")
+                pending.set_result(module)
             except Exception as e:
-                logger.error(f"❌ Failed to load module {module_name}: {e}")
+                logger.error(f"❌ Failed to lazily load module {module_name}: {e}")
+                pending.set_result(None)
+        return await pending
+
+    def place_module_handlers(self, stubs: list, known_handlers: set):
+        """Move a loaded module's handlers from the end of their groups to where its stubs were.
+
+        This gives them the precedence eager loading would have. The first
+        stub of a group is replaced by the module's handlers for that group
+        (or a RetiredStub if it has none), further stubs by RetiredStubs.
+        Groups are rebuilt in place and only ever shift older handlers to
+        the right, so a dispatch iterating one meanwhile may check a
+        handler twice but never skips one.
+        """
+        stub_groups = {}
+        for group, stub in stubs:
+            stub_groups.setdefault(group, set()).add(id(stub))
+        for group, stub_ids in stub_groups.items():
+            handlers = self.application.handlers.get(group)
+            if handlers is None:
+                continue
+            loaded = [handler for handler in handlers if id(handler) not in known_handlers]
+            loaded_ids = {id(handler) for handler in loaded}
+            placed = []
+            for handler in handlers:
+                if id(handler) in stub_ids:
+                    placed.extend(loaded or [RetiredStub()])
+                    loaded = []
+                elif id(handler) not in loaded_ids:
+                    placed.append(handler)
+            handlers[:] = placed
 
     def add_basic_handlers(self):
         """Add basic bot handlers"""
@@ -260,16 +518,61 @@ class TelegramBot:
                 parse_mode=ParseMode.HTML
             )
 
+        # Profile command
+        @sudo_only
+        async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            """Handle /profile [seconds], sample the event loop and report the busiest handlers"""
+            try:
+                duration = float(context.args[0]) if context.args else profiler.default_duration
+            except ValueError:
+                await update.message.reply_text("Usage: /profile [seconds]")
+                return
+            if profiler.capturing is not None:
+                await update.message.reply_text("🔬 A profile is already being captured.")
+                return
+
+            await update.message.reply_text(f"🔬 Sampling the event loop for {min(duration, profiler.max_duration):g}s...")
+            path = await profiler.capture(duration)
+            table = html.escape('\n'.join(profiler.timing_table(limit=10)))
+            await update.message.reply_text(
+                f"🔬 <b>Profile written</b> to <code>{html.escape(path)}</code>\n\n<pre>{table}</pre>",
+                parse_mode=ParseMode.HTML
+            )
+
         # Register basic handlers
         self.application.add_handler(CommandHandler('start', start))
         self.application.add_handler(CommandHandler('help', help_command))
         self.application.add_handler(CommandHandler('about', about))
         self.application.add_handler(CommandHandler('stats', stats))
         self.application.add_handler(CommandHandler('ping', ping))
+        if profiler.enabled:
+            # Not blocking, so updates keep flowing while the loop is sampled
+            self.application.add_handler(CommandHandler('profile', profile, block=False))
 
         # Callback query handler for help menu
         self.application.add_handler(CallbackQueryHandler(self.handle_help_callback, pattern=r'^help_'))
 
+        # Keep the admin cache in sync with promotions and demotions, ahead of every module
+        self.application.add_handler(
+            ChatMemberHandler(admin_cache.handle_member_update, ChatMemberHandler.ANY_CHAT_MEMBER, block=False),
+            group=-1
+        )
+
+        # Count joins for raid detection before any module greets or challenges the new members.
+        # Only the first matching handler of a group runs, so raid counting and welcomes get a group each
+        if Config.ENABLE_ANTIRAID:
+            self.application.add_handler(
+                MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, anti_raid.handle_new_members, block=False),
+                group=-2
+            )
+        if Config.ENABLE_GREETINGS:
+            self.application.add_handler(
+                MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, welcome_pipeline.handle_new_members, block=False),
+                group=-1
+            )
+            self.application.add_handler(CommandHandler('welcome', welcome_command, filters.ChatType.GROUPS))
+            self.application.add_handler(CommandHandler('setwelcome', set_welcome_command, filters.ChatType.GROUPS))
+
     async def handle_help_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle help menu callbacks"""
         query = update.callback_query
@@ -489,11 +792,20 @@ class TelegramBot:
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors"""
-        logger.error(f"Update {update} caused error {context.error}")
+        # A summary instead of the whole Update, the traceback is formatted off the event loop
+        if isinstance(update, Update):
+            chat = update.effective_chat
+            user = update.effective_user
+            summary = (f"update {update.update_id} in chat {chat.id if chat else '-'} "
+                       f"from user {user.id if user else '-'}")
+        else:
+            summary = type(update).__name__
+        logger.error(f"❌ Error handling {summary}: {type(context.error).__name__}: {context.error}",
+                     exc_info=context.error)
 
         # Try to send error message to user
         try:
-            if update and update.effective_message:
+            if isinstance(update, Update) and update.effective_message:
                 await update.effective_message.reply_text(
                     "❌ An error occurred while processing your request. "
                     "Please try again later or contact support if the issue persists."
@@ -504,14 +816,96 @@ class TelegramBot:
     async def run(self):
         """Start the bot"""
         try:
+            # Up before setup so the orchestrator sees "not ready" instead of a refused connection
+            if Config.ENABLE_HEALTH_CHECK:
+                self.health_server = HealthServer(self)
+                await self.health_server.start()
+
             await self.setup()
+            await self.application.initialize()
+            await self.application.start()
+            await self.start_jobs()
+
+            if Config.ENABLE_METRICS:
+                self.metrics_server = MetricsServer(Config.METRICS_PORT)
+                await self.metrics_server.start()
+
+            if not (Config.USE_WEBHOOK and await self.start_webhook()):
+                await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                logger.info("📡 Receiving updates via long polling")
+
             logger.info("🚀 Bot started successfully!")
             logger.info(f"Bot username: @{(await self.application.bot.get_me()).username}")
-            await self.application.run_polling()
+            await self.stop_event.wait()
         except Exception as e:
             logger.error(f"Failed to start bot: {e}")
             raise
 
+    async def start_jobs(self):
+        """Start background work that calls the Bot API, once the application is running"""
+        await federation_jobs.start(self.application.bot, self.worker_index or 0, self.worker_count)
+        log_channel.start(self.application.bot)
+        if profiler.enabled:
+            profiler.install_signal_handler()
+        # Workers share one database file, the first one backs it up
+        if Config.AUTO_BACKUP and not self.worker_index:
+            backup_manager.start()
+        if Config.ENABLE_CAPTCHA:
+            captcha_pool.start()
+
+    async def start_webhook(self) -> bool:
+        """Start the webhook listener, returning False so the caller can fall back to polling"""
+        try:
+            self.webhook_server = WebhookServer.from_config(self.application)
+            await self.webhook_server.start()
+
+            certificate = None
+            if Config.WEBHOOK_SSL_CERT:
+                with open(Config.WEBHOOK_SSL_CERT, 'rb') as f:
+                    certificate = f.read()
+
+            await self.application.bot.set_webhook(
+                url=Config.WEBHOOK_URL,
+                certificate=certificate,
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=Config.WEBHOOK_SECRET_TOKEN,
+                max_connections=100,
+            )
+            logger.info(f"📡 Receiving updates via webhook on {Config.WEBHOOK_LISTEN}:{self.webhook_server.port}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to start webhook, falling back to polling: {e}")
+            if self.webhook_server is not None:
+                await self.webhook_server.stop()
+                self.webhook_server = None
+            return False
+
+    async def stop(self):
+        """Stop receiving updates and shut the application down"""
+        if self.webhook_server is not None:
+            await self.webhook_server.stop()
+            self.webhook_server = None
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+            self.metrics_server = None
+        if self.health_server is not None:
+            await self.health_server.stop()
+            self.health_server = None
+        if self.application.updater and self.application.updater.running:
+            await self.application.updater.stop()
+        await federation_jobs.stop()
+        await captcha_pool.stop()
+        await anti_raid.stop()
+        await welcome_pipeline.stop()
+        await backup_manager.stop()
+        if self.application.running:
+            await self.application.stop()
+        # Handlers may log until the application has stopped, the bot is still usable until shutdown
+        await log_channel.stop()
+        await self.application.shutdown()
+        await close_state_store()
+        self.stop_event.set()
+
 # Global bot instance
 bot = TelegramBot()
 
@@ -1 +1,217 @@
 # captcha.py - CAPTCHA verification
+import asyncio
+import hmac
+import multiprocessing
+import secrets
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, List, Optional
+from captcha_render import init_worker, render_challenges
+from config import Config
+from helpers.logger import get_logger
+from metrics import CAPTCHA_POOL_AVAILABLE, CAPTCHA_POOL_MISSES
+from state_store import get_state_store
+
+logger = get_logger(__name__)
+
+# verify() results
+SOLVED = 'solved'
+WRONG = 'wrong'
+FAILED = 'failed'
+EXPIRED = 'expired'
+
+
+class Challenge:
+    """A rendered challenge: the image (None for text challenges), the question and the button options"""
+
+    __slots__ = ('answer', 'image', 'question', 'options')
+
+    def __init__(self, answer: str, image: Optional[bytes], question: str, options: List[str]):
+        self.answer = answer
+        self.image = image
+        self.question = question
+        self.options = options
+
+
+# ====== POOL ======
+
+class CaptchaPool:
+    """Pre-rendered challenges, refilled in the background by a process pool.
+
+    Rendering an image takes milliseconds of CPU, which during a join raid
+    would stall the event loop for every chat. Challenges are rendered
+    ahead of time in worker processes instead: once fewer than
+    low_watermark are left, a refill renders batches of batch_size in
+    parallel until size are available again. take() only pops from the
+    pool; if a raid drains it, take() waits for the refill's next batch,
+    so a burst of misses costs a few batch renders instead of one worker
+    job each.
+    """
+
+    def __init__(self, size: int = Config.CAPTCHA_POOL_SIZE, low_watermark: int = Config.CAPTCHA_POOL_LOW_WATERMARK,
+                 workers: int = Config.CAPTCHA_RENDER_WORKERS, batch_size: int = 25):
+        self.size = max(size, 1)
+        self.low_watermark = min(low_watermark, self.size)
+        self.workers = max(workers, 1)
+        self.batch_size = max(batch_size, 1)
+        self.challenges: Deque[Challenge] = deque()
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.refilling: Optional[asyncio.Task] = None
+        self.rendered = 0
+        self.misses = 0
+        CAPTCHA_POOL_AVAILABLE.set_function(lambda: len(self.challenges))
+
+    def start(self):
+        """Start the worker processes and fill the pool"""
+        if self.executor is None:
+            # Spawn rather than fork, forking a process with a running event loop and open sockets is unsafe.
+            # Workers only import captcha_render, which pulls in nothing from the bot
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker
+            )
+            self.refill_soon()
+
+    async def stop(self):
+        if self.refilling is not None:
+            self.refilling.cancel()
+            try:
+                await self.refilling
+            except asyncio.CancelledError:
+                pass
+            self.refilling = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def render(self, count: int) -> List[Challenge]:
+        if self.executor is None:
+            self.start()
+        rendered = await asyncio.get_running_loop().run_in_executor(
+            self.executor, render_challenges, count, secrets.randbits(64)
+        )
+        self.rendered += len(rendered)
+        return [Challenge(*challenge) for challenge in rendered]
+
+    def refill_soon(self):
+        if ((len(self.challenges) < self.low_watermark or self.waiters)
+                and (self.refilling is None or self.refilling.done())):
+            self.refilling = asyncio.get_running_loop().create_task(self.refill())
+
+    async def refill(self):
+        """Render batches, one per worker at a time, until the pool is full and no take() is waiting"""
+        try:
+            while len(self.challenges) < self.size or self.waiters:
+                missing = self.size - len(self.challenges) + len(self.waiters)
+                counts = []
+                while missing > 0 and len(counts) < self.workers:
+                    counts.append(min(self.batch_size, missing))
+                    missing -= counts[-1]
+                for batch in await asyncio.gather(*(self.render(count) for count in counts)):
+                    self.add(batch)
+        except asyncio.CancelledError:
+            self.fail_waiters(None)
+            raise
+        except Exception as e:
+            logger.error(f"❌ CAPTCHA pool refill failed: {e}")
+            self.fail_waiters(e)
+
+    def add(self, batch: List[Challenge]):
+        """Hand fresh challenges to waiting take() calls first, pool the rest"""
+        for challenge in batch:
+            while self.waiters and self.waiters[0].done():
+                self.waiters.popleft()
+            if self.waiters:
+                self.waiters.popleft().set_result(challenge)
+            else:
+                self.challenges.append(challenge)
+
+    def fail_waiters(self, error: Optional[Exception]):
+        """Cancel the waiting take() calls, or fail them with error"""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.cancel()
+            else:
+                waiter.set_exception(error)
+
+    async def take(self) -> Challenge:
+        """A fresh challenge, from the pool when it has one"""
+        if self.challenges:
+            challenge = self.challenges.popleft()
+            self.refill_soon()
+            return challenge
+        self.misses += 1
+        CAPTCHA_POOL_MISSES.inc()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        if self.executor is None:
+            self.start()
+        self.refill_soon()
+        return await waiter
+
+    def __len__(self) -> int:
+        return len(self.challenges)
+
+
+# ====== VERIFICATION ======
+
+class CaptchaVerifier:
+    """Pending challenges by (chat, user) in the shared state store.
+
+    Each pending challenge is one key holding the expected answer, written
+    with a ttl of timeout seconds, so checking an answer is a single key
+    lookup and unsolved challenges expire on their own. Wrong answers are
+    counted in a second key; after max_attempts the challenge is failed.
+    Answers are compared in constant time.
+    """
+
+    def __init__(self, pool: CaptchaPool, timeout: int = Config.CAPTCHA_TIMEOUT,
+                 max_attempts: int = Config.CAPTCHA_MAX_ATTEMPTS):
+        self.pool = pool
+        self.timeout = timeout
+        self.max_attempts = max(max_attempts, 1)
+
+    @staticmethod
+    def key(chat_id: int, user_id: int) -> str:
+        return f"captcha:{chat_id}:{user_id}"
+
+    async def issue(self, chat_id: int, user_id: int) -> Challenge:
+        """Take a challenge for a user who just joined and remember its answer"""
+        challenge = await self.pool.take()
+        store = get_state_store()
+        key = self.key(chat_id, user_id)
+        await store.delete(key + ':attempts')
+        await store.set(key, challenge.answer, ttl=self.timeout)
+        return challenge
+
+    async def is_pending(self, chat_id: int, user_id: int) -> bool:
+        return await get_state_store().get(self.key(chat_id, user_id)) is not None
+
+    async def verify(self, chat_id: int, user_id: int, answer: str) -> str:
+        """Check an answer, returning SOLVED, WRONG, FAILED (out of attempts) or EXPIRED"""
+        store = get_state_store()
+        key = self.key(chat_id, user_id)
+        expected = await store.get(key)
+        if expected is None:
+            return EXPIRED
+        if hmac.compare_digest(answer.strip().upper().encode(), expected.encode()):
+            await store.delete(key, key + ':attempts')
+            return SOLVED
+        attempts = await store.incr(key + ':attempts', ttl=self.timeout)
+        if attempts >= self.max_attempts:
+            await store.delete(key, key + ':attempts')
+            return FAILED
+        return WRONG
+
+    async def cancel(self, chat_id: int, user_id: int):
+        """Forget a challenge, e.g. when the user left or an admin approved them"""
+        key = self.key(chat_id, user_id)
+        await get_state_store().delete(key, key + ':attempts')
+
+
+# Global CAPTCHA pool and verifier
+captcha_pool = CaptchaPool()
+captcha_verifier = CaptchaVerifier(captcha_pool)
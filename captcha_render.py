@@ -0,0 +1,84 @@
+# captcha_render.py - CAPTCHA rendering, run in the pool's worker processes
+# Imports nothing from the bot, so spawned render workers stay small
+import io
+import random
+import signal
+from typing import List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+except ImportError:
+    Image = None
+
+# No 0/O, 1/I or similar pairs that are hard to tell apart in a distorted image
+ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+ANSWER_LENGTH = 5
+OPTION_COUNT = 4
+
+
+def init_worker():
+    """Process pool initializer, Ctrl+C reaches the whole process group and the bot stops the pool itself"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def decoys(rng: random.Random, answer: str, count: int) -> List[str]:
+    """Wrong options that differ from the answer in one or two characters"""
+    options = {answer}
+    while len(options) < count + 1:
+        characters = list(answer)
+        for index in rng.sample(range(len(characters)), rng.randint(1, 2)):
+            characters[index] = rng.choice(ALPHABET)
+        options.add(''.join(characters))
+    options.discard(answer)
+    return list(options)[:count]
+
+
+def render_image(rng: random.Random, text: str) -> bytes:
+    """Draw text as rotated, jittered glyphs over noise and return PNG bytes"""
+    width, height = 40 * len(text) + 20, 80
+    image = Image.new('RGB', (width, height), tuple(rng.randint(220, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(8):
+        draw.line(
+            [(rng.randint(0, width), rng.randint(0, height)) for _ in range(2)],
+            fill=tuple(rng.randint(120, 200) for _ in range(3)), width=2
+        )
+    try:
+        font = ImageFont.load_default(size=44)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size default font
+        font = ImageFont.load_default()
+    for index, character in enumerate(text):
+        glyph = Image.new('RGBA', (56, 64), (0, 0, 0, 0))
+        ImageDraw.Draw(glyph).text((8, 4), character, font=font, fill=tuple(rng.randint(0, 90) for _ in range(3)))
+        glyph = glyph.rotate(rng.uniform(-30, 30), resample=Image.BICUBIC, expand=False)
+        image.paste(glyph, (10 + index * 40 + rng.randint(-4, 4), rng.randint(0, 14)), glyph)
+    for _ in range(width * height // 40):
+        draw.point((rng.randrange(width), rng.randrange(height)), fill=tuple(rng.randint(0, 160) for _ in range(3)))
+    image = image.filter(ImageFilter.SMOOTH)
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def render_challenge(rng: random.Random) -> Tuple[str, Optional[bytes], str, List[str]]:
+    if Image is None:
+        # Without Pillow fall back to arithmetic, which needs no rendering
+        first, second = rng.randint(2, 20), rng.randint(2, 20)
+        answer = str(first + second)
+        options = {answer}
+        while len(options) < OPTION_COUNT:
+            options.add(str(first + second + rng.choice((-3, -2, -1, 1, 2, 3))))
+        options = list(options)
+        rng.shuffle(options)
+        return answer, None, f"What is {first} + {second}?", options
+
+    answer = ''.join(rng.choice(ALPHABET) for _ in range(ANSWER_LENGTH))
+    options = [answer] + decoys(rng, answer, OPTION_COUNT - 1)
+    rng.shuffle(options)
+    return answer, render_image(rng, answer), "Tap the text shown in the image", options
+
+
+def render_challenges(count: int, seed: int) -> List[Tuple[str, Optional[bytes], str, List[str]]]:
+    """Render a batch in one round trip to the worker process"""
+    rng = random.Random(seed)
+    return [render_challenge(rng) for _ in range(count)]
@@ -15,6 +15,8 @@ class Config:
     BOT_USERNAME = os.getenv('BOT_USERNAME', '@YourBot')
     BOT_NAME = os.getenv('BOT_NAME', 'Advanced Telegram Bot')
     BOT_VERSION = os.getenv('BOT_VERSION', '2.0.0')
+    # A self-hosted Bot API server or a local stand-in, e.g. http://127.0.0.1:8081/bot
+    BOT_API_URL = os.getenv('BOT_API_URL')
     
     # ====== DATABASE CONFIGURATION ======
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///data/bot.db')
@@ -22,6 +24,8 @@ class Config:
     DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', '20'))
     DATABASE_POOL_TIMEOUT = int(os.getenv('DATABASE_POOL_TIMEOUT', '30'))
     DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', '3600'))
+    WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', '500'))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '1'))
     
     # ====== REDIS CONFIGURATION ======
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -29,6 +33,9 @@ class Config:
     REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
     REDIS_SOCKET_TIMEOUT = int(os.getenv('REDIS_SOCKET_TIMEOUT', '5'))
     REDIS_CONNECTION_POOL_MAX = int(os.getenv('REDIS_CONNECTION_POOL_MAX', '50'))
+    # auto: Redis when REDIS_URL answers, in-process otherwise; redis: fail without Redis; memory: never use Redis
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'auto').lower()
+    STATE_KEY_PREFIX = os.getenv('STATE_KEY_PREFIX', 'bot:')
     
     # ====== LOGGING CONFIGURATION ======
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -39,6 +46,12 @@ class Config:
     LOG_DATE_FORMAT = os.getenv('LOG_DATE_FORMAT', '%Y-%m-%d %H:%M:%S')
     ENABLE_FILE_LOGGING = os.getenv('ENABLE_FILE_LOGGING', 'true').lower() == 'true'
     ENABLE_CONSOLE_LOGGING = os.getenv('ENABLE_CONSOLE_LOGGING', 'true').lower() == 'true'
+    LOG_JSON = os.getenv('LOG_JSON', 'false').lower() == 'true'
+    # Records waiting for the writer thread, more are dropped instead of blocking the event loop
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    # At most LOG_DEDUP_BURST warnings or errors per call site every LOG_DEDUP_WINDOW seconds
+    LOG_DEDUP_WINDOW = float(os.getenv('LOG_DEDUP_WINDOW', '60'))
+    LOG_DEDUP_BURST = int(os.getenv('LOG_DEDUP_BURST', '5'))
     
     # ====== SECURITY CONFIGURATION ======
     RATE_LIMIT_PER_USER = int(os.getenv('RATE_LIMIT_PER_USER', '5'))
@@ -49,6 +62,8 @@ class Config:
     GLOBAL_RATE_LIMIT_ENABLED = os.getenv('GLOBAL_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
     GLOBAL_RATE_LIMIT_PER_SECOND = int(os.getenv('GLOBAL_RATE_LIMIT_PER_SECOND', '30'))
     GLOBAL_RATE_LIMIT_BURST = int(os.getenv('GLOBAL_RATE_LIMIT_BURST', '10'))
+    CHAT_RATE_LIMIT_PER_MINUTE = int(os.getenv('CHAT_RATE_LIMIT_PER_MINUTE', '20'))
+    PRIVATE_RATE_LIMIT_PER_SECOND = int(os.getenv('PRIVATE_RATE_LIMIT_PER_SECOND', '1'))
     
     # Security features
     ENABLE_SECURITY_LOGS = os.getenv('ENABLE_SECURITY_LOGS', 'true').lower() == 'true'
@@ -83,8 +98,7 @@ class Config:
     if os.getenv('BLACKLIST_USERS'):
         try:
             BLACKLIST_USERS = [int(x.strip()) for x in os.getenv('BLACKLIST_USERS').split(',') if x.strip()]
-
-except ValueError:
+        except ValueError:
             BLACKLIST_USERS = []
     
     # ====== FEATURE FLAGS ======
@@ -129,6 +143,8 @@ except ValueError:
     WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
     WEBHOOK_SSL_CERT = os.getenv('WEBHOOK_SSL_CERT')
     WEBHOOK_SSL_PRIV = os.getenv('WEBHOOK_SSL_PRIV')
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+    WEBHOOK_QUEUE_TIMEOUT = float(os.getenv('WEBHOOK_QUEUE_TIMEOUT', '5'))
     
     # ====== DEFAULT SETTINGS ======
     DEFAULT_WARN_LIMIT = int(os.getenv('DEFAULT_WARN_LIMIT', '3'))
@@ -137,6 +153,10 @@ except ValueError:
     DEFAULT_FLOOD_TIME = int(os.getenv('DEFAULT_FLOOD_TIME', '10'))
     DEFAULT_RAID_LIMIT = int(os.getenv('DEFAULT_RAID_LIMIT', '10'))
     DEFAULT_RAID_TIME = int(os.getenv('DEFAULT_RAID_TIME', '60'))
+    DEFAULT_RAID_ACTION = os.getenv('DEFAULT_RAID_ACTION', 'restrict')
+    RAID_MODE_DURATION = int(os.getenv('RAID_MODE_DURATION', '600'))
+    RAID_BATCH_DELAY = float(os.getenv('RAID_BATCH_DELAY', '0.5'))
+    RAID_ACTION_CONCURRENCY = int(os.getenv('RAID_ACTION_CONCURRENCY', '10'))
     DEFAULT_LANGUAGE = os.getenv('DEFAULT_LANGUAGE', 'en')
     
     # Chat settings
@@ -144,12 +164,29 @@ except ValueError:
     LOG_ALL_COMMANDS = os.getenv('LOG_ALL_COMMANDS', 'true').lower() == 'true'
     CLEAN_SERVICE_MESSAGES = os.getenv('CLEAN_SERVICE_MESSAGES', 'true').lower() == 'true'
     
+    # Log channels, events are posted as digests every LOG_CHANNEL_FLUSH_INTERVAL seconds, urgent types at once
+    LOG_CHANNEL_FLUSH_INTERVAL = float(os.getenv('LOG_CHANNEL_FLUSH_INTERVAL', '5'))
+    LOG_CHANNEL_URGENT_EVENTS = [x.strip() for x in os.getenv('LOG_CHANNEL_URGENT_EVENTS', 'ban,fban,raid,report').split(',') if x.strip()]
+    # How long shutdown keeps retrying log posts that fail, the rest is written to the bot log
+    LOG_CHANNEL_STOP_TIMEOUT = float(os.getenv('LOG_CHANNEL_STOP_TIMEOUT', '15'))
+    
+    # Welcomes, joins within WELCOME_DEBOUNCE seconds are greeted together in one message
+    DEFAULT_WELCOME_MESSAGE = os.getenv('DEFAULT_WELCOME_MESSAGE', 'Hey {mention}, welcome to {chatname}!')
+    WELCOME_DEBOUNCE = float(os.getenv('WELCOME_DEBOUNCE', '3'))
+    WELCOME_MAX_MENTIONS = int(os.getenv('WELCOME_MAX_MENTIONS', '20'))
+    
+    # CAPTCHA, challenges are pre-rendered in CAPTCHA_RENDER_WORKERS processes and refilled below the low watermark
+    CAPTCHA_TIMEOUT = int(os.getenv('CAPTCHA_TIMEOUT', '300'))
+    CAPTCHA_MAX_ATTEMPTS = int(os.getenv('CAPTCHA_MAX_ATTEMPTS', '3'))
+    CAPTCHA_POOL_SIZE = int(os.getenv('CAPTCHA_POOL_SIZE', '200'))
+    CAPTCHA_POOL_LOW_WATERMARK = int(os.getenv('CAPTCHA_POOL_LOW_WATERMARK', '50'))
+    CAPTCHA_RENDER_WORKERS = int(os.getenv('CAPTCHA_RENDER_WORKERS', '2'))
+    
     # ====== FILE HANDLING ======
     MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', '52428800'))  # 50MB
     MAX_PHOTO_SIZE = int(os.getenv('MAX_PHOTO_SIZE', '10485760'))  # 10MB
     MAX_VIDEO_SIZE = int(os.getenv('MAX_VIDEO_SIZE', '52428800'))  # 50MB
-
-MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
+    MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
     MAX_VOICE_SIZE = int(os.getenv('MAX_VOICE_SIZE', '20971520'))  # 20MB
     MAX_DOCUMENT_SIZE = int(os.getenv('MAX_DOCUMENT_SIZE', '52428800'))  # 50MB
     
@@ -162,6 +199,9 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
     TEMP_DIR = os.getenv('TEMP_DIR', 'temp')
     BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
     
+    # Imports are written IMPORT_CHUNK_SIZE rows per transaction
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+    
     # ====== CACHE SETTINGS ======
     CACHE_TTL = int(os.getenv('CACHE_TTL', '3600'))  # 1 hour
     USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '1800'))  # 30 minutes
@@ -170,21 +210,40 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
     
     # ====== PERFORMANCE SETTINGS ======
     MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '256'))
+    # Updates taken off the update queue and not yet finished, beyond this the queue fills up
+    MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', str(MAX_CONCURRENT_UPDATES * 4)))
     CONNECTION_POOL_SIZE = int(os.getenv('CONNECTION_POOL_SIZE', '8'))
     READ_TIMEOUT = int(os.getenv('READ_TIMEOUT', '6'))
     WRITE_TIMEOUT = int(os.getenv('WRITE_TIMEOUT', '7'))
     CONNECT_TIMEOUT = int(os.getenv('CONNECT_TIMEOUT', '7'))
     POOL_TIMEOUT = int(os.getenv('POOL_TIMEOUT', '1'))
+    UPDATE_QUEUE_MAX_SIZE = int(os.getenv('UPDATE_QUEUE_MAX_SIZE', '1000'))
+    # More than 1 runs a supervisor that shards updates by chat over this many worker processes
+    WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))
+    # Federation bans and unbans fan out to every chat of the federation in the background
+    FED_BAN_CONCURRENCY = int(os.getenv('FED_BAN_CONCURRENCY', '8'))
+    FED_JOB_PAGE_SIZE = int(os.getenv('FED_JOB_PAGE_SIZE', '200'))
+    FED_MAX_RUNNING_JOBS = int(os.getenv('FED_MAX_RUNNING_JOBS', '2'))
+    # Purges delete in batches of 100 messages with this many batches in flight
+    PURGE_CONCURRENCY = int(os.getenv('PURGE_CONCURRENCY', '4'))
+    PURGE_STATUS_INTERVAL = float(os.getenv('PURGE_STATUS_INTERVAL', '3'))
+    
+    # Module loading
+    LAZY_LOAD_MODULES = os.getenv('LAZY_LOAD_MODULES', 'false').lower() == 'true'
+    MODULE_MANIFEST_FILE = os.getenv('MODULE_MANIFEST_FILE', 'module_manifest.json')
     
     # ====== MONITORING SETTINGS ======
     ENABLE_METRICS = os.getenv('ENABLE_METRICS', 'true').lower() == 'true'
     METRICS_PORT = int(os.getenv('METRICS_PORT', '8080'))
     ENABLE_HEALTH_CHECK = os.getenv('ENABLE_HEALTH_CHECK', 'true').lower() == 'true'
     HEALTH_CHECK_PORT = int(os.getenv('HEALTH_CHECK_PORT', '8081'))
+    HEALTH_MAX_QUEUE_DEPTH = int(os.getenv('HEALTH_MAX_QUEUE_DEPTH', '500'))
+    HEALTH_MAX_API_SILENCE = int(os.getenv('HEALTH_MAX_API_SILENCE', '120'))
     
     # Statistics collection
     COLLECT_STATS = os.getenv('COLLECT_STATS', 'true').lower() == 'true'
     STATS_RETENTION_DAYS = int(os.getenv('STATS_RETENTION_DAYS', '30'))
+    STATS_RECONCILE_INTERVAL = int(os.getenv('STATS_RECONCILE_INTERVAL', '3600'))
     
     # ====== BACKUP SETTINGS ======
     AUTO_BACKUP = os.getenv('AUTO_BACKUP', 'true').lower() == 'true'
@@ -192,12 +251,21 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
     MAX_BACKUP_FILES = int(os.getenv('MAX_BACKUP_FILES', '7'))
     BACKUP_ENCRYPTION = os.getenv('BACKUP_ENCRYPTION', 'false').lower() == 'true'
     BACKUP_ENCRYPTION_KEY = os.getenv('BACKUP_ENCRYPTION_KEY')
+    # Every BACKUP_FULL_EVERY-th backup is full, the ones between hold only the pages that changed
+    BACKUP_FULL_EVERY = int(os.getenv('BACKUP_FULL_EVERY', '7'))
+    BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '256'))
+    BACKUP_STEP_PAUSE = float(os.getenv('BACKUP_STEP_PAUSE', '0.005'))
     
     # ====== DEVELOPMENT SETTINGS ======
     DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
     TESTING = os.getenv('TESTING', 'false').lower() == 'true'
     DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
     ENABLE_PROFILING = os.getenv('ENABLE_PROFILING', 'false').lower() == 'true'
+    # /profile and SIGUSR2 sample the event loop every PROFILE_SAMPLE_INTERVAL seconds into PROFILE_DIR
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'logs')
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    PROFILE_DURATION = float(os.getenv('PROFILE_DURATION', '30'))
+    PROFILE_MAX_DURATION = float(os.getenv('PROFILE_MAX_DURATION', '300'))
     
     # ====== LOCALIZATION ======
     SUPPORTED_LANGUAGES = os.getenv('SUPPORTED_LANGUAGES', 'en,hi,es,fr,de,ru,ar,zh').split(',')
@@ -228,8 +296,7 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
         
         # Validate numeric settings
         numeric_settings = [
-
-('RATE_LIMIT_PER_USER', cls.RATE_LIMIT_PER_USER, 1, 100),
+            ('RATE_LIMIT_PER_USER', cls.RATE_LIMIT_PER_USER, 1, 100),
             ('RATE_LIMIT_WINDOW', cls.RATE_LIMIT_WINDOW, 1, 3600),
             ('DEFAULT_WARN_LIMIT', cls.DEFAULT_WARN_LIMIT, 1, 20),
             ('DEFAULT_FLOOD_LIMIT', cls.DEFAULT_FLOOD_LIMIT, 1, 100),
@@ -242,11 +309,20 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
             if not min_val <= value <= max_val:
                 errors.append(f"{setting_name} must be between {min_val} and {max_val}")
         
+        if cls.CAPTCHA_POOL_LOW_WATERMARK >= cls.CAPTCHA_POOL_SIZE:
+            errors.append("CAPTCHA_POOL_LOW_WATERMARK must be below CAPTCHA_POOL_SIZE")
+        
         # Validate warn action
         valid_warn_actions = ['kick', 'ban', 'mute', 'nothing']
         if cls.DEFAULT_WARN_ACTION not in valid_warn_actions:
             errors.append(f"DEFAULT_WARN_ACTION must be one of: {', '.join(valid_warn_actions)}")
         
+        if cls.BACKUP_ENCRYPTION and not cls.BACKUP_ENCRYPTION_KEY:
+            errors.append("BACKUP_ENCRYPTION_KEY is required when BACKUP_ENCRYPTION is enabled")
+        
+        if cls.DEFAULT_RAID_ACTION not in ('restrict', 'ban', 'kick'):
+            errors.append("DEFAULT_RAID_ACTION must be one of: restrict, ban, kick")
+        
         # Validate language
         if cls.DEFAULT_LANGUAGE not in cls.SUPPORTED_LANGUAGES:
             errors.append(f"DEFAULT_LANGUAGE must be one of: {', '.join(cls.SUPPORTED_LANGUAGES)}")
@@ -261,7 +337,7 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
         # Log errors and return result
         if errors:
             from helpers.logger import get_logger
-            logger = get_logger(name)
+            logger = get_logger(__name__)
             logger.error("Configuration validation failed:")
             for error in errors:
                 logger.error(f"  - {error}")
@@ -285,7 +361,7 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
                         
         except Exception as e:
             from helpers.logger import get_logger
-            logger = get_logger(name)
+            logger = get_logger(__name__)
             logger.error(f"Failed to load config from file {config_file}: {e}")
     
     @classmethod
@@ -309,7 +385,7 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
                 
         except Exception as e:
             from helpers.logger import get_logger
-            logger = get_logger(name)
+            logger = get_logger(__name__)
             logger.error(f"Failed to save config to file {config_file}: {e}")
     
     @classmethod
@@ -317,8 +393,7 @@ MAX_AUDIO_SIZE = int(os.getenv('MAX_AUDIO_SIZE', '52428800'))  # 50MB
         """Get configuration summary for logging"""
         return {
             'bot_name': cls.BOT_NAME,
-
-'bot_version': cls.BOT_VERSION,
+            'bot_version': cls.BOT_VERSION,
             'database_type': cls.DATABASE_URL.split('://')[0] if cls.DATABASE_URL else 'unknown',
             'redis_enabled': bool(cls.REDIS_URL),
             'webhook_enabled': cls.USE_WEBHOOK,
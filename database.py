@@ -1 +0,0 @@
-# database.py - Database models and connection
@@ -0,0 +1 @@
+# database package init
@@ -0,0 +1,402 @@
+# database/backup.py - Scheduled online backups with page-level deltas
+import asyncio
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from config import Config
+from database.models import db
+from helpers.logger import get_logger
+from metrics import BACKUP_LAST_SUCCESS, BACKUPS
+
+try:
+    from cryptography.fernet import Fernet
+except ImportError:
+    Fernet = None
+
+logger = get_logger(__name__)
+
+FULL = 'full'
+DELTA = 'delta'
+BACKUP_FILE = re.compile(r'^backup-(\d{8}-\d{6}-\d{6})-(full|delta)\.db\.gz(\.enc)?$')
+DELTA_MAGIC = b'PRBDELT1'
+DIGEST_SIZE = 16
+# Plaintext per Fernet token, encrypted backups are written and read this much at a time
+ENCRYPTION_CHUNK = 1 << 20
+READ_CHUNK = 1 << 16
+
+
+class EncryptedWriter:
+    """File wrapper that encrypts what is written in length-prefixed Fernet tokens"""
+
+    def __init__(self, fileobj: BinaryIO, fernet: 'Fernet'):
+        self.fileobj = fileobj
+        self.fernet = fernet
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        while len(self.buffer) >= ENCRYPTION_CHUNK:
+            self.write_token(bytes(self.buffer[:ENCRYPTION_CHUNK]))
+            del self.buffer[:ENCRYPTION_CHUNK]
+        return len(data)
+
+    def write_token(self, plaintext: bytes):
+        token = self.fernet.encrypt(plaintext)
+        self.fileobj.write(struct.pack('>I', len(token)) + token)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer:
+            self.write_token(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def read_plain(path: str, fernet: Optional['Fernet']) -> Iterator[bytes]:
+    """Decrypt and decompress a backup file, yielding its content a chunk at a time"""
+    decompressor = zlib.decompressobj(wbits=31)
+    with open(path, 'rb') as fileobj:
+        while True:
+            if path.endswith('.enc'):
+                if fernet is None:
+                    raise RuntimeError(f"{path} is encrypted and no BACKUP_ENCRYPTION_KEY is available")
+                prefix = fileobj.read(4)
+                if not prefix:
+                    break
+                compressed = fernet.decrypt(fileobj.read(struct.unpack('>I', prefix)[0]))
+            else:
+                compressed = fileobj.read(READ_CHUNK)
+                if not compressed:
+                    break
+            yield decompressor.decompress(compressed)
+    yield decompressor.flush()
+
+
+def page_digests(path: str, page_size: int) -> Iterator[Tuple[int, bytes, bytes]]:
+    """Yield (page number, digest, page) for every page of a database file"""
+    with open(path, 'rb') as fileobj:
+        number = 0
+        while True:
+            page = fileobj.read(page_size)
+            if not page:
+                return
+            yield number, hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest(), page
+            number += 1
+
+
+class BackupManager:
+    """Online backups of the SQLite database, written every interval hours.
+
+    A backup first copies the live database to a snapshot file with
+    SQLite's online-backup API, pages_per_step pages at a time with a
+    short pause between steps. The copy runs in a worker thread on its own
+    read-only connection, inside one read transaction, so it captures a
+    single consistent state and the bot's writers never wait on it.
+
+    The snapshot is then packed in a worker thread. Every page is hashed
+    and compared with the hashes of the previous backup, and only the
+    changed pages are written, as a delta. Every full_every-th backup, or
+    when there are no previous hashes, the whole file is written as a full
+    backup instead. Files are gzip-compressed and, with an encryption key,
+    encrypted with Fernet. Whole chains (a full backup and its deltas) are
+    pruned, oldest first, down to max_files, always keeping the newest
+    chain. restore() rebuilds a database file from a chain.
+    """
+
+    def __init__(self, directory: str = Config.BACKUP_DIR, interval_hours: float = Config.BACKUP_INTERVAL_HOURS,
+                 max_files: int = Config.MAX_BACKUP_FILES, full_every: int = Config.BACKUP_FULL_EVERY,
+                 encryption_key: Optional[str] = Config.BACKUP_ENCRYPTION_KEY if Config.BACKUP_ENCRYPTION else None,
+                 pages_per_step: int = Config.BACKUP_PAGES_PER_STEP, step_pause: float = Config.BACKUP_STEP_PAUSE):
+        self.directory = directory
+        self.interval = interval_hours * 3600
+        self.max_files = max(max_files, 1)
+        self.full_every = max(full_every, 1)
+        self.encryption_key = encryption_key
+        self.pages_per_step = max(pages_per_step, 1)
+        self.step_pause = step_pause
+        self.task: Optional[asyncio.Task] = None
+        self.current: Optional[asyncio.Task] = None
+        self.last_attempt = 0.0
+
+    @property
+    def hashes_path(self) -> str:
+        return os.path.join(self.directory, '.pages')
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, '.snapshot.db')
+
+    def fernet(self) -> Optional['Fernet']:
+        if not self.encryption_key:
+            return None
+        if Fernet is None:
+            raise RuntimeError("Backup encryption needs the cryptography package")
+        return Fernet(self.encryption_key.encode())
+
+    def backups(self) -> List[Tuple[str, str]]:
+        """(file name, kind) of every backup in the directory, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            match = BACKUP_FILE.match(name)
+            if match:
+                found.append((match.group(1), name, match.group(2)))
+        return [(name, kind) for _, name, kind in sorted(found)]
+
+    @staticmethod
+    def kind(name: str) -> str:
+        return BACKUP_FILE.match(name).group(2)
+
+    def chains(self) -> List[List[str]]:
+        """Backups grouped into a full backup followed by its deltas, deltas without a full are their own chain"""
+        chains: List[List[str]] = []
+        for name, kind in self.backups():
+            if kind == FULL or not chains:
+                chains.append([name])
+            else:
+                chains[-1].append(name)
+        return chains
+
+    # ====== SNAPSHOT AND PACKING ======
+
+    def snapshot(self, source_path: str) -> int:
+        """Copy the live database to the snapshot file with the online-backup API, returns the page size"""
+        if os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+        source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+        target = sqlite3.connect(self.snapshot_path)
+        try:
+            # Every step reads from this transaction's snapshot, so writes made meanwhile never restart the copy
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(
+                target, pages=self.pages_per_step,
+                progress=lambda status, remaining, total: time.sleep(self.step_pause) if remaining else None
+            )
+            # A standalone file, restorable without its WAL
+            target.execute("PRAGMA journal_mode=DELETE")
+            return target.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            source.close()
+            target.close()
+
+    def load_hashes(self, page_size: int) -> Optional[List[bytes]]:
+        try:
+            with open(self.hashes_path, 'rb') as fileobj:
+                stored_size, count = struct.unpack('>II', fileobj.read(8))
+                digests = fileobj.read()
+        except (OSError, struct.error):
+            return None
+        if stored_size != page_size or len(digests) != count * DIGEST_SIZE:
+            return None
+        return [digests[index:index + DIGEST_SIZE] for index in range(0, len(digests), DIGEST_SIZE)]
+
+    def save_hashes(self, page_size: int, digests: List[bytes]):
+        partial = f"{self.hashes_path}.partial"
+        with open(partial, 'wb') as fileobj:
+            fileobj.write(struct.pack('>II', page_size, len(digests)))
+            fileobj.write(b''.join(digests))
+        os.replace(partial, self.hashes_path)
+
+    def pack(self, page_size: int) -> Optional[Tuple[str, str, int]]:
+        """Write the snapshot as a full backup or a delta, returns (file name, kind, pages written), None if unchanged"""
+        previous = self.load_hashes(page_size)
+        chains = self.chains()
+        full = previous is None or not chains or len(chains[-1]) >= self.full_every or self.kind(chains[-1][0]) != FULL
+        kind = FULL if full else DELTA
+        fernet = self.fernet()
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f')
+        name = f"backup-{stamp}-{kind}.db.gz{'.enc' if fernet is not None else ''}"
+        path = os.path.join(self.directory, name)
+        partial = f"{path}.partial"
+
+        digests: List[bytes] = []
+        written = 0
+        try:
+            with open(partial, 'wb') as fileobj:
+                sink = EncryptedWriter(fileobj, fernet) if fernet is not None else fileobj
+                with gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6) as stream:
+                    if not full:
+                        page_count = os.path.getsize(self.snapshot_path) // page_size
+                        stream.write(DELTA_MAGIC + struct.pack('>II', page_size, page_count))
+                    for number, digest, page in page_digests(self.snapshot_path, page_size):
+                        digests.append(digest)
+                        if full:
+                            stream.write(page)
+                        elif number >= len(previous) or previous[number] != digest:
+                            stream.write(struct.pack('>I', number) + page)
+                        else:
+                            continue
+                        written += 1
+                if fernet is not None:
+                    sink.close()
+            if not full and written == 0 and len(digests) == len(previous):
+                os.remove(partial)
+                return None
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        self.save_hashes(page_size, digests)
+        return name, kind, written
+
+    def prune(self) -> List[str]:
+        """Delete the oldest chains while there are more than max_files backups, keeping the newest chain"""
+        chains = self.chains()
+        removed = []
+        while len(chains) > 1 and sum(len(chain) for chain in chains) > self.max_files:
+            for name in chains.pop(0):
+                os.remove(os.path.join(self.directory, name))
+                removed.append(name)
+        return removed
+
+    def run_backup(self, source_path: str) -> Optional[Tuple[str, str, int]]:
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            page_size = self.snapshot(source_path)
+            result = self.pack(page_size)
+        finally:
+            if os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
+        removed = self.prune()
+        if removed:
+            logger.info(f"🗑️ Pruned {len(removed)} old backups")
+        return result
+
+    async def backup(self) -> Optional[str]:
+        """Take one backup now and return its file name, None if nothing changed or the database is in memory"""
+        if db.memory or db.path is None:
+            logger.warning("⚠️ Skipping backup, the database is in memory")
+            return None
+        start = time.monotonic()
+        self.last_attempt = time.time()
+        try:
+            result = await asyncio.to_thread(self.run_backup, db.path)
+        except Exception as e:
+            BACKUPS.labels('any', 'failed').inc()
+            logger.error(f"❌ Backup failed: {e}")
+            raise
+        BACKUP_LAST_SUCCESS.set(time.time())
+        if result is None:
+            BACKUPS.labels(DELTA, 'unchanged').inc()
+            logger.info(f"💾 Database unchanged since the last backup ({time.monotonic() - start:.1f}s)")
+            return None
+        name, kind, pages = result
+        BACKUPS.labels(kind, 'ok').inc()
+        size = os.path.getsize(os.path.join(self.directory, name))
+        logger.info(f"💾 {kind.capitalize()} backup {name}: {pages} pages, {size} bytes in {time.monotonic() - start:.1f}s")
+        return name
+
+    # ====== RESTORE ======
+
+    def restore(self, target_path: str, until: Optional[str] = None):
+        """Rebuild a database file from the newest chain, or the chain ending at backup `until`.
+
+        Run it on a stopped bot, or against a path the bot is not using.
+        """
+        chains = [chain for chain in self.chains() if self.kind(chain[0]) == FULL]
+        if until is not None:
+            chains = [chain[:chain.index(until) + 1] for chain in chains if until in chain]
+        if not chains:
+            raise FileNotFoundError(f"No full backup to restore from in {self.directory}")
+        fernet = self.fernet()
+        chain = chains[-1]
+
+        partial = f"{target_path}.partial"
+        with open(partial, 'wb') as target:
+            for chunk in read_plain(os.path.join(self.directory, chain[0]), fernet):
+                target.write(chunk)
+        with open(partial, 'r+b') as target:
+            for name in chain[1:]:
+                self.apply_delta(target, read_plain(os.path.join(self.directory, name), fernet))
+        os.replace(partial, target_path)
+        logger.info(f"♻️ Restored {target_path} from {chain[0]} and {len(chain) - 1} deltas")
+
+    @staticmethod
+    def apply_delta(target: BinaryIO, chunks: Iterator[bytes]):
+        buffer = bytearray()
+        chunks = iter(chunks)
+
+        def read(size: int) -> bytes:
+            while len(buffer) < size:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                buffer.extend(chunk)
+            data = bytes(buffer[:size])
+            del buffer[:size]
+            return data
+
+        if read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+            raise ValueError("Not a backup delta")
+        page_size, page_count = struct.unpack('>II', read(8))
+        while True:
+            header = read(4)
+            if not header:
+                break
+            number = struct.unpack('>I', header)[0]
+            target.seek(number * page_size)
+            target.write(read(page_size))
+        target.truncate(page_count * page_size)
+
+    # ====== SCHEDULE ======
+
+    def next_backup_in(self) -> float:
+        """Seconds until the next backup is due, counting from the newest backup file or the last attempt"""
+        last = self.last_attempt
+        backups = self.backups()
+        if backups:
+            last = max(last, os.path.getmtime(os.path.join(self.directory, backups[-1][0])))
+        return max(last + self.interval - time.time(), 0)
+
+    def start(self):
+        if self.task is not None or self.interval <= 0:
+            return
+        if self.encryption_key and Fernet is None:
+            logger.error("❌ BACKUP_ENCRYPTION is on but the cryptography package is missing, automatic backups are off")
+            return
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        logger.info(f"💾 Automatic backups every {self.interval / 3600:g}h into {self.directory}")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.next_backup_in())
+            self.current = asyncio.get_running_loop().create_task(self.backup())
+            try:
+                # Shielded so stop() lets a backup in progress finish
+                await asyncio.shield(self.current)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Already logged, the next attempt is an interval later
+                pass
+            finally:
+                if self.current.done():
+                    self.current = None
+
+    async def stop(self):
+        """Stop scheduling, waiting for a backup in progress"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.current is not None:
+            await asyncio.gather(self.current, return_exceptions=True)
+            self.current = None
+
+
+# Global backup manager
+backup_manager = BackupManager()
@@ -0,0 +1,109 @@
+# database/counters.py - Materialized row counts for /stats
+import asyncio
+import sqlite3
+from typing import Dict, Optional
+from database.models import COUNTED_TABLES, db
+from helpers.logger import get_logger
+
+logger = get_logger(__name__)
+
+BUMP_COUNTER = "UPDATE stats_counters SET value = value + ? WHERE name = ?"
+
+
+def bump(connection: sqlite3.Connection, name: str, delta: int):
+    """Move a counter inside the caller's transaction"""
+    connection.execute(BUMP_COUNTER, (delta, name))
+
+
+def count_rows(connection: sqlite3.Connection) -> Dict[str, int]:
+    return {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in COUNTED_TABLES}
+
+
+class StatsCounters:
+    """In-memory mirror of the stats_counters table.
+
+    Every insert or delete in database.functions moves the matching row of
+    stats_counters in the same transaction and then calls apply(), so reads
+    never touch the counted tables. A periodic reconciliation recounts the
+    tables to repair drift from writes made outside those functions.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, int] = {table: 0 for table in COUNTED_TABLES}
+        self.task: Optional[asyncio.Task] = None
+
+    def get(self, name: str) -> int:
+        return self.values.get(name, 0)
+
+    def apply(self, name: str, delta: int):
+        """Mirror a committed counter change"""
+        self.values[name] = self.values.get(name, 0) + delta
+
+    async def load(self):
+        """Read the counters, counting tables once if they were never materialized"""
+        def load_counters(connection: sqlite3.Connection) -> Dict[str, int]:
+            stored = dict(connection.execute("SELECT name, value FROM stats_counters"))
+            missing = [table for table in COUNTED_TABLES if table not in stored]
+            if missing:
+                with connection:
+                    for table in missing:
+                        stored[table] = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                        connection.execute(
+                            "INSERT INTO stats_counters (name, value) VALUES (?, ?)", (table, stored[table])
+                        )
+            return stored
+
+        self.values.update(await db.write(load_counters, 'stats_load'))
+
+    async def refresh(self):
+        """Re-read the stored counters, for processes that share the database with other writers"""
+        def read_counters(connection: sqlite3.Connection) -> Dict[str, int]:
+            return dict(connection.execute("SELECT name, value FROM stats_counters"))
+
+        self.values.update(await db.read(read_counters, 'stats_refresh'))
+
+    async def reconcile(self) -> Dict[str, int]:
+        """Recount every table, fix the stored counters and return the drift per table"""
+        def recount(connection: sqlite3.Connection) -> Dict[str, int]:
+            counts = count_rows(connection)
+            with connection:
+                connection.executemany(
+                    "UPDATE stats_counters SET value = ? WHERE name = ?",
+                    [(value, name) for name, value in counts.items()]
+                )
+            return counts
+
+        counts = await db.write(recount, 'stats_reconcile')
+        drift = {}
+        for name, value in counts.items():
+            if value != self.values.get(name, 0):
+                drift[name] = value - self.values.get(name, 0)
+        self.values.update(counts)
+        if drift:
+            logger.warning(f"📊 Stats counters drifted and were corrected: {drift}")
+        return drift
+
+    def start(self, interval: float):
+        if self.task is None and interval > 0:
+            self.task = asyncio.get_running_loop().create_task(self.run(interval))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"❌ Stats reconciliation failed: {e}")
+
+
+# Global counters instance
+stats_counters = StatsCounters()
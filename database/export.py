@@ -0,0 +1,341 @@
+# database/export.py - Streaming export and bulk import of chat and bot data
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import time
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from config import Config
+from database.counters import bump, stats_counters
+from database.models import COUNTED_TABLES, db
+from database.write_behind import write_behind
+from helpers.logger import get_logger
+
+logger = get_logger(__name__)
+
+FORMAT = 'pro-robot-export'
+VERSION = 1
+# Longest record accepted on import, a line past this is rejected before it is parsed
+MAX_RECORD_SIZE = 1 << 20
+WRITE_BUFFER = 1 << 16
+
+
+class ExportFormatError(ValueError):
+    """The file is not a valid export, or does not fit where it is being imported"""
+
+
+class ExportTable:
+    """How one table is exported and imported.
+
+    chat_column holds the chat id: chat exports select on it, leave it out
+    of the records and the import fills in the target chat. Tables reached
+    through the chat's federation use chat_filter instead. shared tables
+    belong to a federation rather than the chat: they are exported with the
+    chat for reference, but a chat import never writes them, otherwise a
+    crafted file could add bans to any federation or move the chat into it.
+    local columns only make sense in the chat they came from (message ids)
+    and are left out of chat exports.
+    """
+
+    __slots__ = ('name', 'columns', 'key', 'chat_column', 'chat_filter', 'local', 'shared')
+
+    def __init__(self, name: str, columns: Tuple[Tuple[str, type], ...], key: Tuple[str, ...],
+                 chat_column: Optional[str] = None, chat_filter: Optional[str] = None, local: Tuple[str, ...] = (),
+                 shared: bool = False):
+        self.name = name
+        self.columns = dict(columns)
+        self.key = key
+        self.chat_column = chat_column
+        self.chat_filter = chat_filter
+        self.local = local
+        self.shared = shared
+
+    @property
+    def in_chat_export(self) -> bool:
+        return self.chat_column is not None or self.chat_filter is not None
+
+    def exported_columns(self, chat_scope: bool) -> Tuple[str, ...]:
+        if not chat_scope:
+            return tuple(self.columns)
+        return tuple(column for column in self.columns if column != self.chat_column and column not in self.local)
+
+    def select(self, chat_scope: bool) -> str:
+        sql = f"SELECT {', '.join(self.exported_columns(chat_scope))} FROM {self.name}"
+        if chat_scope:
+            sql += f" WHERE {self.chat_column} = ?" if self.chat_column else f" WHERE {self.chat_filter}"
+        return sql
+
+
+FEDERATION_OF_CHAT = "fed_id IN (SELECT fed_id FROM federation_chats WHERE chat_id = ?)"
+
+# In import order, parents before the rows that refer to them
+TABLES = (
+    ExportTable('users', (('user_id', int), ('username', str), ('first_name', str), ('last_seen', float)),
+                ('user_id',)),
+    ExportTable('chats', (('chat_id', int), ('title', str), ('type', str), ('joined_at', float)), ('chat_id',)),
+    ExportTable('bans', (('chat_id', int), ('user_id', int), ('reason', str), ('banned_by', int),
+                         ('created_at', float)), ('chat_id', 'user_id')),
+    ExportTable('warns', (('id', int), ('chat_id', int), ('user_id', int), ('reason', str), ('warned_by', int),
+                          ('created_at', float)), ('id',)),
+    ExportTable('filters', (('chat_id', int), ('keyword', str), ('reply', str)), ('chat_id', 'keyword'),
+                chat_column='chat_id'),
+    ExportTable('notes', (('chat_id', int), ('name', str), ('content', str)), ('chat_id', 'name'),
+                chat_column='chat_id'),
+    ExportTable('greetings', (('chat_id', int), ('welcome_enabled', int), ('welcome_text', str),
+                              ('clean_welcome', int), ('last_welcome_id', int)), ('chat_id',),
+                chat_column='chat_id', local=('last_welcome_id',)),
+    ExportTable('federations', (('fed_id', str), ('name', str), ('owner_id', int), ('created_at', float)),
+                ('fed_id',), chat_filter=FEDERATION_OF_CHAT, shared=True),
+    ExportTable('federation_chats', (('fed_id', str), ('chat_id', int), ('joined_at', float)),
+                ('fed_id', 'chat_id'), chat_column='chat_id', shared=True),
+    ExportTable('federation_bans', (('fed_id', str), ('user_id', int), ('reason', str), ('banned_by', int),
+                                    ('created_at', float)), ('fed_id', 'user_id'), chat_filter=FEDERATION_OF_CHAT,
+                shared=True),
+    ExportTable('action_log', (('id', int), ('chat_id', int), ('actor_id', int), ('target_id', int),
+                               ('action', str), ('reason', str), ('created_at', float)), ('id',)),
+)
+
+
+def scope_tables(chat_scope: bool) -> List[ExportTable]:
+    return [table for table in TABLES if table.in_chat_export or not chat_scope]
+
+
+SHARED_TABLES = {table.name for table in TABLES if table.shared}
+
+
+# ====== EXPORT ======
+
+def iter_records(connection: sqlite3.Connection, chat_id: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yield the header, every row and the trailer of an export, straight off the database cursors.
+
+    Runs in one read transaction, so the export is a consistent snapshot
+    even while the bot keeps writing, and holds one row at a time.
+    """
+    chat_scope = chat_id is not None
+    counts: Dict[str, int] = {}
+    connection.execute("BEGIN")
+    yield {'type': 'header', 'format': FORMAT, 'version': VERSION, 'scope': 'chat' if chat_scope else 'all',
+           'chat_id': chat_id, 'created_at': time.time()}
+    for table in scope_tables(chat_scope):
+        columns = table.exported_columns(chat_scope)
+        cursor = connection.execute(table.select(chat_scope), (chat_id,) if chat_scope else ())
+        count = 0
+        for row in cursor:
+            yield {'type': 'row', 'table': table.name, 'row': dict(zip(columns, row))}
+            count += 1
+        counts[table.name] = count
+    yield {'type': 'end', 'counts': counts}
+
+
+def write_records(records: Iterator[Dict[str, Any]], fileobj: BinaryIO) -> Dict[str, int]:
+    """Write records as gzip-compressed JSON lines and return the row counts from the trailer"""
+    counts: Dict[str, int] = {}
+    with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=6) as stream:
+        lines: List[bytes] = []
+        size = 0
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            lines.append(line)
+            size += len(line)
+            if size >= WRITE_BUFFER:
+                stream.write(b''.join(lines))
+                lines.clear()
+                size = 0
+            if record['type'] == 'end':
+                counts = record['counts']
+        stream.write(b''.join(lines))
+    return counts
+
+
+async def export_data(path: str, chat_id: Optional[int] = None) -> Dict[str, int]:
+    """Export one chat's settings, or with no chat_id the whole database, to a .ndjson.gz file.
+
+    The file is written to a temporary name and moved into place once
+    complete. Returns the exported row count per table.
+    """
+    start = time.monotonic()
+    # Buffered writes belong in a whole-database export
+    await write_behind.flush()
+
+    def run(connection: sqlite3.Connection) -> Dict[str, int]:
+        partial = f"{path}.partial"
+        try:
+            with open(partial, 'wb') as fileobj:
+                counts = write_records(iter_records(connection, chat_id), fileobj)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return counts
+
+    counts = await db.read(run, 'export')
+    logger.info(f"📤 Exported {sum(counts.values())} rows of {'chat ' + str(chat_id) if chat_id is not None else 'the database'} "
+                f"to {path} ({os.path.getsize(path)} bytes) in {time.monotonic() - start:.1f}s")
+    return counts
+
+
+# ====== IMPORT ======
+
+def validate_row(table: ExportTable, columns: Tuple[str, ...], row: Any, line: int) -> Tuple[Any, ...]:
+    """Check a row has exactly the exported columns with the right types and return its values in order"""
+    if not isinstance(row, dict) or set(row) != set(columns):
+        raise ExportFormatError(f"Line {line}: {table.name} row must have the columns {', '.join(columns)}")
+    values = []
+    for column in columns:
+        value = row[column]
+        expected = table.columns[column]
+        if value is None:
+            if column in table.key:
+                raise ExportFormatError(f"Line {line}: {table.name}.{column} can't be empty")
+        elif isinstance(value, bool) or not isinstance(value, (int, float) if expected is float else expected):
+            raise ExportFormatError(f"Line {line}: {table.name}.{column} must be {expected.__name__}")
+        values.append(value)
+    return tuple(values)
+
+
+def read_records(fileobj: BinaryIO, chat_scope: bool) -> Iterator[Tuple[str, Tuple[Any, ...]]]:
+    """Validate an export line by line, yielding (table, values) for every row.
+
+    Raises ExportFormatError on the first bad record, on a file of the
+    wrong scope and on a file that ends before its trailer or whose row
+    counts don't match it.
+    """
+    expected_scope = 'chat' if chat_scope else 'all'
+    allowed = {table.name: table for table in scope_tables(chat_scope)}
+    counts: Dict[str, int] = {}
+    header = False
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as stream:
+        line = 0
+        while True:
+            raw = stream.readline(MAX_RECORD_SIZE + 1)
+            if not raw:
+                raise ExportFormatError("The export is truncated, it has no end record")
+            line += 1
+            if len(raw) > MAX_RECORD_SIZE:
+                raise ExportFormatError(f"Line {line} is longer than {MAX_RECORD_SIZE} bytes")
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                raise ExportFormatError(f"Line {line} is not valid JSON") from None
+            kind = record.get('type') if isinstance(record, dict) else None
+
+            if not header:
+                if kind != 'header' or record.get('format') != FORMAT:
+                    raise ExportFormatError("Not a bot export file")
+                if record.get('version') != VERSION:
+                    raise ExportFormatError(f"Unsupported export version {record.get('version')}")
+                if record.get('scope') != expected_scope:
+                    raise ExportFormatError(f"Expected a {expected_scope} export, this one's scope is {record.get('scope')!r}")
+                header = True
+            elif kind == 'row':
+                table = allowed.get(record.get('table'))
+                if table is None:
+                    raise ExportFormatError(f"Line {line}: unknown table {record.get('table')!r}")
+                yield table.name, validate_row(table, table.exported_columns(chat_scope), record.get('row'), line)
+                counts[table.name] = counts.get(table.name, 0) + 1
+            elif kind == 'end':
+                expected = {name: count for name, count in (record.get('counts') or {}).items() if count}
+                if expected != counts:
+                    raise ExportFormatError(f"Row counts {counts} don't match the end record {expected}")
+                if stream.read(1):
+                    raise ExportFormatError(f"Unexpected data after the end record on line {line}")
+                return
+            else:
+                raise ExportFormatError(f"Line {line}: unknown record type {kind!r}")
+
+
+def take(records: Iterator[Tuple[str, Tuple[Any, ...]]], count: int) -> List[Tuple[str, Tuple[Any, ...]]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= count:
+            break
+    return chunk
+
+
+def insert_chunk(connection: sqlite3.Connection, chunk: List[Tuple[str, Tuple[Any, ...]]],
+                 chat_id: Optional[int]) -> Dict[str, int]:
+    """Insert or update one chunk of rows in a single transaction, returning new rows per table.
+
+    A chat import skips shared tables.
+    """
+    chat_scope = chat_id is not None
+    grouped: Dict[str, List[Tuple[Any, ...]]] = {}
+    for name, values in chunk:
+        if not (chat_scope and name in SHARED_TABLES):
+            grouped.setdefault(name, []).append(values)
+
+    created: Dict[str, int] = {}
+    with connection:
+        for table in TABLES:
+            rows = grouped.get(table.name)
+            if not rows:
+                continue
+            columns = table.exported_columns(chat_scope)
+            if chat_scope and table.chat_column:
+                columns += (table.chat_column,)
+                rows = [values + (chat_id,) for values in rows]
+            inserted = connection.executemany(
+                f"INSERT OR IGNORE INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows
+            ).rowcount
+            updated = [column for column in columns if column not in table.key]
+            if updated:
+                positions = [columns.index(column) for column in updated + list(table.key)]
+                connection.executemany(
+                    f"UPDATE {table.name} SET {', '.join(f'{column} = ?' for column in updated)} "
+                    f"WHERE {' AND '.join(f'{column} = ?' for column in table.key)}",
+                    [tuple(values[position] for position in positions) for values in rows]
+                )
+            if inserted and table.name in COUNTED_TABLES:
+                bump(connection, table.name, inserted)
+            created[table.name] = inserted
+    return created
+
+
+async def import_data(path: str, chat_id: Optional[int] = None,
+                      chunk_size: int = Config.IMPORT_CHUNK_SIZE) -> Dict[str, int]:
+    """Import a file written by export_data, into chat_id for a chat export.
+
+    The whole file is validated before anything is written, then rows are
+    inserted chunk_size at a time, one transaction per chunk, so other
+    writes interleave with a long import. Rows that already exist are
+    overwritten with the imported values. A chat import leaves federation
+    data alone, a chat joins a federation and federation bans are added
+    through the federation itself. Returns the imported row count per
+    table.
+    """
+    start = time.monotonic()
+    chat_scope = chat_id is not None
+
+    def verify():
+        with open(path, 'rb') as fileobj:
+            for _ in read_records(fileobj, chat_scope):
+                pass
+
+    await asyncio.to_thread(verify)
+
+    counts: Dict[str, int] = {}
+    skipped = 0
+    with open(path, 'rb') as fileobj:
+        records = read_records(fileobj, chat_scope)
+        while True:
+            chunk = await asyncio.to_thread(take, records, chunk_size)
+            if not chunk:
+                break
+            created = await db.write(lambda connection: insert_chunk(connection, chunk, chat_id), 'import')
+            for table, count in created.items():
+                if count and table in COUNTED_TABLES:
+                    stats_counters.apply(table, count)
+            for table, _ in chunk:
+                if chat_scope and table in SHARED_TABLES:
+                    skipped += 1
+                else:
+                    counts[table] = counts.get(table, 0) + 1
+
+    logger.info(f"📥 Imported {sum(counts.values())} rows into {'chat ' + str(chat_id) if chat_scope else 'the database'} "
+                f"from {path} in {time.monotonic() - start:.1f}s"
+                + (f", skipped {skipped} federation rows" if skipped else ''))
+    return counts
@@ -0,0 +1,405 @@
+# database/functions.py - Database queries used by the bot and its modules
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import psutil
+from config import Config
+from database.counters import bump, stats_counters
+from database.models import db
+from database.write_behind import write_behind
+from metrics import PROCESS_START
+
+PROCESS = psutil.Process()
+
+
+async def insert_counted(counter: str, insert: str, params: Tuple, update: Optional[str] = None,
+                         update_params: Tuple = ()) -> bool:
+    """Insert a row, or update the existing one, counting it only when it is new"""
+    def run(connection: sqlite3.Connection) -> bool:
+        with connection:
+            if connection.execute(insert, params).rowcount:
+                bump(connection, counter, 1)
+                return True
+            if update is not None:
+                connection.execute(update, update_params)
+            return False
+
+    created = await db.write(run, f'insert_{counter}')
+    if created:
+        stats_counters.apply(counter, 1)
+    return created
+
+
+async def delete_counted(counter: str, delete: str, params: Tuple) -> int:
+    """Delete rows and uncount them, returning how many were deleted"""
+    def run(connection: sqlite3.Connection) -> int:
+        with connection:
+            deleted = connection.execute(delete, params).rowcount
+            if deleted:
+                bump(connection, counter, -deleted)
+            return deleted
+
+    deleted = await db.write(run, f'delete_{counter}')
+    if deleted:
+        stats_counters.apply(counter, -deleted)
+    return deleted
+
+
+# ====== USERS AND CHATS ======
+
+async def add_user(user_id: int, username: Optional[str] = None, first_name: Optional[str] = None) -> bool:
+    """Record a user, returning True the first time they are seen"""
+    now = time.time()
+    return await insert_counted(
+        'users',
+        "INSERT OR IGNORE INTO users (user_id, username, first_name, last_seen) VALUES (?, ?, ?, ?)",
+        (user_id, username, first_name, now),
+        "UPDATE users SET username = ?, first_name = ?, last_seen = ? WHERE user_id = ?",
+        (username, first_name, now, user_id),
+    )
+
+
+async def add_chat(chat_id: int, title: Optional[str] = None, chat_type: Optional[str] = None) -> bool:
+    """Record a chat, returning True the first time it is seen"""
+    return await insert_counted(
+        'chats',
+        "INSERT OR IGNORE INTO chats (chat_id, title, type, joined_at) VALUES (?, ?, ?, ?)",
+        (chat_id, title, chat_type, time.time()),
+        "UPDATE chats SET title = ?, type = ? WHERE chat_id = ?",
+        (title, chat_type, chat_id),
+    )
+
+
+async def record_user_seen(user_id: int, username: Optional[str] = None, first_name: Optional[str] = None):
+    """Buffer a user sighting, only the latest one per user is written"""
+    write_behind.upsert(
+        'users', {'user_id': user_id}, {'username': username, 'first_name': first_name, 'last_seen': time.time()}
+    )
+
+
+async def record_chat_seen(chat_id: int, title: Optional[str] = None, chat_type: Optional[str] = None):
+    """Buffer a chat sighting, only the latest one per chat is written"""
+    write_behind.upsert('chats', {'chat_id': chat_id}, {'title': title, 'type': chat_type})
+
+
+async def remove_chat(chat_id: int) -> bool:
+    write_behind.discard('chats', {'chat_id': chat_id})
+    return bool(await delete_counted('chats', "DELETE FROM chats WHERE chat_id = ?", (chat_id,)))
+
+
+# ====== BANS AND WARNS ======
+
+async def add_ban(chat_id: int, user_id: int, reason: Optional[str] = None, banned_by: Optional[int] = None) -> bool:
+    return await insert_counted(
+        'bans',
+        "INSERT OR IGNORE INTO bans (chat_id, user_id, reason, banned_by, created_at) VALUES (?, ?, ?, ?, ?)",
+        (chat_id, user_id, reason, banned_by, time.time()),
+        "UPDATE bans SET reason = ?, banned_by = ? WHERE chat_id = ? AND user_id = ?",
+        (reason, banned_by, chat_id, user_id),
+    )
+
+
+async def remove_ban(chat_id: int, user_id: int) -> bool:
+    return bool(await delete_counted('bans', "DELETE FROM bans WHERE chat_id = ? AND user_id = ?", (chat_id, user_id)))
+
+
+async def add_warn(chat_id: int, user_id: int, reason: Optional[str] = None, warned_by: Optional[int] = None) -> int:
+    """Buffer a warning and return the user's warning count in the chat"""
+    write_behind.append('warns', {
+        'chat_id': chat_id, 'user_id': user_id, 'reason': reason, 'warned_by': warned_by, 'created_at': time.time()
+    })
+    return await get_warn_count(chat_id, user_id)
+
+
+async def get_warn_count(chat_id: int, user_id: int) -> int:
+    row, pending = await write_behind.read(lambda connection: connection.execute(
+        "SELECT COUNT(*) FROM warns WHERE chat_id = ? AND user_id = ?", (chat_id, user_id)
+    ).fetchone(), 'count_warns')
+    return row[0] + len(pending.appended('warns', {'chat_id': chat_id, 'user_id': user_id}))
+
+
+async def remove_warns(chat_id: int, user_id: int) -> int:
+    """Clear a user's warnings in a chat, returning how many were removed"""
+    match = {'chat_id': chat_id, 'user_id': user_id}
+    buffered = len(write_behind.pending.appended('warns', match))
+    write_behind.discard('warns', match)
+    return buffered + await delete_counted('warns', "DELETE FROM warns WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+
+
+# ====== FLOOD STRIKES ======
+
+async def add_flood_strike(chat_id: int, user_id: int) -> int:
+    """Buffer a flood strike and return the user's strike count in the chat"""
+    key = {'chat_id': chat_id, 'user_id': user_id}
+    write_behind.increment('flood_strikes', key, 'strikes')
+    write_behind.upsert('flood_strikes', key, {'last_strike': time.time()})
+    return await get_flood_strikes(chat_id, user_id)
+
+
+async def get_flood_strikes(chat_id: int, user_id: int) -> int:
+    row, pending = await write_behind.read(lambda connection: connection.execute(
+        "SELECT strikes FROM flood_strikes WHERE chat_id = ? AND user_id = ?", (chat_id, user_id)
+    ).fetchone(), 'get_flood_strikes')
+    return (row[0] if row else 0) + pending.increment('flood_strikes', {'chat_id': chat_id, 'user_id': user_id}, 'strikes')
+
+
+async def reset_flood_strikes(chat_id: int, user_id: int):
+    write_behind.discard('flood_strikes', {'chat_id': chat_id, 'user_id': user_id})
+    await db.execute("DELETE FROM flood_strikes WHERE chat_id = ? AND user_id = ?", (chat_id, user_id), 'reset_flood_strikes')
+
+
+# ====== ACTION LOG ======
+
+async def log_action(chat_id: int, action: str, actor_id: Optional[int] = None, target_id: Optional[int] = None,
+                     reason: Optional[str] = None):
+    """Buffer a moderation action for the chat's action log"""
+    write_behind.append('action_log', {
+        'chat_id': chat_id, 'actor_id': actor_id, 'target_id': target_id,
+        'action': action, 'reason': reason, 'created_at': time.time(),
+    })
+
+
+async def get_recent_actions(chat_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+    """Latest actions in a chat, newest first"""
+    rows, pending = await write_behind.read(lambda connection: connection.execute(
+        "SELECT actor_id, target_id, action, reason, created_at FROM action_log "
+        "WHERE chat_id = ? ORDER BY created_at DESC LIMIT ?", (chat_id, limit)
+    ).fetchall(), 'get_recent_actions')
+    actions = [
+        {'chat_id': chat_id, 'actor_id': actor_id, 'target_id': target_id, 'action': action, 'reason': reason, 'created_at': created_at}
+        for actor_id, target_id, action, reason, created_at in rows
+    ]
+    actions.extend(pending.appended('action_log', {'chat_id': chat_id}))
+    actions.sort(key=lambda action: action['created_at'], reverse=True)
+    return actions[:limit]
+
+
+# ====== FILTERS AND NOTES ======
+
+async def add_filter(chat_id: int, keyword: str, reply: str) -> bool:
+    return await insert_counted(
+        'filters',
+        "INSERT OR IGNORE INTO filters (chat_id, keyword, reply) VALUES (?, ?, ?)",
+        (chat_id, keyword, reply),
+        "UPDATE filters SET reply = ? WHERE chat_id = ? AND keyword = ?",
+        (reply, chat_id, keyword),
+    )
+
+
+async def remove_filter(chat_id: int, keyword: str) -> bool:
+    return bool(await delete_counted('filters', "DELETE FROM filters WHERE chat_id = ? AND keyword = ?", (chat_id, keyword)))
+
+
+async def save_note(chat_id: int, name: str, content: str) -> bool:
+    return await insert_counted(
+        'notes',
+        "INSERT OR IGNORE INTO notes (chat_id, name, content) VALUES (?, ?, ?)",
+        (chat_id, name, content),
+        "UPDATE notes SET content = ? WHERE chat_id = ? AND name = ?",
+        (content, chat_id, name),
+    )
+
+
+async def delete_note(chat_id: int, name: str) -> bool:
+    return bool(await delete_counted('notes', "DELETE FROM notes WHERE chat_id = ? AND name = ?", (chat_id, name)))
+
+
+# ====== GREETINGS ======
+
+GREETING_COLUMNS = ('welcome_enabled', 'welcome_text', 'clean_welcome', 'last_welcome_id')
+GREETING_DEFAULTS = {'welcome_enabled': 1, 'welcome_text': None, 'clean_welcome': 1, 'last_welcome_id': None}
+
+
+async def get_greeting(chat_id: int) -> Dict[str, Any]:
+    """A chat's welcome settings, with defaults for chats that never changed them"""
+    row, pending = await write_behind.read(lambda connection: connection.execute(
+        f"SELECT {', '.join(GREETING_COLUMNS)} FROM greetings WHERE chat_id = ?", (chat_id,)
+    ).fetchone(), 'get_greeting')
+    greeting = dict(zip(GREETING_COLUMNS, row)) if row else dict(GREETING_DEFAULTS)
+    greeting.update(pending.row('greetings', {'chat_id': chat_id}) or {})
+    return greeting
+
+
+async def set_welcome(chat_id: int, text: Optional[str] = None, enabled: bool = True, clean: bool = True):
+    await db.execute(
+        "INSERT INTO greetings (chat_id, welcome_enabled, welcome_text, clean_welcome) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (chat_id) DO UPDATE SET welcome_enabled = excluded.welcome_enabled, "
+        "welcome_text = excluded.welcome_text, clean_welcome = excluded.clean_welcome",
+        (chat_id, int(enabled), text, int(clean)), 'set_welcome'
+    )
+
+
+async def record_last_welcome(chat_id: int, message_id: int):
+    """Buffer the id of the latest welcome, which the next one deletes"""
+    write_behind.upsert('greetings', {'chat_id': chat_id}, {'last_welcome_id': message_id})
+
+
+# ====== FEDERATIONS ======
+
+async def create_federation(fed_id: str, name: str, owner_id: int) -> bool:
+    return await insert_counted(
+        'federations',
+        "INSERT OR IGNORE INTO federations (fed_id, name, owner_id, created_at) VALUES (?, ?, ?, ?)",
+        (fed_id, name, owner_id, time.time()),
+    )
+
+
+async def delete_federation(fed_id: str) -> bool:
+    """Delete a federation with its chats and bans, and cancel its unfinished jobs"""
+    def run(connection: sqlite3.Connection) -> bool:
+        # One transaction, so a crash can't leave chats, bans or resumable jobs of a deleted federation
+        with connection:
+            deleted = connection.execute("DELETE FROM federations WHERE fed_id = ?", (fed_id,)).rowcount
+            if not deleted:
+                return False
+            bump(connection, 'federations', -deleted)
+            connection.execute("DELETE FROM federation_chats WHERE fed_id = ?", (fed_id,))
+            connection.execute("DELETE FROM federation_bans WHERE fed_id = ?", (fed_id,))
+            connection.execute(
+                "UPDATE federation_jobs SET status = 'cancelled', finished_at = ? WHERE fed_id = ? AND status = 'running'",
+                (time.time(), fed_id)
+            )
+            return True
+
+    deleted = await db.write(run, 'delete_federation')
+    if deleted:
+        stats_counters.apply('federations', -1)
+    return deleted
+
+
+async def join_federation(fed_id: str, chat_id: int) -> bool:
+    """Add a chat to a federation, a chat belongs to at most one federation"""
+    def run(connection: sqlite3.Connection) -> bool:
+        with connection:
+            connection.execute("DELETE FROM federation_chats WHERE chat_id = ? AND fed_id != ?", (chat_id, fed_id))
+            return bool(connection.execute(
+                "INSERT OR IGNORE INTO federation_chats (fed_id, chat_id, joined_at) VALUES (?, ?, ?)",
+                (fed_id, chat_id, time.time())
+            ).rowcount)
+
+    return await db.write(run, 'join_federation')
+
+
+async def leave_federation(chat_id: int) -> bool:
+    return bool(await db.execute("DELETE FROM federation_chats WHERE chat_id = ?", (chat_id,), 'leave_federation'))
+
+
+async def get_chat_federation(chat_id: int) -> Optional[str]:
+    row = await db.fetchone("SELECT fed_id FROM federation_chats WHERE chat_id = ?", (chat_id,), 'get_chat_federation')
+    return row[0] if row else None
+
+
+async def count_federation_chats(fed_id: str) -> int:
+    row = await db.fetchone("SELECT COUNT(*) FROM federation_chats WHERE fed_id = ?", (fed_id,), 'count_federation_chats')
+    return row[0]
+
+
+async def get_federation_chats(fed_id: str, after: Optional[int] = None, limit: int = 200) -> List[int]:
+    """One page of a federation's chat ids in ascending order, starting after the given chat id"""
+    rows = await db.fetchall(
+        "SELECT chat_id FROM federation_chats WHERE fed_id = ? AND chat_id > ? ORDER BY chat_id LIMIT ?",
+        (fed_id, after if after is not None else -(1 << 63), limit), 'get_federation_chats'
+    )
+    return [chat_id for chat_id, in rows]
+
+
+async def add_federation_ban(fed_id: str, user_id: int, reason: Optional[str] = None,
+                             banned_by: Optional[int] = None):
+    await db.execute(
+        "INSERT INTO federation_bans (fed_id, user_id, reason, banned_by, created_at) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (fed_id, user_id) DO UPDATE SET reason = excluded.reason, banned_by = excluded.banned_by",
+        (fed_id, user_id, reason, banned_by, time.time()), 'add_federation_ban'
+    )
+
+
+async def remove_federation_ban(fed_id: str, user_id: int) -> bool:
+    return bool(await db.execute(
+        "DELETE FROM federation_bans WHERE fed_id = ? AND user_id = ?", (fed_id, user_id), 'remove_federation_ban'
+    ))
+
+
+async def is_federation_banned(fed_id: str, user_id: int) -> bool:
+    row = await db.fetchone(
+        "SELECT 1 FROM federation_bans WHERE fed_id = ? AND user_id = ?", (fed_id, user_id), 'is_federation_banned'
+    )
+    return row is not None
+
+
+# ====== FEDERATION JOBS ======
+
+FEDERATION_JOB_COLUMNS = (
+    'job_id', 'fed_id', 'action', 'user_id', 'reason', 'requested_by', 'report_chat_id',
+    'worker', 'status', 'cursor', 'total', 'done', 'failed', 'created_at', 'finished_at',
+)
+
+
+async def create_federation_job(fed_id: str, action: str, user_id: int, reason: Optional[str],
+                                requested_by: Optional[int], report_chat_id: Optional[int],
+                                worker: int, total: int) -> int:
+    """Record a new running job and return its id"""
+    def run(connection: sqlite3.Connection) -> int:
+        with connection:
+            return connection.execute(
+                "INSERT INTO federation_jobs (fed_id, action, user_id, reason, requested_by, report_chat_id, "
+                "worker, status, total, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'running', ?, ?)",
+                (fed_id, action, user_id, reason, requested_by, report_chat_id, worker, total, time.time())
+            ).lastrowid
+
+    return await db.write(run, 'create_federation_job')
+
+
+async def save_federation_job(job_id: int, cursor: Optional[int], done: int, failed: int,
+                              status: str = 'running') -> bool:
+    """Record a job's progress, the cursor is the last chat id it has finished.
+
+    Returns False if the job is no longer running, e.g. a later command for
+    the same user superseded it or its federation was deleted.
+    """
+    return bool(await db.execute(
+        "UPDATE federation_jobs SET cursor = ?, done = ?, failed = ?, status = ?, "
+        "finished_at = CASE WHEN ? = 'running' THEN NULL ELSE ? END WHERE job_id = ? AND status = 'running'",
+        (cursor, done, failed, status, status, time.time(), job_id), 'save_federation_job'
+    ))
+
+
+async def supersede_federation_jobs(fed_id: str, user_id: int) -> int:
+    """Mark the running jobs for a user in a federation superseded, returning how many there were"""
+    return await db.execute(
+        "UPDATE federation_jobs SET status = 'superseded', finished_at = ? "
+        "WHERE fed_id = ? AND user_id = ? AND status = 'running'",
+        (time.time(), fed_id, user_id), 'supersede_federation_jobs'
+    )
+
+
+async def get_unfinished_federation_jobs(worker: int = 0, worker_count: int = 1) -> List[Dict[str, Any]]:
+    """Running jobs owned by this worker, jobs of workers that no longer exist are adopted by worker % count"""
+    rows = await db.fetchall(
+        f"SELECT {', '.join(FEDERATION_JOB_COLUMNS)} FROM federation_jobs "
+        "WHERE status = 'running' AND worker % ? = ? ORDER BY job_id",
+        (worker_count, worker), 'get_unfinished_federation_jobs'
+    )
+    return [dict(zip(FEDERATION_JOB_COLUMNS, row)) for row in rows]
+
+
+# ====== STATISTICS ======
+
+def format_uptime(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours}h {minutes}m"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {seconds}s"
+
+
+async def get_stats() -> Dict[str, Any]:
+    """Bot statistics from the materialized counters and process state, without counting table rows"""
+    if Config.WORKER_PROCESSES > 1:
+        # Other workers move the stored counters too, this process only mirrors its own writes
+        await stats_counters.refresh()
+    stats: Dict[str, Any] = dict(stats_counters.values)
+    stats['uptime'] = format_uptime(time.time() - PROCESS_START)
+    stats['memory'] = f"{PROCESS.memory_info().rss / 1024 / 1024:.1f} MB"
+    return stats
@@ -0,0 +1,151 @@
+# database/models.py - Database schema and lifecycle
+from config import Config
+from database.pool import ConnectionPool
+from helpers.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    last_seen REAL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    title TEXT,
+    type TEXT,
+    joined_at REAL
+);
+CREATE TABLE IF NOT EXISTS bans (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    reason TEXT,
+    banned_by INTEGER,
+    created_at REAL,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS warns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    reason TEXT,
+    warned_by INTEGER,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS warns_chat_user ON warns (chat_id, user_id);
+CREATE TABLE IF NOT EXISTS filters (
+    chat_id INTEGER NOT NULL,
+    keyword TEXT NOT NULL,
+    reply TEXT,
+    PRIMARY KEY (chat_id, keyword)
+);
+CREATE TABLE IF NOT EXISTS notes (
+    chat_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    content TEXT,
+    PRIMARY KEY (chat_id, name)
+);
+CREATE TABLE IF NOT EXISTS greetings (
+    chat_id INTEGER PRIMARY KEY,
+    welcome_enabled INTEGER NOT NULL DEFAULT 1,
+    welcome_text TEXT,
+    clean_welcome INTEGER NOT NULL DEFAULT 1,
+    last_welcome_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS federations (
+    fed_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    owner_id INTEGER NOT NULL,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS federation_chats (
+    fed_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    joined_at REAL,
+    PRIMARY KEY (fed_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS federation_chats_chat ON federation_chats (chat_id);
+CREATE TABLE IF NOT EXISTS federation_bans (
+    fed_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    reason TEXT,
+    banned_by INTEGER,
+    created_at REAL,
+    PRIMARY KEY (fed_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS federation_jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fed_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    reason TEXT,
+    requested_by INTEGER,
+    report_chat_id INTEGER,
+    worker INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    cursor INTEGER,
+    total INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS federation_jobs_status ON federation_jobs (status, worker);
+CREATE TABLE IF NOT EXISTS flood_strikes (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    strikes INTEGER NOT NULL DEFAULT 0,
+    last_strike REAL,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS action_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    actor_id INTEGER,
+    target_id INTEGER,
+    action TEXT NOT NULL,
+    reason TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS action_log_chat ON action_log (chat_id, created_at);
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Tables whose row counts /stats reports, kept in stats_counters
+COUNTED_TABLES = ('users', 'chats', 'bans', 'warns', 'filters', 'notes', 'federations')
+
+
+# Global connection pool
+db = ConnectionPool()
+
+
+async def init_db():
+    """Open the connection pool, create missing tables and load the stats counters"""
+    from database.counters import stats_counters
+    from database.write_behind import write_behind
+
+    if db.is_open:
+        return
+    await db.open()
+    await db.write(lambda connection: connection.executescript(SCHEMA), 'schema')
+    await stats_counters.load()
+    stats_counters.start(Config.STATS_RECONCILE_INTERVAL)
+    write_behind.start()
+    logger.info(f"🗄️ Database ready at {db.path} (pool of {db.size} + {db.max_overflow} readers, WAL, single writer)")
+
+
+async def close_db():
+    """Flush buffered writes, stop background work and close every connection"""
+    from database.counters import stats_counters
+    from database.write_behind import write_behind
+
+    if not db.is_open:
+        return
+    await write_behind.stop()
+    await stats_counters.stop()
+    await db.close()
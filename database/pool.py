@@ -0,0 +1,214 @@
+# database/pool.py - Pooled SQLite access from a bounded thread pool
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple, TypeVar
+from config import Config
+from helpers.logger import get_logger
+from metrics import DB_QUERY_LATENCY
+
+logger = get_logger(__name__)
+
+T = TypeVar('T')
+
+
+class PoolTimeout(Exception):
+    """No reader connection became free within the pool timeout"""
+
+
+def sqlite_path(url: str) -> str:
+    """Turn sqlite:///relative/path or sqlite:////absolute/path into a file path"""
+    if not url.startswith('sqlite:///'):
+        raise ValueError(f"Unsupported DATABASE_URL {url!r}, only sqlite:/// URLs are supported")
+    return url[len('sqlite:///'):] or ':memory:'
+
+
+class ConnectionPool:
+    """SQLite connection pool for the event loop.
+
+    Writes go through one writer connection owned by a single thread, so
+    they queue in order instead of fighting over the database lock. Reads
+    run on up to size + max_overflow read-only connections in their own
+    thread pool; with WAL they never wait for the writer. Up to size idle
+    readers are kept, overflow readers are closed after use, and any
+    connection older than recycle seconds is replaced. Each connection
+    keeps statement_cache prepared statements, so repeated queries skip
+    parsing. A reader that can't get a connection within timeout seconds
+    raises PoolTimeout.
+
+    Callables passed to read() and write() receive the connection and run
+    in a worker thread, so the event loop never blocks on the driver.
+    """
+
+    def __init__(self, url: str = Config.DATABASE_URL, size: int = Config.DATABASE_POOL_SIZE,
+                 max_overflow: int = Config.DATABASE_MAX_OVERFLOW, timeout: float = Config.DATABASE_POOL_TIMEOUT,
+                 recycle: float = Config.DATABASE_POOL_RECYCLE, statement_cache: int = 256):
+        self.url = url
+        self.size = max(size, 1)
+        self.max_overflow = max(max_overflow, 0)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.statement_cache = statement_cache
+        self.path: Optional[str] = None
+        self.memory = False
+
+        self.lock = threading.Lock()
+        self.idle: List[Tuple[float, sqlite3.Connection]] = []
+        self.opened = 0
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.readers: Optional[ThreadPoolExecutor] = None
+        self.writer: Optional[ThreadPoolExecutor] = None
+        self.writer_connection: Optional[sqlite3.Connection] = None
+        self.writer_opened = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.writer is not None
+
+    def connect(self, readonly: bool) -> sqlite3.Connection:
+        if self.memory:
+            connection = sqlite3.connect(':memory:', check_same_thread=False, cached_statements=self.statement_cache)
+        elif readonly:
+            connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+                cached_statements=self.statement_cache, timeout=self.timeout
+            )
+        else:
+            connection = sqlite3.connect(
+                self.path, check_same_thread=False, cached_statements=self.statement_cache, timeout=self.timeout
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps the database consistent on power loss with NORMAL, only the last commits may roll back
+            connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return connection
+
+    async def open(self):
+        """Open the writer connection and the thread pools"""
+        if self.is_open:
+            return
+        self.path = sqlite_path(self.url)
+        self.memory = self.path == ':memory:'
+        if not self.memory:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.readers = ThreadPoolExecutor(max_workers=self.size + self.max_overflow, thread_name_prefix='db-reader')
+        self.slots = asyncio.Semaphore(self.size + self.max_overflow)
+        await asyncio.get_running_loop().run_in_executor(self.writer, self.open_writer)
+
+    def open_writer(self):
+        self.writer_connection = self.connect(readonly=False)
+        self.writer_opened = time.monotonic()
+
+    async def close(self):
+        """Let queued work finish, then close every connection"""
+        if not self.is_open:
+            return
+        writer, readers = self.writer, self.readers
+        self.writer = self.readers = None
+        await asyncio.to_thread(readers.shutdown, True)
+        await asyncio.get_running_loop().run_in_executor(writer, self.close_writer)
+        await asyncio.to_thread(writer.shutdown, True)
+        with self.lock:
+            for _, connection in self.idle:
+                connection.close()
+            self.opened -= len(self.idle)
+            self.idle.clear()
+
+    def close_writer(self):
+        if self.writer_connection is not None:
+            self.writer_connection.close()
+            self.writer_connection = None
+
+    def checkout(self) -> Tuple[float, sqlite3.Connection]:
+        """Take an idle reader or open a new one, dropping readers past their recycle age"""
+        now = time.monotonic()
+        with self.lock:
+            while self.idle:
+                opened, connection = self.idle.pop()
+                if now - opened < self.recycle:
+                    return opened, connection
+                connection.close()
+                self.opened -= 1
+            self.opened += 1
+        try:
+            return now, self.connect(readonly=True)
+        except Exception:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    def checkin(self, opened: float, connection: sqlite3.Connection):
+        with self.lock:
+            if self.readers is not None and len(self.idle) < self.size and time.monotonic() - opened < self.recycle:
+                self.idle.append((opened, connection))
+                return
+            self.opened -= 1
+        connection.close()
+
+    def run_read(self, function: Callable[[sqlite3.Connection], T]) -> T:
+        opened, connection = self.checkout()
+        try:
+            return function(connection)
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            self.checkin(opened, connection)
+
+    def run_write(self, function: Callable[[sqlite3.Connection], T]) -> T:
+        if self.writer_connection is None:
+            raise RuntimeError("Database is not initialized")
+        if time.monotonic() - self.writer_opened >= self.recycle:
+            self.close_writer()
+            self.open_writer()
+        try:
+            result = function(self.writer_connection)
+        except BaseException:
+            # A failed callable leaves nothing behind, not even writes it made before failing outside `with connection`
+            if self.writer_connection.in_transaction:
+                self.writer_connection.rollback()
+            raise
+        if self.writer_connection.in_transaction:
+            # Writes a successful callable made outside `with connection` are committed
+            self.writer_connection.commit()
+        return result
+
+    async def read(self, function: Callable[[sqlite3.Connection], T], operation: str = 'read') -> T:
+        """Run function(connection) on a pooled read-only connection"""
+        if self.memory:
+            # A private in-memory database only exists on the writer connection
+            return await self.write(function, operation)
+        if not self.is_open:
+            raise RuntimeError("Database is not initialized")
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"No database connection free after {self.timeout}s") from None
+        try:
+            with DB_QUERY_LATENCY.labels(operation).time():
+                return await asyncio.get_running_loop().run_in_executor(self.readers, self.run_read, function)
+        finally:
+            self.slots.release()
+
+    async def write(self, function: Callable[[sqlite3.Connection], T], operation: str = 'write') -> T:
+        """Run function(connection) on the writer connection, after every write queued before it"""
+        if not self.is_open:
+            raise RuntimeError("Database is not initialized")
+        with DB_QUERY_LATENCY.labels(operation).time():
+            return await asyncio.get_running_loop().run_in_executor(self.writer, self.run_write, function)
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = (), operation: str = 'read') -> Optional[tuple]:
+        return await self.read(lambda connection: connection.execute(sql, params).fetchone(), operation)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = (), operation: str = 'read') -> List[tuple]:
+        return await self.read(lambda connection: connection.execute(sql, params).fetchall(), operation)
+
+    async def execute(self, sql: str, params: Sequence[Any] = (), operation: str = 'write') -> int:
+        """Run one write statement in its own transaction and return the affected row count"""
+        def run(connection: sqlite3.Connection) -> int:
+            with connection:
+                return connection.execute(sql, params).rowcount
+        return await self.write(run, operation)
@@ -0,0 +1,275 @@
+# database/write_behind.py - Coalesced, batched writes for high-volume rows
+import asyncio
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from config import Config
+from database.counters import bump, stats_counters
+from database.models import COUNTED_TABLES, db
+from helpers.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar('T')
+RowKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+
+def row_key(table: str, key: Dict[str, Any]) -> RowKey:
+    return table, tuple(key.items())
+
+
+def row_matches(row: Dict[str, Any], match: Dict[str, Any]) -> bool:
+    return all(row.get(column) == value for column, value in match.items())
+
+
+class Batch:
+    """Writes collected between two flushes"""
+
+    __slots__ = ('upserts', 'increments', 'appends', 'size')
+
+    def __init__(self):
+        # (table, key) -> column values, later writes overwrite earlier ones
+        self.upserts: Dict[RowKey, Dict[str, Any]] = {}
+        # (table, key) -> column -> summed amount
+        self.increments: Dict[RowKey, Dict[str, int]] = {}
+        # table -> rows to insert as they are
+        self.appends: Dict[str, List[Dict[str, Any]]] = {}
+        self.size = 0
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def row(self, table: str, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Buffered column values for a row, or None"""
+        return self.upserts.get(row_key(table, key))
+
+    def increment(self, table: str, key: Dict[str, Any], column: str) -> int:
+        """Buffered amount for a column"""
+        return self.increments.get(row_key(table, key), {}).get(column, 0)
+
+    def appended(self, table: str, match: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Buffered rows for table whose columns equal match"""
+        return [row for row in self.appends.get(table, ()) if row_matches(row, match)]
+
+    def merge_under(self, newer: 'Batch'):
+        """Fold newer writes on top of this batch, used to requeue a failed flush"""
+        for key, values in newer.upserts.items():
+            self.upserts.setdefault(key, {}).update(values)
+        for key, amounts in newer.increments.items():
+            merged = self.increments.setdefault(key, {})
+            for column, amount in amounts.items():
+                merged[column] = merged.get(column, 0) + amount
+        for table, rows in newer.appends.items():
+            self.appends.setdefault(table, []).extend(rows)
+        self.size = (len(self.upserts) + len(self.increments)
+                     + sum(len(rows) for rows in self.appends.values()))
+
+
+def apply_batch(connection: sqlite3.Connection, batch: Batch) -> Dict[str, int]:
+    """Write a batch in one transaction and return the new rows per counted table"""
+    created: Dict[str, int] = {}
+    with connection:
+        # Group rows that share a table and column set so each group is one executemany
+        upserts: Dict[Tuple[str, Tuple[str, ...], Tuple[str, ...]], List[tuple]] = {}
+        for (table, key), values in batch.upserts.items():
+            key_columns = tuple(column for column, _ in key)
+            value_columns = tuple(values)
+            upserts.setdefault((table, key_columns, value_columns), []).append(
+                tuple(value for _, value in key) + tuple(values.values())
+            )
+        for (table, key_columns, value_columns), rows in upserts.items():
+            columns = key_columns + value_columns
+            placeholders = ', '.join('?' * len(columns))
+            inserted = connection.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+            ).rowcount
+            if value_columns:
+                assignments = ', '.join(f"{column} = ?" for column in value_columns)
+                conditions = ' AND '.join(f"{column} = ?" for column in key_columns)
+                width = len(key_columns)
+                connection.executemany(
+                    f"UPDATE {table} SET {assignments} WHERE {conditions}",
+                    [row[width:] + row[:width] for row in rows]
+                )
+            if inserted and table in COUNTED_TABLES:
+                created[table] = created.get(table, 0) + inserted
+
+        for (table, key), amounts in batch.increments.items():
+            key_columns = tuple(column for column, _ in key)
+            columns = key_columns + tuple(amounts)
+            updates = ', '.join(f"{column} = {column} + excluded.{column}" for column in amounts)
+            connection.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}",
+                tuple(value for _, value in key) + tuple(amounts.values())
+            )
+
+        for table, rows in batch.appends.items():
+            groups: Dict[Tuple[str, ...], List[tuple]] = {}
+            for row in rows:
+                groups.setdefault(tuple(row), []).append(tuple(row.values()))
+            for columns, values in groups.items():
+                connection.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values
+                )
+            if table in COUNTED_TABLES:
+                created[table] = created.get(table, 0) + len(rows)
+
+        for table, count in created.items():
+            bump(connection, table, count)
+    return created
+
+
+class WriteBehindBuffer:
+    """Buffer small, frequent writes and commit them in batches.
+
+    Three kinds of writes are coalesced in memory: upserts (last write wins
+    per row key), increments (amounts for the same row key are summed) and
+    appends (plain inserts). The buffer is written in one transaction once
+    it holds max_pending entries or every flush_interval seconds, whichever
+    comes first. Reads of buffered tables go through read(), which returns
+    the batch of writes the query could not see so callers can add it.
+    Deletes must call discard() first so a later flush does not bring the
+    rows back.
+    """
+
+    def __init__(self, max_pending: int = Config.WRITE_BEHIND_MAX_PENDING,
+                 flush_interval: float = Config.WRITE_BEHIND_FLUSH_INTERVAL):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.pending = Batch()
+        self.flushing: Optional[Batch] = None
+        self.flush_lock: Optional[asyncio.Lock] = None
+        self.flush_task: Optional[asyncio.Task] = None
+        self.timer: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_entries = 0
+
+    # ====== WRITES ======
+
+    def upsert(self, table: str, key: Dict[str, Any], values: Dict[str, Any]):
+        """Insert or update one row, keeping only the latest value of each column"""
+        key = row_key(table, key)
+        pending = self.pending.upserts.get(key)
+        if pending is None:
+            self.pending.upserts[key] = dict(values)
+            self.added()
+        else:
+            pending.update(values)
+
+    def increment(self, table: str, key: Dict[str, Any], column: str, amount: int = 1):
+        """Add amount to a column, creating the row if needed"""
+        key = row_key(table, key)
+        amounts = self.pending.increments.get(key)
+        if amounts is None:
+            self.pending.increments[key] = {column: amount}
+            self.added()
+        else:
+            amounts[column] = amounts.get(column, 0) + amount
+
+    def append(self, table: str, row: Dict[str, Any]):
+        """Insert a row that has no key to coalesce on"""
+        self.pending.appends.setdefault(table, []).append(row)
+        self.added()
+
+    def added(self):
+        self.pending.size += 1
+        if self.pending.size >= self.max_pending and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush_in_background())
+
+    def discard(self, table: str, match: Dict[str, Any]):
+        """Drop pending writes to table whose columns equal match, before deleting those rows"""
+        batch = self.pending
+        for entries in (batch.upserts, batch.increments):
+            for key in [key for key in entries if key[0] == table and row_matches(dict(key[1]), match)]:
+                del entries[key]
+                batch.size -= 1
+        rows = batch.appends.get(table)
+        if rows:
+            kept = [row for row in rows if not row_matches(row, match)]
+            batch.size -= len(rows) - len(kept)
+            batch.appends[table] = kept
+
+    # ====== READS ======
+
+    async def read(self, query: Callable[[sqlite3.Connection], T], operation: str = 'read') -> Tuple[T, Batch]:
+        """Run query and return its result with the batch of writes it could not see yet.
+
+        The query runs on the writer connection, so every batch already
+        handed to a flush is committed before it runs and the returned
+        batch holds exactly the writes the result is missing.
+        """
+        batch = self.pending
+        return await db.write(query, operation), batch
+
+    # ====== FLUSHING ======
+
+    async def flush(self):
+        """Commit everything buffered so far in one transaction"""
+        if self.flush_lock is None:
+            self.flush_lock = asyncio.Lock()
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, Batch()
+            self.flushing = batch
+            try:
+                created = await db.write(lambda connection: apply_batch(connection, batch), 'write_behind')
+            except Exception as e:
+                # Keep the writes, the next flush retries them under anything written since
+                logger.error(f"❌ Write-behind flush of {batch.size} entries failed: {e}")
+                batch.merge_under(self.pending)
+                self.pending = batch
+                raise
+            finally:
+                self.flushing = None
+            for table, count in created.items():
+                stats_counters.apply(table, count)
+            self.flushes += 1
+            self.flushed_entries += batch.size
+
+    async def flush_in_background(self):
+        try:
+            await self.flush()
+        except Exception:
+            # Already logged, the writes stay buffered for the next attempt
+            pass
+
+    def start(self):
+        if self.timer is None and self.flush_interval > 0:
+            self.timer = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Stop the timer and flush whatever is left"""
+        if self.timer is not None:
+            self.timer.cancel()
+            try:
+                await self.timer
+            except asyncio.CancelledError:
+                pass
+            self.timer = None
+        if self.flush_task is not None:
+            await self.flush_task
+            self.flush_task = None
+        await self.flush()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_in_background()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'pending': self.pending.size,
+            'flushing': self.flushing.size if self.flushing is not None else 0,
+            'flushes': self.flushes,
+            'flushed_entries': self.flushed_entries,
+        }
+
+
+# Global write-behind buffer
+write_behind = WriteBehindBuffer()
+
+
+async def flush_writes():
+    """Commit every buffered write, e.g. before closing the database"""
+    await write_behind.flush()
@@ -1 +1,68 @@
 # decorators.py - Permission decorators
+from functools import wraps
+from telegram import Update
+from telegram.ext import ContextTypes
+from config import Config
+from admin_cache import admin_cache
+
+
+async def is_user_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Check if the sender of an update may use admin commands in its chat"""
+    chat = update.effective_chat
+    user = update.effective_user
+    message = update.effective_message
+
+    if chat is None or user is None:
+        return False
+    if chat.type == 'private' or user.id in Config.SUDO_USERS:
+        return True
+    # Anonymous admins post as the group itself
+    if message and message.sender_chat and message.sender_chat.id == chat.id:
+        return True
+    return await admin_cache.is_admin(context.bot, chat.id, user.id)
+
+
+def user_admin(func):
+    """Only run the handler for chat admins, sudo users and private chats"""
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        if await is_user_admin(update, context):
+            return await func(update, context, *args, **kwargs)
+        if update.effective_message:
+            await update.effective_message.reply_text("❌ You need to be an admin to use this command.")
+    return wrapper
+
+
+def user_can(permission: str):
+    """Only run the handler for admins holding a specific right, e.g. 'can_restrict_members'"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+            chat = update.effective_chat
+            user = update.effective_user
+            message = update.effective_message
+
+            allowed = (
+                chat is not None and user is not None and (
+                    chat.type == 'private'
+                    or user.id in Config.SUDO_USERS
+                    or (message and message.sender_chat and message.sender_chat.id == chat.id)
+                    or await admin_cache.has_permission(context.bot, chat.id, user.id, permission)
+                )
+            )
+            if allowed:
+                return await func(update, context, *args, **kwargs)
+            if message:
+                await message.reply_text(f"❌ You need the <code>{permission}</code> admin right to do this.", parse_mode='HTML')
+        return wrapper
+    return decorator
+
+
+def sudo_only(func):
+    """Only run the handler for SUDO_USERS, ignoring everyone else silently"""
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        user = update.effective_user
+        if user is not None and user.id in Config.SUDO_USERS:
+            return await func(update, context, *args, **kwargs)
+    return wrapper
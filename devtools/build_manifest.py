@@ -0,0 +1,104 @@
+"""Build the command manifest used by LAZY_LOAD_MODULES.
+
+Imports every module once, records the handlers it registers and writes
+command name -> module mappings to Config.MODULE_MANIFEST_FILE. Re-run this
+whenever a module adds, removes or renames a handler.
+
+    python devtools/build_manifest.py
+"""
+import importlib
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from bot import MODULE_NAMES
+from config import Config
+
+
+class RecordingApplication:
+    """Stand-in for Application that only records registered handlers"""
+
+    def __init__(self):
+        self.handlers = []
+
+    def add_handler(self, handler, group=0):
+        self.handlers.append((group, handler))
+
+    def add_handlers(self, handlers, group=0):
+        if isinstance(handlers, dict):
+            for handler_group, group_handlers in handlers.items():
+                for handler in group_handlers:
+                    self.add_handler(handler, handler_group)
+        else:
+            for handler in handlers:
+                self.add_handler(handler, group)
+
+    def add_error_handler(self, *args, **kwargs):
+        pass
+
+
+def resolve_filter_name(message_filter):
+    """Return the manifest name of a plain filter, or None for combined filters"""
+    name = getattr(message_filter, 'name', '') or ''
+    if not name.startswith('filters.'):
+        return None
+    path = name[len('filters.'):]
+    resolved = filters
+    for part in path.split('.'):
+        resolved = getattr(resolved, part, None)
+        if resolved is None:
+            return None
+    return path
+
+
+def describe_handler(group, handler):
+    """Describe a handler so bot.py can build a matching stub"""
+    if isinstance(handler, CommandHandler):
+        return {'group': group, 'kind': 'command', 'commands': sorted(handler.commands)}
+    if isinstance(handler, CallbackQueryHandler):
+        pattern = handler.pattern
+        if isinstance(pattern, re.Pattern):
+            pattern = pattern.pattern
+        if pattern is not None and not isinstance(pattern, str):
+            # Callable or type patterns can't be serialized, match every callback query instead
+            pattern = None
+        return {'group': group, 'kind': 'callback', 'pattern': pattern}
+    if isinstance(handler, MessageHandler):
+        name = resolve_filter_name(handler.filters)
+        return {'group': group, 'kind': 'message', 'filters': [name or 'ALL']}
+    return {'group': group, 'kind': 'update'}
+
+
+def build_manifest():
+    manifest = {'modules': {}}
+    for module_name in MODULE_NAMES:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            print(f"skipping {module_name}: {e}")
+            continue
+
+        recorder = RecordingApplication()
+        if hasattr(module, 'register_handlers'):
+            module.register_handlers(recorder)
+
+        entry = {'handlers': [describe_handler(group, handler) for group, handler in recorder.handlers]}
+        help_commands = getattr(module, 'COMMANDS', [])
+        try:
+            json.dumps(help_commands)
+            entry['help'] = list(help_commands)
+        except TypeError:
+            print(f"{module_name}: COMMANDS is not JSON serializable, help entries will be missing until it loads")
+        manifest['modules'][module_name] = entry
+    return manifest
+
+
+if __name__ == '__main__':
+    manifest = build_manifest()
+    with open(Config.MODULE_MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"Wrote {len(manifest['modules'])} modules to {Config.MODULE_MANIFEST_FILE}")
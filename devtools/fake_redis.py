@@ -0,0 +1,234 @@
+"""Minimal in-memory Redis stand-in for local runs and tests.
+
+Speaks enough RESP for RedisStateStore: HELLO, PING, GET, MGET, SET (EX,
+PX, NX, XX), DEL, EXISTS, INCR, INCRBY, EXPIRE, PEXPIRE, TTL, PTTL,
+SELECT, FLUSHDB and MULTI/EXEC, over RESP2 or RESP3. Other commands get
+an error reply, which the redis client tolerates for its handshake.
+
+    python -m devtools.fake_redis --port 6379
+    REDIS_URL=redis://127.0.0.1:6379/0 python main.py
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class CommandError(Exception):
+    pass
+
+
+class FakeRedis:
+    """One keyspace served over TCP to any number of clients"""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.port: Optional[int] = None
+        self.commands = 0
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    # ====== PROTOCOL ======
+
+    async def read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command, as typed into telnet
+            return line.strip().split()
+        arguments = []
+        for _ in range(int(line[1:])):
+            header = await reader.readline()
+            length = int(header[1:])
+            arguments.append((await reader.readexactly(length + 2))[:-2])
+        return arguments
+
+    @staticmethod
+    def encode(value, resp3: bool = False) -> bytes:
+        if value is None:
+            return b'_\r\n' if resp3 else b'$-1\r\n'
+        if isinstance(value, bool):
+            return b':1\r\n' if value else b':0\r\n'
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, CommandError):
+            return b'-ERR %s\r\n' % str(value).encode()
+        if isinstance(value, str):
+            return b'+%s\r\n' % value.encode()
+        if isinstance(value, list):
+            return b'*%d\r\n' % len(value) + b''.join(FakeRedis.encode(item, resp3) for item in value)
+        if isinstance(value, dict):
+            return b'%%%d\r\n' % len(value) + b''.join(
+                FakeRedis.encode(key, resp3) + FakeRedis.encode(item, resp3) for key, item in value.items()
+            )
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queued: Optional[List[List[bytes]]] = None
+        resp3 = False
+        try:
+            while True:
+                arguments = await self.read_command(reader)
+                if arguments is None:
+                    break
+                if not arguments:
+                    continue
+                name = arguments[0].upper()
+                if name == b'MULTI':
+                    queued, reply = [], 'OK'
+                elif name == b'EXEC':
+                    if queued is None:
+                        reply = CommandError('EXEC without MULTI')
+                    else:
+                        reply = [self.run(command) for command in queued]
+                        queued = None
+                elif name == b'DISCARD':
+                    queued, reply = None, 'OK'
+                elif queued is not None:
+                    queued.append(arguments)
+                    reply = 'QUEUED'
+                else:
+                    reply = self.run(arguments)
+                    if name == b'HELLO' and isinstance(reply, dict):
+                        resp3 = True
+                writer.write(self.encode(reply, resp3))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # ====== COMMANDS ======
+
+    def lookup(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def run(self, arguments: List[bytes]):
+        self.commands += 1
+        name, arguments = arguments[0].decode().lower(), arguments[1:]
+        handler = getattr(self, f'command_{name}', None)
+        if handler is None:
+            return CommandError(f"unknown command '{name}'")
+        try:
+            return handler(*arguments)
+        except (TypeError, ValueError) as e:
+            return CommandError(str(e))
+
+    def command_ping(self, message: bytes = None):
+        return message if message is not None else 'PONG'
+
+    def command_hello(self, protocol: bytes = b'2', *options: bytes):
+        info = {b'server': b'fake-redis', b'version': b'7.0.0', b'proto': int(protocol)}
+        if int(protocol) == 3:
+            return info
+        return [item for pair in info.items() for item in pair]
+
+    def command_select(self, index: bytes):
+        return 'OK'
+
+    def command_flushdb(self, *options: bytes):
+        self.data.clear()
+        return 'OK'
+
+    def command_get(self, key: bytes):
+        return self.lookup(key)
+
+    def command_mget(self, *keys: bytes):
+        return [self.lookup(key) for key in keys]
+
+    def command_set(self, key: bytes, value: bytes, *options: bytes):
+        expires = None
+        only_if_missing = only_if_exists = False
+        options = list(options)
+        while options:
+            option = options.pop(0).upper()
+            if option == b'EX':
+                expires = time.monotonic() + int(options.pop(0))
+            elif option == b'PX':
+                expires = time.monotonic() + int(options.pop(0)) / 1000
+            elif option == b'NX':
+                only_if_missing = True
+            elif option == b'XX':
+                only_if_exists = True
+            else:
+                raise ValueError(f"unsupported SET option {option.decode()}")
+        exists = self.lookup(key) is not None
+        if (only_if_missing and exists) or (only_if_exists and not exists):
+            return None
+        self.data[key] = (value, expires)
+        return 'OK'
+
+    def command_del(self, *keys: bytes):
+        deleted = 0
+        for key in keys:
+            if self.lookup(key) is not None:
+                del self.data[key]
+                deleted += 1
+        return deleted
+
+    def command_exists(self, *keys: bytes):
+        return sum(1 for key in keys if self.lookup(key) is not None)
+
+    def command_incrby(self, key: bytes, amount: bytes):
+        current = self.lookup(key)
+        value = (int(current) if current is not None else 0) + int(amount)
+        expires = self.data[key][1] if current is not None else None
+        self.data[key] = (str(value).encode(), expires)
+        return value
+
+    def command_incr(self, key: bytes):
+        return self.command_incrby(key, b'1')
+
+    def command_pexpire(self, key: bytes, milliseconds: bytes):
+        current = self.lookup(key)
+        if current is None:
+            return 0
+        self.data[key] = (current, time.monotonic() + int(milliseconds) / 1000)
+        return 1
+
+    def command_expire(self, key: bytes, seconds: bytes):
+        return self.command_pexpire(key, str(int(seconds) * 1000).encode())
+
+    def command_pttl(self, key: bytes):
+        if self.lookup(key) is None:
+            return -2
+        expires = self.data[key][1]
+        return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+
+    def command_ttl(self, key: bytes):
+        milliseconds = self.command_pttl(key)
+        return milliseconds if milliseconds < 0 else milliseconds // 1000
+
+
+async def serve(host: str, port: int):
+    server = FakeRedis()
+    await server.start(host, port)
+    print(f"Fake Redis listening on {host}:{server.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
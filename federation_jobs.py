@@ -0,0 +1,237 @@
+# federation_jobs.py - Background fan-out of federation bans and unbans
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import TelegramError
+from config import Config
+from database.functions import (
+    add_federation_ban, count_federation_chats, create_federation_job, get_federation_chats,
+    get_unfinished_federation_jobs, remove_federation_ban, save_federation_job, supersede_federation_jobs,
+)
+from helpers.logger import get_logger
+from metrics import FEDERATION_ACTIONS
+from ratelimit import PRIORITY_BULK, priority
+
+logger = get_logger(__name__)
+
+ACTIONS = ('ban', 'unban')
+
+
+class FederationJob:
+    """Progress of one federation ban or unban across the federation's chats"""
+
+    def __init__(self, job_id: int, fed_id: str, action: str, user_id: int, reason: Optional[str] = None,
+                 requested_by: Optional[int] = None, report_chat_id: Optional[int] = None,
+                 cursor: Optional[int] = None, total: int = 0, done: int = 0, failed: int = 0, **_):
+        self.job_id = job_id
+        self.fed_id = fed_id
+        self.action = action
+        self.user_id = user_id
+        self.reason = reason
+        self.requested_by = requested_by
+        self.report_chat_id = report_chat_id
+        self.cursor = cursor
+        self.total = total
+        self.done = done
+        self.failed = failed
+        self.status = 'running'
+        self.started_at = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id, 'fed_id': self.fed_id, 'action': self.action, 'user_id': self.user_id,
+            'status': self.status, 'total': self.total, 'done': self.done, 'failed': self.failed,
+        }
+
+
+class FederationJobEngine:
+    """Apply federation bans and unbans to every chat of a federation in the background.
+
+    submit() records the job and returns at once, so the command handler
+    can reply while the job runs. A job walks the federation's chats in
+    pages ordered by chat id, calling the Bot API for up to concurrency
+    chats at a time at bulk priority, so the rate limiter serves admins'
+    interactive commands first. After each page the last chat id is saved
+    as the job's cursor; after a restart start() resumes running jobs from
+    their cursor, repeating at most one page, which is harmless because
+    bans and unbans are idempotent. At most max_running jobs run at once,
+    later ones wait their turn. A new job for a user supersedes the
+    federation's earlier jobs for that user, so an /funban right after an
+    /fban never races it chat by chat; a job running in another worker
+    notices at its next page. The admin who issued the command gets a
+    summary when the job finishes.
+    """
+
+    def __init__(self, concurrency: int = Config.FED_BAN_CONCURRENCY, page_size: int = Config.FED_JOB_PAGE_SIZE,
+                 max_running: int = Config.FED_MAX_RUNNING_JOBS):
+        self.concurrency = max(concurrency, 1)
+        self.page_size = max(page_size, 1)
+        self.max_running = max(max_running, 1)
+        self.bot: Optional[Bot] = None
+        self.worker = 0
+        self.jobs: Dict[int, FederationJob] = {}
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    async def start(self, bot: Bot, worker: int = 0, worker_count: int = 1):
+        """Resume the jobs a previous run of this worker left unfinished"""
+        self.bot = bot
+        self.worker = worker
+        self.slots = asyncio.Semaphore(self.max_running)
+        for row in await get_unfinished_federation_jobs(worker, worker_count):
+            job = FederationJob(**row)
+            logger.info(f"🌐 Resuming federation {job.action} job {job.job_id} ({job.done + job.failed}/{job.total} chats done)")
+            self.launch(job)
+
+    async def stop(self):
+        """Cancel running jobs, they stay marked running and resume from their cursor on the next start"""
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.jobs.clear()
+
+    async def submit(self, fed_id: str, action: str, user_id: int, reason: Optional[str] = None,
+                     requested_by: Optional[int] = None, report_chat_id: Optional[int] = None) -> FederationJob:
+        """Record a federation ban or unban and start applying it to the federation's chats"""
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown federation action {action!r}")
+        if self.bot is None:
+            raise RuntimeError("The federation job engine is not started")
+
+        await self.supersede(fed_id, user_id)
+        # Record the ban first so chats that join while the job runs are covered too
+        if action == 'ban':
+            await add_federation_ban(fed_id, user_id, reason, requested_by)
+        else:
+            await remove_federation_ban(fed_id, user_id)
+
+        total = await count_federation_chats(fed_id)
+        job_id = await create_federation_job(fed_id, action, user_id, reason, requested_by, report_chat_id,
+                                             self.worker, total)
+        job = FederationJob(job_id, fed_id, action, user_id, reason, requested_by, report_chat_id, total=total)
+        logger.info(f"🌐 Federation {action} job {job_id} queued for user {user_id} in {total} chats of {fed_id}")
+        self.launch(job)
+        return job
+
+    async def supersede(self, fed_id: str, user_id: int):
+        """Stop the running and queued jobs for a user in a federation, the newest command wins"""
+        jobs = [job for job in self.jobs.values() if job.fed_id == fed_id and job.user_id == user_id]
+        for job in jobs:
+            job.task.cancel()
+        await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+        for job in jobs:
+            job.status = 'superseded'
+        if await supersede_federation_jobs(fed_id, user_id):
+            logger.info(f"🌐 Superseded earlier federation jobs for user {user_id} in {fed_id}")
+
+    def launch(self, job: FederationJob):
+        self.jobs[job.job_id] = job
+        job.task = asyncio.get_running_loop().create_task(self.run(job))
+
+    async def cancel(self, job_id: int) -> bool:
+        """Stop a job for good, keeping the chats it already covered"""
+        job = self.jobs.get(job_id)
+        if job is None or job.task is None:
+            return False
+        job.task.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+        job.status = 'cancelled'
+        await save_federation_job(job.job_id, job.cursor, job.done, job.failed, job.status)
+        return True
+
+    def get(self, job_id: int) -> Optional[FederationJob]:
+        return self.jobs.get(job_id)
+
+    # ====== RUNNING ======
+
+    async def run(self, job: FederationJob):
+        try:
+            async with self.slots:
+                job.started_at = time.monotonic()
+                with priority(PRIORITY_BULK):
+                    running = await self.fan_out(job)
+                if not running:
+                    job.status = 'stopped'
+                    logger.info(f"🌐 Federation {job.action} job {job.job_id} was superseded or cancelled elsewhere")
+                    return
+                job.status = 'finished'
+                await save_federation_job(job.job_id, job.cursor, job.done, job.failed, job.status)
+                elapsed = time.monotonic() - job.started_at
+                logger.info(
+                    f"✅ Federation {job.action} job {job.job_id} finished: {job.done} chats, "
+                    f"{job.failed} failed, {elapsed:.1f}s"
+                )
+            await self.report(job, elapsed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Left running in the database, the next start retries from the last saved page
+            logger.error(f"❌ Federation {job.action} job {job.job_id} stopped: {e}")
+            job.status = 'error'
+        finally:
+            self.jobs.pop(job.job_id, None)
+
+    async def fan_out(self, job: FederationJob) -> bool:
+        """Walk the federation's chats page by page, saving the cursor after each page.
+
+        Returns False if the job stopped early because its row is no longer running.
+        """
+        limit = asyncio.Semaphore(self.concurrency)
+        while True:
+            chat_ids = await get_federation_chats(job.fed_id, job.cursor, self.page_size)
+            if not chat_ids:
+                return True
+            results = await asyncio.gather(*(self.apply(job, chat_id, limit) for chat_id in chat_ids))
+            succeeded = sum(results)
+            job.done += succeeded
+            job.failed += len(results) - succeeded
+            job.cursor = chat_ids[-1]
+            # Chats that joined after the job started are walked too
+            job.total = max(job.total, job.done + job.failed)
+            if not await save_federation_job(job.job_id, job.cursor, job.done, job.failed):
+                return False
+
+    async def apply(self, job: FederationJob, chat_id: int, limit: asyncio.Semaphore) -> bool:
+        async with limit:
+            try:
+                if job.action == 'ban':
+                    await self.bot.ban_chat_member(chat_id, job.user_id)
+                else:
+                    await self.bot.unban_chat_member(chat_id, job.user_id, only_if_banned=True)
+                FEDERATION_ACTIONS.labels(job.action, 'ok').inc()
+                return True
+            except TelegramError as e:
+                # Typically the bot lost its admin rights or left the chat, there is nothing to retry
+                FEDERATION_ACTIONS.labels(job.action, 'failed').inc()
+                logger.debug(f"Federation {job.action} of {job.user_id} in chat {chat_id} failed: {e}")
+                return False
+
+    async def report(self, job: FederationJob, elapsed: float):
+        """Tell the admin who issued the command how the job went"""
+        if job.report_chat_id is None:
+            return
+        verb = 'banned' if job.action == 'ban' else 'unbanned'
+        text = (
+            f"🌐 <b>Federation {job.action} complete</b>\n\n"
+            f"User <code>{job.user_id}</code> was {verb} in {job.done:,} chats of <code>{job.fed_id}</code>.\n"
+        )
+        if job.failed:
+            text += f"⚠️ {job.failed:,} chats could not be updated, the bot may have lost its admin rights there.\n"
+        text += f"⏱️ Took {elapsed:.0f}s"
+        try:
+            await self.bot.send_message(job.report_chat_id, text, parse_mode=ParseMode.HTML)
+        except TelegramError as e:
+            logger.warning(f"⚠️ Could not report federation job {job.job_id} to chat {job.report_chat_id}: {e}")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [job.snapshot() for job in self.jobs.values()]
+
+
+# Global federation job engine
+federation_jobs = FederationJobEngine()
@@ -0,0 +1,97 @@
+# health.py - Liveness and readiness endpoints
+import asyncio
+import json
+import time
+from typing import Any, Dict
+from config import Config
+from helpers.logger import get_logger
+from http_server import HTTPServer, HTTPRequest, HTTPResponse
+
+logger = get_logger(__name__)
+
+
+class HealthServer:
+    """Serve /healthz (liveness) and /readyz (readiness) for the orchestrator.
+
+    Liveness only proves the event loop still answers requests. Readiness
+    also requires the database to be initialized, the update backlog to be
+    under max_queue_depth and a successful Bot API call within
+    max_api_silence seconds. When the bot has simply been quiet, readiness
+    probes the API with get_me before declaring it unreachable.
+    """
+
+    def __init__(self, bot, port: int = Config.HEALTH_CHECK_PORT, host: str = '0.0.0.0',
+                 max_queue_depth: int = Config.HEALTH_MAX_QUEUE_DEPTH,
+                 max_api_silence: float = Config.HEALTH_MAX_API_SILENCE,
+                 probe_timeout: float = 2.0):
+        self.bot = bot
+        self.max_queue_depth = max_queue_depth
+        self.max_api_silence = max_api_silence
+        self.probe_timeout = probe_timeout
+        self.started_at = time.time()
+        self.http = HTTPServer(host, port, name='health')
+        self.http.route('GET', '/healthz', self.handle_liveness)
+        self.http.route('GET', '/readyz', self.handle_readiness)
+
+    async def start(self):
+        await self.http.start()
+
+    async def stop(self):
+        await self.http.stop()
+
+    async def handle_liveness(self, request: HTTPRequest) -> HTTPResponse:
+        return HTTPResponse(200, 'ok')
+
+    def queue_depth(self) -> int:
+        application = self.bot.application
+        depth = application.update_queue.qsize() if application else 0
+        if self.bot.update_processor is not None:
+            depth += self.bot.update_processor.queue_depth
+        return depth
+
+    def api_silence(self) -> float:
+        limiter = self.bot.rate_limiter
+        if limiter is None or limiter.last_success is None:
+            return float('inf')
+        return time.time() - limiter.last_success
+
+    async def probe_api(self) -> bool:
+        """Make one cheap Bot API call to tell a quiet bot from a cut-off one"""
+        if self.bot.application is None:
+            return False
+        try:
+            await asyncio.wait_for(self.bot.application.bot.get_me(), self.probe_timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Readiness probe of the Bot API failed: {e}")
+            return False
+
+    async def readiness(self) -> Dict[str, Any]:
+        """Evaluate every readiness check"""
+        queue_depth = self.queue_depth()
+        api_silence = self.api_silence()
+        if api_silence > self.max_api_silence and self.bot.db_ready and await self.probe_api():
+            # The probe itself just succeeded
+            api_silence = 0.0
+
+        checks = {
+            'database': self.bot.db_ready,
+            'update_queue': queue_depth <= self.max_queue_depth,
+            'bot_api': api_silence <= self.max_api_silence,
+        }
+        return {
+            'ready': all(checks.values()),
+            'checks': checks,
+            'queue_depth': queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'last_api_success_seconds_ago': None if api_silence == float('inf') else round(api_silence, 3),
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+        }
+
+    async def handle_readiness(self, request: HTTPRequest) -> HTTPResponse:
+        report = await self.readiness()
+        return HTTPResponse(
+            200 if report['ready'] else 503,
+            json.dumps(report),
+            content_type='application/json',
+        )
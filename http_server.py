@@ -0,0 +1,199 @@
+# http_server.py - Minimal asyncio HTTP/1.1 server used by the webhook and monitoring endpoints
+import asyncio
+import ssl
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+from helpers.logger import get_logger
+
+logger = get_logger(__name__)
+
+REASONS = {
+    200: 'OK',
+    204: 'No Content',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    408: 'Request Timeout',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    429: 'Too Many Requests',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HTTPRequest:
+    """A parsed HTTP request"""
+
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path or '/'
+        self.query = parse_qs(parts.query)
+        self.headers = headers
+        self.body = body
+
+
+class HTTPResponse:
+    """An HTTP response returned by route handlers"""
+
+    __slots__ = ('status', 'body', 'content_type', 'headers')
+
+    def __init__(self, status: int = 200, body=b'', content_type: str = 'text/plain; charset=utf-8',
+                 headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    def encode(self, keep_alive: bool) -> bytes:
+        lines = [
+            f"HTTP/1.1 {self.status} {REASONS.get(self.status, 'Unknown')}",
+            f"Content-Type: {self.content_type}",
+            f"Content-Length: {len(self.body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in self.headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + self.body
+
+
+Handler = Callable[[HTTPRequest], Awaitable[HTTPResponse]]
+
+
+class HTTPServer:
+    """Tiny keep-alive HTTP server with exact-path routing.
+
+    Only what Telegram webhooks and metric scrapers need: Content-Length
+    bodies, no chunked uploads, no pipelining guarantees beyond in-order
+    responses on one connection. Once a request line arrives, its headers
+    and body must follow within request_timeout seconds.
+    """
+
+    def __init__(self, host: str, port: int, name: str = 'http', ssl_context: Optional[ssl.SSLContext] = None,
+                 max_body_size: int = 1024 * 1024, idle_timeout: float = 75.0, request_timeout: float = 10.0,
+                 max_headers: int = 100):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.ssl_context = ssl_context
+        self.max_body_size = max_body_size
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.max_headers = max_headers
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, path: str, handler: Handler):
+        """Register a handler for an exact method and path"""
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        """Bind the listening socket"""
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, ssl=self.ssl_context)
+        sockets = self.server.sockets or []
+        if sockets:
+            # Port 0 binds an ephemeral port, expose the real one
+            self.port = sockets[0].getsockname()[1]
+        logger.info(f"🌐 {self.name} server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        """Stop accepting connections and close the listening socket"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            logger.info(f"🌐 {self.name} server stopped")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one connection until it closes or goes idle"""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+                except ValueError:
+                    writer.write(HTTPResponse(400, 'Malformed request line').encode(False))
+                    break
+
+                try:
+                    headers = await asyncio.wait_for(self.read_headers(reader), self.request_timeout)
+                except asyncio.TimeoutError:
+                    writer.write(HTTPResponse(408, 'Request timeout').encode(False))
+                    break
+                if headers is None:
+                    writer.write(HTTPResponse(431, 'Too many headers').encode(False))
+                    break
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                if 'chunked' in headers.get('transfer-encoding', '').lower():
+                    writer.write(HTTPResponse(411, 'Chunked bodies are not supported').encode(False))
+                    break
+                try:
+                    length = int(headers.get('content-length', '0'))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    writer.write(HTTPResponse(400, 'Invalid Content-Length').encode(False))
+                    break
+                if length > self.max_body_size:
+                    writer.write(HTTPResponse(413, 'Payload too large').encode(False))
+                    break
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), self.request_timeout) if length else b''
+                except asyncio.TimeoutError:
+                    writer.write(HTTPResponse(408, 'Request timeout').encode(False))
+                    break
+
+                response = await self.dispatch(HTTPRequest(method.upper(), target, headers, body))
+                writer.write(response.encode(keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"❌ {self.name} server connection error: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def read_headers(self, reader: asyncio.StreamReader) -> Optional[Dict[str, str]]:
+        """Read header lines up to the blank line, None if there are more than max_headers"""
+        headers = {}
+        count = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            count += 1
+            if count > self.max_headers:
+                return None
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def dispatch(self, request: HTTPRequest) -> HTTPResponse:
+        """Route a request to its handler"""
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return HTTPResponse(405, 'Method not allowed')
+            return HTTPResponse(404, 'Not found')
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"❌ {self.name} handler for {request.method} {request.path} failed: {e}")
+            return HTTPResponse(500, 'Internal server error')
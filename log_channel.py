@@ -0,0 +1,192 @@
+# log_channel.py - Batched posting of moderation events to log channels
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, TelegramError
+from config import Config
+from helpers.logger import get_logger
+from metrics import LOG_CHANNEL_EVENTS, LOG_CHANNEL_POSTS
+from ratelimit import PRIORITY_BULK, priority
+
+logger = get_logger(__name__)
+
+SEPARATOR = '\n\n'
+
+
+class LogBuffer:
+    """Events waiting to be posted to one log channel"""
+
+    __slots__ = ('events', 'length', 'lock', 'timer', 'failures')
+
+    def __init__(self):
+        self.events: List[str] = []
+        self.length = 0
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task] = None
+        self.failures = 0
+
+
+class LogChannelSink:
+    """Post moderation events to log channels as combined digest messages.
+
+    Events are buffered per destination and posted together, as many per
+    message as fit in max_length characters, so a busy group costs one
+    post per digest instead of one per event. A buffer is flushed when the
+    next event would not fit, flush_interval seconds after its first event,
+    or at once when an urgent event type arrives (the urgent event goes
+    out with whatever was buffered before it, so the channel stays in
+    order). Posts run at bulk priority and one at a time per channel.
+
+    A post that fails for a transient reason stays buffered for the next
+    flush; a channel the bot can no longer post to is dropped. stop()
+    flushes every buffer, retrying failed posts with backoff for up to
+    stop_timeout seconds, and writes whatever is still unposted to the
+    bot log instead of losing it.
+    """
+
+    def __init__(self, max_length: int = Config.MAX_MESSAGE_LENGTH,
+                 flush_interval: float = Config.LOG_CHANNEL_FLUSH_INTERVAL,
+                 urgent_events: Set[str] = frozenset(Config.LOG_CHANNEL_URGENT_EVENTS), max_failures: int = 5,
+                 stop_timeout: float = Config.LOG_CHANNEL_STOP_TIMEOUT):
+        self.max_length = max_length
+        self.flush_interval = flush_interval
+        self.urgent_events = set(urgent_events)
+        self.max_failures = max_failures
+        self.stop_timeout = stop_timeout
+        self.stopping = False
+        self.bot: Optional[Bot] = None
+        self.buffers: Dict[int, LogBuffer] = {}
+        self.posts = 0
+        self.events = 0
+
+    def start(self, bot: Bot):
+        self.bot = bot
+
+    def log(self, destination: int, text: str, event_type: Optional[str] = None, urgent: bool = False):
+        """Queue an HTML-formatted event for a log channel"""
+        if len(text) > self.max_length:
+            text = text[:self.max_length - 1] + '…'
+        buffer = self.buffers.get(destination)
+        if buffer is None:
+            buffer = self.buffers[destination] = LogBuffer()
+        buffer.events.append(text)
+        buffer.length += len(text) + (len(SEPARATOR) if len(buffer.events) > 1 else 0)
+        self.events += 1
+        LOG_CHANNEL_EVENTS.inc()
+
+        if self.stopping:
+            return
+        if urgent or event_type in self.urgent_events or buffer.length > self.max_length:
+            self.flush_soon(destination, buffer, 0)
+        elif buffer.timer is None:
+            self.flush_soon(destination, buffer, self.flush_interval)
+
+    def flush_soon(self, destination: int, buffer: LogBuffer, delay: float):
+        if buffer.timer is not None:
+            if delay > 0:
+                return
+            buffer.timer.cancel()
+        buffer.timer = asyncio.get_running_loop().create_task(self.flush_later(destination, buffer, delay))
+
+    async def flush_later(self, destination: int, buffer: LogBuffer, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # From here on a new event schedules its own flush, this one may already be posting
+        buffer.timer = None
+        await self.flush(destination)
+
+    @staticmethod
+    def pack(events: List[str], max_length: int) -> List[List[str]]:
+        """Group events into messages of at most max_length characters, keeping their order"""
+        messages: List[List[str]] = []
+        length = 0
+        for event in events:
+            if messages and length + len(SEPARATOR) + len(event) <= max_length:
+                messages[-1].append(event)
+                length += len(SEPARATOR) + len(event)
+            else:
+                messages.append([event])
+                length = len(event)
+        return messages
+
+    async def flush(self, destination: int):
+        """Post everything buffered for one channel"""
+        buffer = self.buffers.get(destination)
+        if buffer is None or self.bot is None:
+            return
+        async with buffer.lock:
+            while buffer.events:
+                events = self.pack(buffer.events, self.max_length)[0]
+                try:
+                    await self.post(destination, SEPARATOR.join(events))
+                except (Forbidden, BadRequest) as e:
+                    logger.warning(f"⚠️ Dropping {len(buffer.events)} log events for channel {destination}: {e}")
+                    buffer.events.clear()
+                    buffer.length = 0
+                    break
+                except TelegramError as e:
+                    buffer.failures += 1
+                    if self.stopping:
+                        # stop() retries until its deadline, a timer would outlive the shutdown
+                        logger.warning(f"⚠️ Log channel {destination} post failed during shutdown: {e}")
+                    elif buffer.failures >= self.max_failures:
+                        logger.error(f"❌ Dropping {len(buffer.events)} log events for channel {destination} after {buffer.failures} failed posts: {e}")
+                        buffer.events.clear()
+                        buffer.length = 0
+                    else:
+                        logger.warning(f"⚠️ Log channel {destination} post failed, retrying on the next flush: {e}")
+                        self.flush_soon(destination, buffer, self.flush_interval)
+                    break
+                buffer.failures = 0
+                del buffer.events[:len(events)]
+                buffer.length = sum(len(event) for event in buffer.events) + len(SEPARATOR) * max(len(buffer.events) - 1, 0)
+            if not buffer.events and buffer.timer is None and self.buffers.get(destination) is buffer:
+                del self.buffers[destination]
+
+    async def post(self, destination: int, text: str):
+        with priority(PRIORITY_BULK):
+            try:
+                await self.bot.send_message(destination, text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+            except BadRequest as e:
+                if "can't parse entities" not in str(e).lower():
+                    raise
+                # A truncated event can cut a tag in half, post the digest as plain text instead
+                await self.bot.send_message(destination, text, disable_web_page_preview=True)
+        self.posts += 1
+        LOG_CHANNEL_POSTS.inc()
+
+    async def flush_all(self):
+        await asyncio.gather(*(self.flush(destination) for destination in list(self.buffers)))
+
+    async def stop(self):
+        """Cancel the timers and post everything still buffered, retrying until stop_timeout"""
+        self.stopping = True
+        start = time.monotonic()
+        deadline = start + self.stop_timeout
+        pending = sum(len(buffer.events) for buffer in self.buffers.values())
+        for buffer in self.buffers.values():
+            if buffer.timer is not None and not buffer.timer.done():
+                buffer.timer.cancel()
+            buffer.timer = None
+
+        delay = 0.5
+        await self.flush_all()
+        while self.buffers and self.bot is not None and time.monotonic() < deadline:
+            await asyncio.sleep(min(delay, deadline - time.monotonic()))
+            delay = min(delay * 2, 5.0)
+            await self.flush_all()
+
+        left = sum(len(buffer.events) for buffer in self.buffers.values())
+        if pending:
+            logger.info(f"📝 Flushed {pending - left} of {pending} buffered log events in {time.monotonic() - start:.1f}s")
+        for destination, buffer in self.buffers.items():
+            logger.error(f"❌ {len(buffer.events)} log events for channel {destination} were not posted before shutdown:")
+            for event in buffer.events:
+                logger.error(f"📝 [{destination}] {event}")
+        self.buffers.clear()
+
+
+# Global log channel sink
+log_channel = LogChannelSink()
@@ -0,0 +1,221 @@
+# logging_config.py - Queue-based logging with a background writer thread
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+from config import Config
+
+# Attributes every LogRecord has, anything else was passed with extra= and goes into JSON output
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'suppressed'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields and the traceback as keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """LOG_FORMAT, noting how many similar lines were suppressed before this one"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        suppressed = getattr(record, 'suppressed', 0)
+        if not suppressed:
+            return super().format(record)
+        message = record.msg
+        record.msg = f"{record.getMessage()} ({suppressed} similar suppressed)"
+        record.args = None
+        try:
+            return super().format(record)
+        finally:
+            record.msg = message
+
+
+class DedupFilter(logging.Filter):
+    """Let at most `burst` warnings or errors per call site through every `window` seconds.
+
+    Log lines are built with f-strings, so the same failure rarely has the
+    same text; records are grouped by where they were logged and by their
+    exception type and the innermost frame of its traceback instead, so
+    different bugs reported through one shared error handler are counted
+    apart. The first record let through after a quiet
+    spell carries the number suppressed before it. Records below WARNING
+    are never held back.
+    """
+
+    def __init__(self, window: float = Config.LOG_DEDUP_WINDOW, burst: int = Config.LOG_DEDUP_BURST,
+                 max_sites: int = 10000):
+        super().__init__()
+        self.window = window
+        self.burst = max(burst, 1)
+        self.max_sites = max_sites
+        self.lock = threading.Lock()
+        # site -> [window start, records let through, records suppressed]
+        self.sites: Dict[Tuple, List] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.window <= 0:
+            return True
+        site = (record.name, record.pathname, record.lineno) + self.error_site(record)
+        now = time.monotonic()
+        with self.lock:
+            state = self.sites.get(site)
+            if state is None or now - state[0] >= self.window:
+                if state is None and len(self.sites) >= self.max_sites:
+                    self.sites.clear()
+                record.suppressed = state[2] if state is not None else 0
+                self.sites[site] = [now, 1, 0]
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                record.suppressed = 0
+                return True
+            state[2] += 1
+            self.suppressed += 1
+            return False
+
+    @staticmethod
+    def error_site(record: logging.LogRecord) -> Tuple:
+        """Exception type and the file and line it was raised at, if the record carries one"""
+        if not record.exc_info or record.exc_info[0] is None:
+            return ()
+        traceback = record.exc_info[2]
+        while traceback is not None and traceback.tb_next is not None:
+            traceback = traceback.tb_next
+        if traceback is None:
+            return (record.exc_info[0].__name__,)
+        return record.exc_info[0].__name__, traceback.tb_frame.f_code.co_filename, traceback.tb_lineno
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Enqueue records for the listener thread, dropping them rather than waiting when the queue is full.
+
+    Only the message text is merged here. Exception tracebacks and the
+    formatter run in the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class ReportingQueueListener(QueueListener):
+    """QueueListener that reports the records dropped on a full queue"""
+
+    def __init__(self, log_queue: queue.Queue, handler: NonBlockingQueueHandler, *handlers: logging.Handler):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = handler
+        self.reported_dropped = 0
+
+    def handle(self, record: logging.LogRecord):
+        dropped = self.queue_handler.dropped
+        if dropped != self.reported_dropped:
+            notice = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                f"⚠️ Log queue full, dropped {dropped - self.reported_dropped} records", None, None
+            )
+            self.reported_dropped = dropped
+            super().handle(notice)
+        super().handle(record)
+
+
+listener: Optional[ReportingQueueListener] = None
+
+
+def log_file_path() -> str:
+    """LOG_FILE, inside logs/ unless it names a directory of its own.
+
+    Child processes (supervisor workers) write to their own file named
+    after the process, e.g. logs/bot.worker-0.log, since rotating one file
+    from several processes loses lines.
+    """
+    path = Config.LOG_FILE if os.path.dirname(Config.LOG_FILE) else os.path.join('logs', Config.LOG_FILE)
+    if multiprocessing.parent_process() is not None:
+        root, extension = os.path.splitext(path)
+        path = f"{root}.{multiprocessing.current_process().name}{extension}"
+    return path
+
+
+def setup_logging():
+    """Route every log record through a bounded queue to one writer thread.
+
+    Log calls on the event loop only filter and enqueue. The listener
+    thread formats (LOG_FORMAT, or JSON with LOG_JSON), writes to the
+    console and to the rotating LOG_FILE. Safe to call more than once.
+    """
+    global listener
+    if listener is not None:
+        return
+
+    formatter = JSONFormatter(datefmt=Config.LOG_DATE_FORMAT) if Config.LOG_JSON else \
+        TextFormatter(Config.LOG_FORMAT, Config.LOG_DATE_FORMAT)
+    handlers: List[logging.Handler] = []
+    if Config.ENABLE_CONSOLE_LOGGING:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    if Config.ENABLE_FILE_LOGGING:
+        path = log_file_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handlers.append(RotatingFileHandler(
+            path, maxBytes=Config.LOG_MAX_SIZE, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(DedupFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO))
+    # One INFO line per Bot API call otherwise
+    if not Config.DEBUG:
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    listener = ReportingQueueListener(log_queue, queue_handler, *handlers)
+    listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out everything still queued and stop the writer thread"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
@@ -4,17 +4,24 @@ import sys
 import signal
 import os
 from datetime import datetime
-from bot import bot
 from helpers.logger import get_logger
 from config import Config
+from logging_config import setup_logging
 from database.models import init_db, close_db
+from database.write_behind import flush_writes
+from supervisor import Supervisor
 import psutil
 
-logger = get_logger(name)
+logger = get_logger(__name__)
 
 class BotManager:
-    def init(self):
+    def __init__(self):
+        # Imported here, not at the top: spawned worker processes (CAPTCHA renderers, bot workers)
+        # re-import this file as __mp_main__ and must not build a TelegramBot or start logging
+        from bot import bot
         self.bot = bot
+        # With several worker processes this process only supervises, each worker runs its own TelegramBot
+        self.supervisor = Supervisor(Config.WORKER_PROCESSES) if Config.WORKER_PROCESSES > 1 else None
         self.start_time = datetime.now()
         self.is_running = False
         
@@ -28,6 +35,11 @@ class BotManager:
             Config.validate()
             logger.info("✅ Configuration validated successfully")
             
+            if self.supervisor:
+                # Workers open the database and set up their bots themselves
+                logger.info(f"🧩 Running as supervisor of {Config.WORKER_PROCESSES} workers")
+                return
+            
             # Initialize database
             logger.info("🗄️ Initializing database...")
             await init_db()
@@ -79,8 +91,11 @@ class BotManager:
             # Setup signal handlers for graceful shutdown
             self.setup_signal_handlers()
             
-            # Start the bot
-            await self.bot.run()
+            # Start the bot, or the workers that run it
+            if self.supervisor:
+                await self.supervisor.run()
+            else:
+                await self.bot.run()
             
         except KeyboardInterrupt:
             logger.info("⌨️ Received keyboard interrupt")
@@ -106,17 +121,25 @@ class BotManager:
         if not self.is_running:
             return
 
-logger.info("🛑 Shutting down bot...")
+        logger.info("🛑 Shutting down bot...")
         self.is_running = False
         
         try:
+            if self.supervisor:
+                # Workers flush and close their own databases
+                logger.info("🔄 Stopping worker processes...")
+                await self.supervisor.stop()
+            
             # Stop the bot application
-            if self.bot.application and self.bot.application.running:
+            elif self.bot.application:
                 logger.info("🔄 Stopping bot application...")
-                await self.bot.application.stop()
-                await self.bot.application.shutdown()
+                await self.bot.stop()
                 logger.info("✅ Bot application stopped")
             
+            # Commit buffered writes while the database is still open
+            logger.info("💾 Flushing buffered database writes...")
+            await flush_writes()
+            
             # Close database connections
             logger.info("🗄️ Closing database connections...")
             await close_db()
@@ -214,10 +237,12 @@ def print_banner():
 
 async def main():
     """Main entry point"""
+    setup_logging()
+
     # Print banner
     print_banner()
 
-try:
+    try:
         # Check requirements first
         if not await check_requirements():
             logger.error("❌ Requirements check failed")
@@ -254,7 +279,7 @@ def run_bot():
         logger.error(f"💥 Application crashed: {e}", exc_info=True)
         sys.exit(1)
 
-if name == "main":
+if __name__ == "__main__":
     # Set up proper exception handling
     sys.excepthook = lambda exc_type, exc_value, exc_traceback: logger.error(
         "Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback)
@@ -262,4 +287,3 @@ if name == "main":
     
     # Run the bot
     run_bot()
-`
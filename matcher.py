@@ -0,0 +1,367 @@
+# matcher.py - Compiled multi-pattern matching for filters and blocklists
+import re
+from collections import deque
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+GLOBAL_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+# Flags that can be scoped to one alternative, verbose mode would comment out the closing parenthesis
+SCOPABLE_FLAGS = set('aimsu')
+MIN_LITERAL_LENGTH = 3
+
+
+def fold(text: str) -> str:
+    """Lowercase text without changing its length, so offsets still point into the original.
+
+    A few characters lowercase to more than one (e.g. 'İ'); those are kept
+    as they are.
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return ''.join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+
+def scoped_flags(pattern: str) -> Optional[str]:
+    """Rewrite leading global flags like (?i) as a scoped group so the pattern can join an alternation.
+
+    Returns None when a flag can't be scoped.
+    """
+    flags, position = '', 0
+    while True:
+        match = GLOBAL_FLAGS.match(pattern, position)
+        if match is None:
+            break
+        flags += match.group(1)
+        position = match.end()
+    if not flags:
+        return pattern
+    if not set(flags) <= SCOPABLE_FLAGS:
+        return None
+    return f"(?{''.join(sorted(set(flags)))}:{pattern[position:]})"
+
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """Longest literal run every match of pattern must contain, if one is easy to find"""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    best, run = '', []
+    for op, value in parsed.data:
+        if op is sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+        if op is sre_parse.AT:
+            # Anchors don't consume characters, so the run continues across them
+            continue
+        if len(run) > len(best):
+            best = ''.join(run)
+        run = []
+        if op is sre_parse.BRANCH:
+            return None
+    if len(run) > len(best):
+        best = ''.join(run)
+    return fold(best) if len(best) >= MIN_LITERAL_LENGTH else None
+
+
+class RegexLiteral:
+    """Automaton key marking a regex trigger's required literal"""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key: Hashable):
+        self.key = key
+
+    def __hash__(self):
+        return hash((RegexLiteral, self.key))
+
+    def __eq__(self, other):
+        return isinstance(other, RegexLiteral) and other.key == self.key
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over lowercase keywords.
+
+    Keywords are inserted into and removed from the trie in place. Failure
+    links are recomputed lazily on the first scan after a change, so a burst
+    of edits costs one rebuild instead of one per edit. Removed keywords
+    leave dead trie nodes behind until they outnumber live keywords, then
+    the trie is compacted.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Dict[Hashable, int]] = [{}]
+        self.output_link: List[int] = [0]
+        self.keywords: Dict[Hashable, str] = {}
+        self.removed = 0
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def add(self, key: Hashable, keyword: str):
+        """Add a keyword, replacing any keyword previously stored under key"""
+        if key in self.keywords:
+            self.remove(key)
+        keyword = fold(keyword)
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append({})
+                self.output_link.append(0)
+            node = next_node
+        self.output[node][key] = len(keyword)
+        self.keywords[key] = keyword
+        self.dirty = True
+
+    def remove(self, key: Hashable):
+        """Remove the keyword stored under key"""
+        keyword = self.keywords.pop(key, None)
+        if keyword is None:
+            return
+        node = 0
+        for char in keyword:
+            node = self.goto[node][char]
+        self.output[node].pop(key, None)
+        self.removed += 1
+        self.dirty = True
+        if self.removed > max(len(self.keywords), 64):
+            self.compact()
+
+    def compact(self):
+        """Rebuild the trie from the live keywords only"""
+        keywords = self.keywords
+        self.reset()
+        for key, keyword in keywords.items():
+            self.add(key, keyword)
+
+    def build(self):
+        """Compute failure and output links breadth-first"""
+        goto, fail, output, output_link = self.goto, self.fail, self.output, self.output_link
+        queue = deque()
+        for node in goto[0].values():
+            fail[node] = 0
+            output_link[node] = 0
+            queue.append(node)
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+                # Nearest proper suffix state that ends a keyword
+                output_link[child] = fail[child] if output[fail[child]] else output_link[fail[child]]
+                queue.append(child)
+        self.dirty = False
+
+    def iter(self, text: str) -> Iterator[Tuple[int, Hashable, int]]:
+        """Yield (end_index, key, keyword_length) for every occurrence in text lowercased by fold()"""
+        if self.dirty:
+            self.build()
+        goto, fail, output, output_link = self.goto, self.fail, self.output, self.output_link
+        root = goto[0]
+        node = 0
+        for index, char in enumerate(text):
+            if node == 0:
+                node = root.get(char, 0)
+                if node == 0:
+                    continue
+            else:
+                while node and char not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(char, 0)
+            state = node
+            while state:
+                if output[state]:
+                    for key, length in output[state].items():
+                        yield index, key, length
+                state = output_link[state]
+
+
+class TriggerMatcher:
+    """All filter or blocklist triggers of one chat, matched in a single pass.
+
+    Plain keywords go into one Aho-Corasick automaton and match as whole
+    words, case-insensitively. Regex triggers with a required literal put
+    that literal into the same automaton and are only searched when it
+    shows up. The remaining regex triggers are merged into one combined
+    alternation, with leading global flags like (?i) rewritten as scoped
+    groups. Patterns that can't be merged (backreferences, named groups,
+    verbose mode) are searched on their own. Because the combined regex finds
+    non-overlapping matches, a merged trigger whose only match overlaps an
+    earlier merged match is not reported.
+    """
+
+    def __init__(self):
+        self.automaton = AhoCorasick()
+        self.keyword_count = 0
+        self.regexes: Dict[Hashable, re.Pattern] = {}
+        self.prefiltered: Dict[Hashable, str] = {}
+        self.standalone: Dict[Hashable, re.Pattern] = {}
+        self.merged: Dict[Hashable, str] = {}
+        self.combined: Optional[re.Pattern] = None
+        self.group_keys: Dict[str, Hashable] = {}
+        self.regex_dirty = False
+
+    def __len__(self) -> int:
+        return self.keyword_count + len(self.regexes)
+
+    def add_keyword(self, key: Hashable, keyword: str):
+        """Add or replace a plain keyword trigger"""
+        self.remove(key)
+        if keyword:
+            self.automaton.add(key, keyword)
+            self.keyword_count += 1
+
+    def add_regex(self, key: Hashable, pattern: str):
+        """Add or replace a regex trigger, raising re.error for invalid patterns"""
+        compiled = re.compile(pattern, re.IGNORECASE)
+        source = None
+        if not (BACKREFERENCE.search(pattern) or compiled.groupindex):
+            source = scoped_flags(pattern)
+        if source is not None:
+            try:
+                # The form it takes in the combined alternation, so it can't fail there later
+                re.compile(f"(?P<t0>{source})|x", re.IGNORECASE)
+            except re.error:
+                source = None
+        self.remove(key)
+        self.regexes[key] = compiled
+
+        literal = required_literal(pattern)
+        if literal is not None:
+            self.prefiltered[key] = literal
+            self.automaton.add(RegexLiteral(key), literal)
+        elif source is None:
+            self.standalone[key] = compiled
+        else:
+            self.merged[key] = source
+            self.regex_dirty = True
+
+    def remove(self, key: Hashable):
+        """Remove a trigger of either kind"""
+        if key in self.automaton.keywords:
+            self.automaton.remove(key)
+            self.keyword_count -= 1
+        if self.regexes.pop(key, None) is not None:
+            if self.prefiltered.pop(key, None) is not None:
+                self.automaton.remove(RegexLiteral(key))
+            elif self.standalone.pop(key, None) is None:
+                del self.merged[key]
+                self.regex_dirty = True
+
+    def build_regex(self):
+        """Merge the regex triggers without a usable literal into one alternation"""
+        alternatives = []
+        self.group_keys = {}
+        for index, (key, source) in enumerate(self.merged.items()):
+            group = f"t{index}"
+            self.group_keys[group] = key
+            alternatives.append(f"(?P<{group}>{source})")
+        self.combined = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+        self.regex_dirty = False
+
+    def scan(self, text: str) -> Dict[Hashable, int]:
+        """Return trigger key -> start offset of its first match"""
+        found: Dict[Hashable, int] = {}
+        if not text:
+            return found
+
+        candidates = set()
+        if len(self.automaton):
+            lowered = fold(text)
+            last = len(lowered) - 1
+            for end, key, length in self.automaton.iter(lowered):
+                if isinstance(key, RegexLiteral):
+                    candidates.add(key.key)
+                    continue
+                if key in found:
+                    continue
+                start = end - length + 1
+                # Whole-word match, unless the keyword itself starts or ends with punctuation
+                if start > 0 and is_word_char(lowered[start]) and is_word_char(lowered[start - 1]):
+                    continue
+                if end < last and is_word_char(lowered[end]) and is_word_char(lowered[end + 1]):
+                    continue
+                found[key] = start
+
+        if self.regexes:
+            for key in candidates:
+                match = self.regexes[key].search(text)
+                if match:
+                    found[key] = match.start()
+            if self.regex_dirty:
+                self.build_regex()
+            if self.combined is not None:
+                for match in self.combined.finditer(text):
+                    key = self.group_keys[match.lastgroup]
+                    if key not in found:
+                        found[key] = match.start()
+            for key, compiled in self.standalone.items():
+                match = compiled.search(text)
+                if match:
+                    found[key] = match.start()
+
+        return found
+
+    def match(self, text: str) -> List[Hashable]:
+        """Trigger keys found in text, in order of first appearance"""
+        found = self.scan(text)
+        return sorted(found, key=found.get)
+
+    def first_match(self, text: str) -> Optional[Hashable]:
+        """The trigger that appears earliest in text, if any"""
+        found = self.scan(text)
+        return min(found, key=found.get) if found else None
+
+
+class TriggerRegistry:
+    """Per-chat matchers, one per trigger kind ('filters', 'blocklist')"""
+
+    def __init__(self):
+        self.matchers: Dict[Tuple[int, str], TriggerMatcher] = {}
+
+    def get(self, chat_id: int, kind: str) -> TriggerMatcher:
+        """Return the chat's matcher, creating an empty one if needed"""
+        matcher = self.matchers.get((chat_id, kind))
+        if matcher is None:
+            matcher = self.matchers[(chat_id, kind)] = TriggerMatcher()
+        return matcher
+
+    def match(self, chat_id: int, kind: str, text: str) -> List[Hashable]:
+        """Match text against a chat's triggers without creating empty matchers"""
+        matcher = self.matchers.get((chat_id, kind))
+        return matcher.match(text) if matcher else []
+
+    def drop(self, chat_id: int, kind: Optional[str] = None):
+        """Forget a chat's matchers, e.g. when the bot leaves the chat"""
+        for key in [key for key in self.matchers if key[0] == chat_id and (kind is None or key[1] == kind)]:
+            del self.matchers[key]
+
+
+# Global trigger registry
+trigger_registry = TriggerRegistry()
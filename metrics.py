@@ -0,0 +1,361 @@
+# metrics.py - In-process metrics registry with a Prometheus text endpoint
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from config import Config
+from helpers.logger import get_logger
+from http_server import HTTPServer, HTTPRequest, HTTPResponse
+
+logger = get_logger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """Base class for a metric family keyed by label values.
+
+    Recording never takes a lock: every sample is recorded from the event
+    loop thread, so a child's counters are only ever touched by one thread.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional['Registry'] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple, object] = {}
+        if not self.labelnames:
+            self.children[()] = self.new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    @abstractmethod
+    def new_child(self):
+        """A fresh child holding the samples of one combination of label values"""
+
+    def labels(self, *values):
+        """Return the child for one combination of label values"""
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children[key] = self.new_child()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self.children.items()):
+            lines.extend(self.render_child(key, child))
+        return lines
+
+    def render_child(self, key: Tuple, child) -> List[str]:
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(child.value)}"]
+
+
+class CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.children[()].inc(amount)
+
+
+class GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from function at scrape time"""
+        self.function = function
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def new_child(self):
+        return GaugeChild()
+
+    def set(self, value: float):
+        self.children[()].set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.children[()].set_function(function)
+
+    def render_child(self, key: Tuple, child) -> List[str]:
+        value = child.value
+        if child.function is not None:
+            try:
+                value = child.function()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+                return []
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"]
+
+
+class HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return HistogramTimer(self)
+
+
+class HistogramTimer:
+    """Context manager observing the elapsed time of a block"""
+
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child: HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional['Registry'] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.children[()].observe(value)
+
+    def render_child(self, key: Tuple, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+            cumulative += count
+            le = f'le="{format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def add_label(sample: str, label: str) -> str:
+    """Insert a rendered label pair into one sample line"""
+    end = min(index for index in (sample.find('{'), sample.find(' ')) if index >= 0)
+    if sample[end] == ' ':
+        return f"{sample[:end]}{{{label}}}{sample[end:]}"
+    separator = '' if sample[end + 1] == '}' else ','
+    return f"{sample[:end + 1]}{label}{separator}{sample[end + 1:]}"
+
+
+def merge_expositions(expositions: Dict[str, str], label: str) -> str:
+    """Merge the expositions of several processes, telling their samples apart by label.
+
+    Each family keeps one HELP/TYPE header and lists the samples of every
+    process under it, so `sum without (label)` gives the combined value.
+    """
+    families: Dict[str, Tuple[List[str], List[str]]] = {}
+    for value, text in expositions.items():
+        extra = f'{label}="{escape_label(value)}"'
+        samples = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith('#'):
+                parts = line.split(' ', 3)
+                if len(parts) >= 3 and parts[1] in ('HELP', 'TYPE'):
+                    header, samples = families.setdefault(parts[2], ([], []))
+                    if len(header) < 2 and line not in header:
+                        header.append(line)
+                continue
+            if samples is None:
+                samples = families.setdefault('', ([], []))[1]
+            samples.append(add_label(line, extra))
+    lines = []
+    for header, samples in families.values():
+        lines.extend(header)
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+# ====== BOT METRICS ======
+UPDATES_TOTAL = Counter('bot_updates_total', 'Updates received')
+UPDATE_QUEUE_DEPTH = Gauge('bot_update_queue_depth', 'Updates waiting in the application and scheduler queues')
+HANDLER_LATENCY = Histogram('bot_handler_latency_seconds', 'Handler run time by module', ['module'])
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Handler exceptions by module', ['module'])
+API_REQUESTS = Counter('bot_api_requests_total', 'Bot API calls by method', ['method'])
+API_LATENCY = Histogram('bot_api_latency_seconds', 'Bot API call latency by method', ['method'])
+API_FLOOD_WAITS = Counter('bot_api_flood_waits_total', 'Bot API 429 responses by method', ['method'])
+API_ERRORS = Counter('bot_api_errors_total', 'Failed Bot API calls by method', ['method'])
+FEDERATION_ACTIONS = Counter('bot_federation_actions_total', 'Per-chat federation bans and unbans by result', ['action', 'result'])
+CAPTCHA_POOL_AVAILABLE = Gauge('bot_captcha_pool_available', 'Pre-rendered CAPTCHA challenges ready to hand out')
+CAPTCHA_POOL_MISSES = Counter('bot_captcha_pool_misses_total', 'CAPTCHA challenges rendered on demand because the pool was empty')
+RAIDS_DETECTED = Counter('bot_raids_detected_total', 'Chats switched into raid mode')
+RAID_ACTIONS = Counter('bot_raid_actions_total', 'Raid lockdown actions on joiners by result', ['action', 'result'])
+LOG_CHANNEL_EVENTS = Counter('bot_log_channel_events_total', 'Events queued for log channels')
+LOG_CHANNEL_POSTS = Counter('bot_log_channel_posts_total', 'Digest messages posted to log channels')
+BACKUPS = Counter('bot_backups_total', 'Database backups by kind and result', ['kind', 'result'])
+BACKUP_LAST_SUCCESS = Gauge('bot_backup_last_success_timestamp', 'Unix time of the last successful backup')
+DB_QUERY_LATENCY = Histogram('bot_db_query_seconds', 'Database query latency by operation', ['operation'])
+EVENT_LOOP_LAG = Histogram(
+    'bot_event_loop_lag_seconds', 'How late the event loop woke up a periodic timer',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+UPTIME = Gauge('bot_uptime_seconds', 'Seconds since the process started')
+
+PROCESS_START = time.time()
+UPTIME.set_function(lambda: time.time() - PROCESS_START)
+
+
+def instrument_callback(callback, module_name: str):
+    """Wrap a handler callback so its run time is recorded under module_name"""
+    latency = HANDLER_LATENCY.labels(module_name)
+    errors = HANDLER_ERRORS.labels(module_name)
+
+    async def instrumented(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+
+    instrumented.__wrapped__ = callback
+    instrumented.__name__ = getattr(callback, '__name__', 'callback')
+    return instrumented
+
+
+class EventLoopLagMonitor:
+    """Measure event loop lag by timing a periodic sleep"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.perf_counter() - start - self.interval)
+            EVENT_LOOP_LAG.observe(self.last_lag)
+
+
+class MetricsServer:
+    """Serve REGISTRY in the Prometheus text format on /metrics"""
+
+    def __init__(self, port: int = Config.METRICS_PORT, host: str = '0.0.0.0', registry: Registry = REGISTRY):
+        self.registry = registry
+        self.lag_monitor = EventLoopLagMonitor()
+        self.http = HTTPServer(host, port, name='metrics')
+        self.http.route('GET', '/metrics', self.handle_metrics)
+
+    async def start(self):
+        await self.http.start()
+        self.lag_monitor.start()
+
+    async def stop(self):
+        await self.lag_monitor.stop()
+        await self.http.stop()
+
+    async def handle_metrics(self, request: HTTPRequest) -> HTTPResponse:
+        return HTTPResponse(200, self.registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,247 @@
+# profiler.py - Per-handler timing and an on-demand sampling profiler
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from config import Config
+from helpers.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TimingStats:
+    """Calls, wall-clock and CPU time of one handler or Bot API method"""
+
+    __slots__ = ('calls', 'wall', 'cpu', 'max_wall', 'errors')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.errors = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls, 'wall': self.wall, 'cpu': self.cpu, 'max_wall': self.max_wall, 'errors': self.errors,
+            'average_wall': self.wall / self.calls if self.calls else 0.0,
+            'average_cpu': self.cpu / self.calls if self.calls else 0.0,
+        }
+
+
+class Timed:
+    """Await a coroutine while adding the CPU time of each of its steps to stats.
+
+    Wall-clock time runs from the first step to the result. CPU time only
+    counts the event loop thread's time while this coroutine is the one
+    running, so handlers that await each other's I/O are not charged for
+    it.
+    """
+
+    __slots__ = ('coroutine', 'stats')
+
+    def __init__(self, coroutine: Awaitable, stats: TimingStats):
+        self.coroutine = coroutine
+        self.stats = stats
+
+    def __await__(self):
+        stats = self.stats
+        inner = self.coroutine.__await__()
+        start = time.perf_counter()
+        cpu = 0.0
+        value, error = None, None
+        try:
+            while True:
+                step = time.thread_time()
+                try:
+                    yielded = inner.throw(error) if error is not None else inner.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    cpu += time.thread_time() - step
+                try:
+                    value, error = (yield yielded), None
+                except BaseException as e:
+                    value, error = None, e
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            if wall > stats.max_wall:
+                stats.max_wall = wall
+
+
+def source_roots() -> List[str]:
+    """Import roots, longest first, so frame paths can be shown relative to them"""
+    roots = {os.path.abspath(path or os.getcwd()) for path in sys.path if os.path.isdir(path or os.getcwd())}
+    return sorted((root.rstrip(os.sep) + os.sep for root in roots), key=len, reverse=True)
+
+
+def frame_label(code, roots: List[str]) -> str:
+    """Function name and its file relative to the import root it was loaded from"""
+    path = code.co_filename
+    for root in roots:
+        if path.startswith(root):
+            path = path[len(root):]
+            break
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(';', ':')
+
+
+class Profiler:
+    """Time handlers and Bot API calls, and sample the event loop thread on demand.
+
+    With enabled set, wrap_handler() and measure() record the calls,
+    wall-clock and CPU time of every handler and every Bot API method.
+    capture() samples the event loop thread's stack every sample_interval
+    seconds for a fixed time from a separate thread, and writes the
+    samples as collapsed stacks (one "frame;frame;frame count" line per
+    distinct stack, the input of flamegraph.pl and speedscope) to
+    directory, along with the timing table.
+    """
+
+    def __init__(self, enabled: bool = Config.ENABLE_PROFILING, directory: str = Config.PROFILE_DIR,
+                 sample_interval: float = Config.PROFILE_SAMPLE_INTERVAL,
+                 default_duration: float = Config.PROFILE_DURATION, max_duration: float = Config.PROFILE_MAX_DURATION):
+        self.enabled = enabled
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.default_duration = default_duration
+        self.max_duration = max_duration
+        self.handlers: Dict[str, TimingStats] = {}
+        self.api_methods: Dict[str, TimingStats] = {}
+        self.capturing: Optional[asyncio.Task] = None
+        self.last_capture: Optional[str] = None
+
+    # ====== TIMING ======
+
+    def wrap_handler(self, callback, name: str):
+        """Wrap a handler callback so its time is recorded under name"""
+        stats = self.handlers.setdefault(name, TimingStats())
+
+        async def profiled(update, context):
+            return await Timed(callback(update, context), stats)
+
+        profiled.__wrapped__ = callback
+        profiled.__name__ = getattr(callback, '__name__', 'callback')
+        return profiled
+
+    def measure(self, method: str, coroutine: Awaitable) -> Awaitable:
+        """Record the time of one Bot API call"""
+        stats = self.api_methods.get(method)
+        if stats is None:
+            stats = self.api_methods[method] = TimingStats()
+        return Timed(coroutine, stats)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'handlers': {name: stats.as_dict() for name, stats in self.handlers.items() if stats.calls},
+            'api_methods': {name: stats.as_dict() for name, stats in self.api_methods.items()},
+            'capturing': self.capturing is not None,
+            'last_capture': self.last_capture,
+        }
+
+    def reset(self):
+        for stats in list(self.handlers.values()) + list(self.api_methods.values()):
+            stats.__init__()
+
+    def timing_table(self, limit: Optional[int] = None) -> List[str]:
+        """Handlers and API methods by CPU time, as aligned text lines"""
+        rows: List[Tuple[str, TimingStats]] = [(f"handler {name}", stats) for name, stats in self.handlers.items() if stats.calls]
+        rows += [(f"api {name}", stats) for name, stats in self.api_methods.items()]
+        rows.sort(key=lambda row: row[1].cpu, reverse=True)
+        lines = [f"{'name':<48} {'calls':>8} {'cpu s':>9} {'wall s':>9} {'avg ms':>8} {'max ms':>8} {'errors':>6}"]
+        for name, stats in rows[:limit]:
+            lines.append(
+                f"{name[:48]:<48} {stats.calls:>8} {stats.cpu:>9.3f} {stats.wall:>9.3f} "
+                f"{stats.wall / stats.calls * 1000:>8.1f} {stats.max_wall * 1000:>8.1f} {stats.errors:>6}"
+            )
+        return lines
+
+    # ====== SAMPLING ======
+
+    def sample(self, thread_id: int, duration: float) -> Tuple[Counter, int]:
+        """Sample one thread's stack until duration has passed, runs in its own thread"""
+        stacks: Counter = Counter()
+        labels: Dict[Any, str] = {}
+        roots = source_roots()
+        samples = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = frame_label(code, roots)
+                names.append(label)
+                frame = frame.f_back
+            del frame
+            stacks[';'.join(reversed(names))] += 1
+            samples += 1
+            time.sleep(self.sample_interval)
+        return stacks, samples
+
+    def write_profile(self, stacks: Counter, samples: int, duration: float) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f"profile-{stamp}-{os.getpid()}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(path[:-len('.folded')] + '-timings.txt', 'w', encoding='utf-8') as f:
+            f.write(f"# {samples} samples over {duration:g}s every {self.sample_interval * 1000:g}ms, pid {os.getpid()}\n")
+            f.write('\n'.join(self.timing_table()) + '\n')
+        return path
+
+    async def capture(self, duration: Optional[float] = None) -> str:
+        """Sample the event loop for duration seconds and return the path of the collapsed-stack file"""
+        if self.capturing is not None:
+            raise RuntimeError("A profile is already being captured")
+        duration = min(max(duration or self.default_duration, 1), self.max_duration)
+        self.capturing = asyncio.current_task()
+        try:
+            logger.info(f"🔬 Sampling the event loop for {duration:g}s")
+            stacks, samples = await asyncio.to_thread(self.sample, threading.get_ident(), duration)
+            path = await asyncio.to_thread(self.write_profile, stacks, samples, duration)
+        finally:
+            self.capturing = None
+        self.last_capture = path
+        logger.info(f"🔬 Wrote {samples} samples ({len(stacks)} distinct stacks) to {path}")
+        return path
+
+    def capture_in_background(self):
+        """Start a capture of the default duration unless one is running, e.g. from a signal handler"""
+        if self.capturing is not None:
+            logger.warning("⚠️ Profile already being captured, ignoring the request")
+            return
+        asyncio.get_running_loop().create_task(self.capture()).add_done_callback(self.capture_done)
+
+    @staticmethod
+    def capture_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Profile capture failed: {task.exception()}")
+
+    def install_signal_handler(self):
+        """Capture a profile on SIGUSR2, where the platform has it"""
+        if not hasattr(signal, 'SIGUSR2'):
+            return
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, self.capture_in_background)
+            logger.info(f"🔬 Profiling enabled, send SIGUSR2 to pid {os.getpid()} for a {self.default_duration:g}s profile")
+        except (NotImplementedError, RuntimeError) as e:
+            logger.warning(f"⚠️ Could not install the SIGUSR2 profile handler: {e}")
+
+
+# Global profiler
+profiler = Profiler()
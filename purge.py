@@ -0,0 +1,211 @@
+# purge.py - Bulk message deletion for /purge and /del
+import asyncio
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+from telegram import Bot, Message
+from telegram.error import BadRequest, TelegramError
+from config import Config
+from helpers.logger import get_logger
+from ratelimit import PRIORITY_BULK, PRIORITY_INTERACTIVE, priority
+
+logger = get_logger(__name__)
+
+# Bot API limit for one deleteMessages call
+MAX_DELETE_BATCH = 100
+
+
+class DeletedMessages:
+    """Message ids known to be deleted, kept per chat as merged, sorted ranges.
+
+    Purges delete contiguous ranges, so a chat's history of purges costs a
+    handful of (first, last) pairs rather than one entry per message. The
+    least recently purged chats are forgotten beyond max_chats.
+    """
+
+    def __init__(self, max_chats: int = 10000, max_ranges: int = 256):
+        self.max_chats = max_chats
+        self.max_ranges = max_ranges
+        self.chats: 'OrderedDict[int, Tuple[List[int], List[int]]]' = OrderedDict()
+
+    def contains(self, chat_id: int, message_id: int) -> bool:
+        ranges = self.chats.get(chat_id)
+        if ranges is None:
+            return False
+        starts, ends = ranges
+        index = bisect_right(starts, message_id) - 1
+        return index >= 0 and message_id <= ends[index]
+
+    def add(self, chat_id: int, message_ids: Iterable[int]):
+        """Record deleted ids, merging them into the chat's ranges"""
+        pairs = []
+        for message_id in sorted(set(message_ids)):
+            if pairs and message_id == pairs[-1][1] + 1:
+                pairs[-1][1] = message_id
+            else:
+                pairs.append([message_id, message_id])
+        if not pairs:
+            return
+
+        starts, ends = self.chats.pop(chat_id, ([], []))
+        pairs.extend([start, end] for start, end in zip(starts, ends))
+        pairs.sort()
+        merged: List[List[int]] = []
+        for start, end in pairs:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        # Old purges matter least, drop the lowest ranges first
+        merged = merged[-self.max_ranges:]
+        self.chats[chat_id] = ([start for start, _ in merged], [end for _, end in merged])
+        while len(self.chats) > self.max_chats:
+            self.chats.popitem(last=False)
+
+    def forget(self, chat_id: int):
+        self.chats.pop(chat_id, None)
+
+
+class PurgeResult:
+    """Outcome of one purge"""
+
+    __slots__ = ('requested', 'skipped', 'deleted', 'failed', 'calls', 'elapsed')
+
+    def __init__(self, requested: int = 0, skipped: int = 0):
+        self.requested = requested
+        self.skipped = skipped
+        self.deleted = 0
+        self.failed = 0
+        self.calls = 0
+        self.elapsed = 0.0
+
+
+class Purger:
+    """Delete messages in deleteMessages batches of up to 100 ids.
+
+    Ids already known to be gone are skipped, the rest are sorted, split
+    into batches and deleted with at most concurrency calls in flight, at
+    bulk priority so the rate limiter serves interactive commands first.
+    A batch that fails is retried one message at a time, since a single
+    undeletable message (too old, or not sent by the bot in a channel)
+    fails the whole call. Progress goes into one status message, edited
+    at most every status_interval seconds.
+    """
+
+    def __init__(self, concurrency: int = Config.PURGE_CONCURRENCY,
+                 status_interval: float = Config.PURGE_STATUS_INTERVAL):
+        self.concurrency = max(concurrency, 1)
+        self.status_interval = status_interval
+        self.deleted = DeletedMessages()
+
+    def pending_ids(self, chat_id: int, message_ids: Iterable[int]) -> List[int]:
+        """Sorted, unique ids not known to be deleted"""
+        return [message_id for message_id in sorted(set(message_ids)) if not self.deleted.contains(chat_id, message_id)]
+
+    @staticmethod
+    def batches(message_ids: List[int], size: int = MAX_DELETE_BATCH) -> List[List[int]]:
+        return [message_ids[index:index + size] for index in range(0, len(message_ids), size)]
+
+    async def purge(self, bot: Bot, chat_id: int, message_ids: Iterable[int],
+                    status_message: Optional[Message] = None) -> PurgeResult:
+        """Delete message_ids from a chat, reporting progress in status_message"""
+        start = time.perf_counter()
+        message_ids = set(message_ids)
+        if status_message is not None:
+            message_ids.discard(status_message.message_id)
+        pending = self.pending_ids(chat_id, message_ids)
+        result = PurgeResult(len(message_ids), len(message_ids) - len(pending))
+        limit = asyncio.Semaphore(self.concurrency)
+        progress = PurgeProgress(status_message, len(pending), self.status_interval)
+
+        async def delete_batch(batch: List[int]):
+            async with limit:
+                deleted = await self.delete_batch(bot, chat_id, batch, result)
+            progress.advance(deleted, len(batch) - deleted)
+
+        with priority(PRIORITY_BULK):
+            await asyncio.gather(*(delete_batch(batch) for batch in self.batches(pending)))
+        result.elapsed = time.perf_counter() - start
+        await progress.finish(result)
+        logger.info(
+            f"🧹 Purged {result.deleted} messages in chat {chat_id} with {result.calls} calls in {result.elapsed:.1f}s "
+            f"({result.skipped} already gone, {result.failed} failed)"
+        )
+        return result
+
+    async def purge_range(self, bot: Bot, chat_id: int, first_id: int, last_id: int,
+                          status_message: Optional[Message] = None) -> PurgeResult:
+        """Delete every message from first_id to last_id, both included"""
+        return await self.purge(bot, chat_id, range(first_id, last_id + 1), status_message)
+
+    async def delete_batch(self, bot: Bot, chat_id: int, batch: List[int], result: PurgeResult) -> int:
+        """Delete one batch, returning how many of its messages are now gone"""
+        result.calls += 1
+        try:
+            # Ids that no longer exist are skipped by the Bot API, not reported as errors
+            await bot.delete_messages(chat_id, batch)
+            self.deleted.add(chat_id, batch)
+            result.deleted += len(batch)
+            return len(batch)
+        except BadRequest as e:
+            if len(batch) == 1:
+                result.failed += 1
+                return 0
+            logger.debug(f"Bulk delete of {len(batch)} messages in chat {chat_id} failed ({e}), retrying one by one")
+        except TelegramError as e:
+            logger.warning(f"⚠️ Bulk delete of {len(batch)} messages in chat {chat_id} failed: {e}")
+            result.failed += len(batch)
+            return 0
+
+        deleted = 0
+        for message_id in batch:
+            deleted += await self.delete_batch(bot, chat_id, [message_id], result)
+        return deleted
+
+
+class PurgeProgress:
+    """Edit one status message as batches complete, without an edit per batch"""
+
+    def __init__(self, message: Optional[Message], total: int, interval: float):
+        self.message = message
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.last_edit = time.monotonic()
+        self.editing: Optional[asyncio.Task] = None
+
+    def advance(self, deleted: int, failed: int):
+        self.done += deleted
+        self.failed += failed
+        if self.message is None or self.done + self.failed >= self.total:
+            return
+        now = time.monotonic()
+        if now - self.last_edit >= self.interval and (self.editing is None or self.editing.done()):
+            self.last_edit = now
+            self.editing = asyncio.get_running_loop().create_task(
+                self.edit(f"🧹 Purging... {self.done + self.failed:,}/{self.total:,} messages")
+            )
+
+    async def finish(self, result: PurgeResult):
+        if self.message is None:
+            return
+        if self.editing is not None:
+            await self.editing
+        text = f"✅ Purged {result.deleted:,} messages in {result.elapsed:.1f}s"
+        if result.failed:
+            text += f"\n⚠️ {result.failed:,} could not be deleted, they may be older than 48 hours"
+        await self.edit(text)
+
+    async def edit(self, text: str):
+        try:
+            # Progress is what the admin is watching, let it overtake the deletes
+            with priority(PRIORITY_INTERACTIVE):
+                await self.message.edit_text(text)
+        except TelegramError as e:
+            logger.debug(f"Purge status edit failed: {e}")
+
+
+# Global purger
+purger = Purger()
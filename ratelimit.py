@@ -0,0 +1,297 @@
+# ratelimit.py - Outbound Bot API rate governor
+import asyncio
+import contextvars
+import heapq
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import Config
+from helpers.logger import get_logger
+from metrics import API_ERRORS, API_FLOOD_WAITS, API_LATENCY, API_REQUESTS
+from profiler import profiler
+
+logger = get_logger(__name__)
+
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_DEFAULT: 'default', PRIORITY_BULK: 'bulk'}
+
+# Calls that must never wait behind chat traffic
+EXEMPT_ENDPOINTS = frozenset({
+    'getUpdates', 'getMe', 'setWebhook', 'deleteWebhook', 'getWebhookInfo', 'logOut', 'close',
+})
+# Telegram's per-chat limits apply to messages posted into the chat
+CHAT_LIMITED_PREFIXES = ('send', 'forward', 'copy')
+
+request_priority: contextvars.ContextVar = contextvars.ContextVar('request_priority', default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Tag every Bot API call made inside the block (and tasks it starts) with a priority"""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on the library version"""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of polling for tokens"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available"""
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, now: float) -> float:
+        """Take a token, possibly on credit, and return how long to wait before using it"""
+        self.refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def penalize(self, now: float, seconds: float):
+        """Drain the bucket so the next reservation waits at least `seconds`"""
+        self.refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class PriorityRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """Token-bucket governor for every outbound Bot API call.
+
+    Calls first wait for their chat's bucket (only message-posting
+    endpoints; groups get CHAT_RATE_LIMIT_PER_MINUTE with the whole
+    minute's allowance as burst, private chats PRIVATE_RATE_LIMIT_PER_SECOND
+    with three seconds' worth), then queue for the global bucket
+    (GLOBAL_RATE_LIMIT_PER_SECOND with GLOBAL_RATE_LIMIT_BURST). The global
+    queue is served by priority, so interactive replies overtake bulk work
+    such as federation bans, log posts and purges.
+
+    Priority comes from rate_limit_args={'priority': ...} or from the
+    priority() context manager. A RetryAfter on a message-posting call
+    pauses that chat, on any other call it pauses all traffic, for the
+    requested time and the call is retried up to max_retries times.
+
+    With enabled=False calls are not throttled but are still counted and
+    timed per method.
+
+    At most max_tracked_chats chat buckets are kept, least recently used
+    first out, except buckets still waiting out a flood wait or a
+    reservation, which are kept until they are rested.
+    """
+
+    def __init__(self, enabled: bool = True, rate: float = Config.GLOBAL_RATE_LIMIT_PER_SECOND,
+                 burst: float = Config.GLOBAL_RATE_LIMIT_BURST,
+                 group_rate: float = Config.CHAT_RATE_LIMIT_PER_MINUTE / 60,
+                 group_burst: float = Config.CHAT_RATE_LIMIT_PER_MINUTE,
+                 private_rate: float = Config.PRIVATE_RATE_LIMIT_PER_SECOND,
+                 max_retries: int = 3, max_tracked_chats: int = 50000):
+        self.enabled = enabled
+        self.global_bucket = TokenBucket(rate, max(burst, 1))
+        self.group_rate = group_rate
+        self.group_burst = max(group_burst, 1)
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self.max_tracked_chats = max_tracked_chats
+        self.chat_buckets: 'OrderedDict[int, TokenBucket]' = OrderedDict()
+        self.queue: List[tuple] = []
+        self.sequence = 0
+        self.paused_until = 0.0
+        self.wakeup: Optional[asyncio.Event] = None
+        self.dispatcher: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.queued = {level: 0 for level in PRIORITY_NAMES}
+        self.requests = 0
+        self.throttled = 0
+        self.retry_after_count = 0
+        self.failures = 0
+        self.total_wait = 0.0
+        self.last_success: Optional[float] = None
+
+    async def initialize(self) -> None:
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.get_running_loop().create_task(self.dispatch())
+
+    async def shutdown(self) -> None:
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            try:
+                await self.dispatcher
+            except asyncio.CancelledError:
+                pass
+            self.dispatcher = None
+        # Let anything still queued through rather than leaving callers hanging
+        for _, _, _, waiter in self.queue:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.queue.clear()
+
+    def chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Negative ids are groups and channels, positive ids are private chats
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, max(self.private_rate * 3, 1))
+            self.chat_buckets[chat_id] = bucket
+            if len(self.chat_buckets) > self.max_tracked_chats:
+                self.evict_chat_buckets(time.monotonic())
+        else:
+            self.chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def evict_chat_buckets(self, now: float, budget: int = 16):
+        """Drop the least recently used buckets over max_tracked_chats, looking at most at budget of them.
+
+        A bucket that still has to wait for a token is kept, dropping it
+        would lift a flood wait penalty or hand the chat a fresh burst.
+        """
+        for _ in range(budget):
+            if len(self.chat_buckets) <= self.max_tracked_chats:
+                return
+            chat_id, bucket = next(iter(self.chat_buckets.items()))
+            if bucket.delay(now) > 0:
+                self.chat_buckets.move_to_end(chat_id)
+            else:
+                del self.chat_buckets[chat_id]
+
+    async def acquire(self, level: int):
+        """Wait for a global token, served in priority order"""
+        now = time.monotonic()
+        if not self.queue and now >= self.paused_until and self.global_bucket.delay(now) == 0:
+            self.global_bucket.tokens -= 1
+            return
+
+        self.throttled += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self.sequence += 1
+        heapq.heappush(self.queue, (level, self.sequence, now, waiter))
+        self.queued[level] = self.queued.get(level, 0) + 1
+        self.wakeup.set()
+        try:
+            await waiter
+        finally:
+            self.queued[level] -= 1
+
+    async def dispatch(self):
+        """Release queued requests as global tokens become available"""
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            delay = self.global_bucket.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, enqueued_at, waiter = heapq.heappop(self.queue)
+            if waiter.done():
+                # The caller gave up while queued
+                continue
+            self.global_bucket.tokens -= 1
+            self.total_wait += now - enqueued_at
+            waiter.set_result(None)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        if endpoint in EXEMPT_ENDPOINTS:
+            result = await callback(*args, **kwargs)
+            # Polling keeps this fresh, which is what the readiness check relies on
+            self.last_success = time.time()
+            return result
+
+        level = (rate_limit_args or {}).get('priority', request_priority.get())
+        chat_id = data.get('chat_id')
+        chat_limited = self.enabled and isinstance(chat_id, int) and endpoint.startswith(CHAT_LIMITED_PREFIXES)
+
+        for attempt in range(self.max_retries + 1):
+            if chat_limited:
+                delay = self.chat_bucket(chat_id).reserve(time.monotonic())
+                if delay > 0:
+                    self.throttled += 1
+                    self.total_wait += delay
+                    await asyncio.sleep(delay)
+            if self.enabled:
+                await self.acquire(level)
+
+            self.requests += 1
+            API_REQUESTS.labels(endpoint).inc()
+            start = time.perf_counter()
+            try:
+                request = callback(*args, **kwargs)
+                result = await (profiler.measure(endpoint, request) if profiler.enabled else request)
+                self.last_success = time.time()
+                return result
+            except RetryAfter as e:
+                self.retry_after_count += 1
+                API_FLOOD_WAITS.labels(endpoint).inc()
+                seconds = retry_after_seconds(e)
+                logger.warning(f"⏳ Flood wait of {seconds:.1f}s on {endpoint} (chat {chat_id}), attempt {attempt + 1}")
+                if attempt == self.max_retries:
+                    self.failures += 1
+                    raise
+                # The next attempt waits out the flood wait in the chat bucket or the global pause
+                if chat_limited:
+                    self.chat_bucket(chat_id).penalize(time.monotonic(), seconds)
+                else:
+                    self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+                    if not self.enabled:
+                        await asyncio.sleep(seconds)
+            except Exception:
+                API_ERRORS.labels(endpoint).inc()
+                raise
+            finally:
+                API_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue and throttling metrics"""
+        return {
+            'queue_depth': len(self.queue),
+            'queued_by_priority': {PRIORITY_NAMES.get(level, str(level)): count for level, count in self.queued.items()},
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'retry_after': self.retry_after_count,
+            'failures': self.failures,
+            'average_wait': self.total_wait / self.throttled if self.throttled else 0.0,
+            'paused_for': max(0.0, self.paused_until - time.monotonic()),
+            'tracked_chats': len(self.chat_buckets),
+            'last_success': self.last_success,
+        }
@@ -0,0 +1,210 @@
+# scheduler.py - Per-chat ordered concurrent update processing
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, Hashable, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from metrics import UPDATES_TOTAL
+
+
+class ChatWaitStats:
+    """Wait-time bookkeeping for one chat"""
+
+    __slots__ = ('count', 'total_wait', 'max_wait', 'last_wait')
+
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def record(self, wait: float):
+        self.count += 1
+        self.total_wait += wait
+        self.last_wait = wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.count if self.count else 0.0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates from different chats concurrently, updates from one chat in order.
+
+    The application starts one task per update in arrival order. Each task
+    chains itself behind the previous update of the same chat before taking
+    one of the max_concurrent_updates slots, so a slow chat only delays its
+    own backlog and never holds slots while it waits. Updates without a chat
+    are ordered per user, and updates with neither run unordered.
+
+    PTB's process_update() wraps do_process_update() in a semaphore of
+    max_concurrent_updates, so that is sized to max_pending_updates and
+    never binds: the chaining and the concurrency limit live in
+    do_process_update() with a semaphore of this class's own.
+
+    The application doesn't wait for those tasks, so on its own nothing
+    stops it from emptying the update queue into them. Fed through an
+    AdmissionQueue, at most max_pending_updates updates are taken off the
+    queue and not yet finished; beyond that the queue fills up and
+    producers wait.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: Optional[int] = None,
+                 max_tracked_chats: int = 10000):
+        self.max_pending_updates = max(max_pending_updates or max_concurrent_updates * 4, max_concurrent_updates)
+        super().__init__(self.max_pending_updates)
+        self.concurrency = max_concurrent_updates
+        self.slots = asyncio.Semaphore(max_concurrent_updates)
+        self.max_tracked_chats = max_tracked_chats
+        self.tails: Dict[Hashable, asyncio.Future] = {}
+        self.chat_stats: 'OrderedDict[Hashable, ChatWaitStats]' = OrderedDict()
+        self.pending = 0
+        self.room = asyncio.Event()
+        self.room.set()
+        self.waiting = 0
+        self.active = 0
+        self.processed = 0
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[Hashable]:
+        """Return the key whose updates must be processed in order"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ('user', update.effective_user.id)
+        return None
+
+    @property
+    def queue_depth(self) -> int:
+        """Updates accepted but still waiting for their chat or a free slot"""
+        return self.waiting
+
+    @property
+    def full(self) -> bool:
+        return self.pending >= self.max_pending_updates
+
+    async def admit(self):
+        """Wait until fewer than max_pending_updates updates are in flight and count one more"""
+        while self.full:
+            self.room.clear()
+            await self.room.wait()
+        self.pending += 1
+
+    def release(self):
+        if self.pending > 0:
+            self.pending -= 1
+        if not self.full:
+            self.room.set()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        key = self.ordering_key(update)
+        UPDATES_TOTAL.inc()
+
+        # Claim our place in the chat's chain before the first await so arrival order is kept
+        previous = done = None
+        if key is not None:
+            previous = self.tails.get(key)
+            done = loop.create_future()
+            self.tails[key] = done
+
+        self.waiting += 1
+        started = False
+        try:
+            if previous is not None and not previous.done():
+                await asyncio.shield(previous)
+            async with self.slots:
+                self.waiting -= 1
+                started = True
+                self.record_wait(key, loop.time() - queued_at)
+                self.active += 1
+                try:
+                    await coroutine
+                finally:
+                    self.active -= 1
+                    self.processed += 1
+        finally:
+            self.release()
+            if not started:
+                self.waiting -= 1
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            if done is not None:
+                if previous is not None and not previous.done():
+                    # Cancelled while queued, release the next update only after our predecessor finishes
+                    previous.add_done_callback(lambda _: done.done() or done.set_result(None))
+                else:
+                    done.set_result(None)
+                if self.tails.get(key) is done:
+                    del self.tails[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def record_wait(self, key: Optional[Hashable], wait: float):
+        """Record how long an update waited before it started running"""
+        if key is None:
+            return
+        stats = self.chat_stats.get(key)
+        if stats is None:
+            stats = self.chat_stats[key] = ChatWaitStats()
+            if len(self.chat_stats) > self.max_tracked_chats:
+                self.chat_stats.popitem(last=False)
+        else:
+            self.chat_stats.move_to_end(key)
+        stats.record(wait)
+
+    def chat_wait_time(self, chat_id: Hashable) -> Optional[ChatWaitStats]:
+        """Wait-time statistics for one chat, if it has been seen recently"""
+        return self.chat_stats.get(chat_id)
+
+    def snapshot(self, top: int = 10) -> Dict[str, Any]:
+        """Queue depth, concurrency and the chats that waited longest"""
+        slowest = sorted(self.chat_stats.items(), key=lambda item: item[1].average_wait, reverse=True)[:top]
+        return {
+            'queue_depth': self.waiting,
+            'pending': self.pending,
+            'max_pending_updates': self.max_pending_updates,
+            'active': self.active,
+            'processed': self.processed,
+            'chats_in_flight': len(self.tails),
+            'max_concurrent_updates': self.concurrency,
+            'slowest_chats': [
+                {
+                    'chat': key,
+                    'updates': stats.count,
+                    'average_wait': stats.average_wait,
+                    'max_wait': stats.max_wait,
+                    'last_wait': stats.last_wait,
+                }
+                for key, stats in slowest
+            ],
+        }
+
+
+class AdmissionQueue(asyncio.Queue):
+    """Update queue that only hands out an update once the processor admits it.
+
+    The application takes updates with get() and starts a task for each
+    without waiting; here get() holds the next update back while the
+    processor is full, so put() blocks once maxsize updates are queued.
+    """
+
+    def __init__(self, processor: ChatOrderedUpdateProcessor, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.processor = processor
+
+    async def get(self):
+        item = await super().get()
+        # The application's stop signal is a bare object() and is never processed
+        if type(item) is not object:
+            await self.processor.admit()
+        return item
@@ -0,0 +1,295 @@
+# state_store.py - Shared key-value state with Redis and in-process backends
+import asyncio
+import heapq
+from abc import ABC, abstractmethod
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config import Config
+from helpers.logger import get_logger
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = get_logger(__name__)
+
+
+def encode(value: Any) -> str:
+    """Values are stored as strings, the way Redis returns them"""
+    if isinstance(value, bytes):
+        return value.decode()
+    return value if isinstance(value, str) else str(value)
+
+
+class StateStore(ABC):
+    """Key-value store for state shared by every bot process.
+
+    Values are strings (numbers are stored in their string form). A ttl is
+    in seconds; incr() applies its ttl only when it creates the key, so a
+    counter expires a fixed time after its first increment.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """The value of key, None if it doesn't exist"""
+
+    @abstractmethod
+    async def get_many(self, keys: Iterable[str]) -> List[Optional[str]]:
+        """The values of keys in order, None for missing ones"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, only_if_missing: bool = False) -> bool:
+        """Store value, returning False if only_if_missing and the key exists"""
+
+    @abstractmethod
+    async def set_many(self, mapping: Dict[str, Any], ttl: Optional[float] = None):
+        """Store every value in mapping"""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> int:
+        """Delete keys, returning how many existed"""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add amount to a counter, creating it at 0, and return the new value"""
+
+    @abstractmethod
+    async def expire(self, key: str, ttl: float) -> bool:
+        """Set a ttl on key, returning False if it doesn't exist"""
+
+    @abstractmethod
+    async def ttl(self, key: str) -> Optional[float]:
+        """Seconds until key expires, None if it doesn't exist or never expires"""
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+    async def get_json(self, key: str) -> Any:
+        value = await self.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set_json(self, key: str, value: Any, ttl: Optional[float] = None, only_if_missing: bool = False) -> bool:
+        return await self.set(key, json.dumps(value), ttl, only_if_missing)
+
+
+class MemoryStateStore(StateStore):
+    """In-process backend, for a single bot process.
+
+    Expired keys are dropped when read and swept from a heap of expiry
+    times on every write, so memory is reclaimed without a timer task.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self.data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self.expiries: List[Tuple[float, str]] = []
+
+    def lookup(self, key: str, now: float) -> Optional[str]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def store(self, key: str, value: str, expires: Optional[float]):
+        self.data[key] = (value, expires)
+        if expires is not None:
+            heapq.heappush(self.expiries, (expires, key))
+
+    def sweep(self, now: float):
+        """Evict keys whose expiry has passed"""
+        expiries = self.expiries
+        while expiries and expiries[0][0] <= now:
+            expires, key = heapq.heappop(expiries)
+            entry = self.data.get(key)
+            # The heap keeps stale times for keys that were rewritten, only drop the key if this time is current
+            if entry is not None and entry[1] == expires:
+                del self.data[key]
+        if len(expiries) > 2 * len(self.data) + 1024:
+            self.expiries = [(expires, key) for key, (_, expires) in self.data.items() if expires is not None]
+            heapq.heapify(self.expiries)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.lookup(key, time.monotonic())
+
+    async def get_many(self, keys: Iterable[str]) -> List[Optional[str]]:
+        now = time.monotonic()
+        return [self.lookup(key, now) for key in keys]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, only_if_missing: bool = False) -> bool:
+        now = time.monotonic()
+        self.sweep(now)
+        if only_if_missing and self.lookup(key, now) is not None:
+            return False
+        self.store(key, encode(value), now + ttl if ttl else None)
+        return True
+
+    async def set_many(self, mapping: Dict[str, Any], ttl: Optional[float] = None):
+        now = time.monotonic()
+        self.sweep(now)
+        for key, value in mapping.items():
+            self.store(key, encode(value), now + ttl if ttl else None)
+
+    async def delete(self, *keys: str) -> int:
+        now = time.monotonic()
+        deleted = 0
+        for key in keys:
+            if self.lookup(key, now) is not None:
+                del self.data[key]
+                deleted += 1
+        return deleted
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.monotonic()
+        self.sweep(now)
+        current = self.lookup(key, now)
+        if current is None:
+            value = amount
+            self.store(key, str(value), now + ttl if ttl else None)
+        else:
+            value = int(current) + amount
+            self.data[key] = (str(value), self.data[key][1])
+        return value
+
+    async def expire(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        current = self.lookup(key, now)
+        if current is None:
+            return False
+        self.store(key, current, now + ttl)
+        return True
+
+    async def ttl(self, key: str) -> Optional[float]:
+        now = time.monotonic()
+        if self.lookup(key, now) is None:
+            return None
+        expires = self.data[key][1]
+        return expires - now if expires is not None else None
+
+
+class RedisStateStore(StateStore):
+    """Redis backend shared by every bot process.
+
+    Connections come from one pool capped at max_connections; when all are
+    busy, callers wait up to socket_timeout for one. Operations
+    that need several commands (incr with a ttl, set_many) send them in one
+    pipeline, so each call costs a single round trip. Keys are namespaced
+    with prefix.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url: str = Config.REDIS_URL, max_connections: int = Config.REDIS_CONNECTION_POOL_MAX,
+                 socket_timeout: float = Config.REDIS_SOCKET_TIMEOUT, password: Optional[str] = Config.REDIS_PASSWORD,
+                 prefix: str = Config.STATE_KEY_PREFIX):
+        if aioredis is None:
+            raise RuntimeError("The redis package is not installed")
+        options = {}
+        if password:
+            options['password'] = password
+        # Blocking pool: when every connection is busy callers wait for one instead of failing
+        self.pool = aioredis.BlockingConnectionPool.from_url(
+            url, max_connections=max_connections, timeout=socket_timeout, socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout, decode_responses=True, **options
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+        self.prefix = prefix
+
+    def key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(self.key(key))
+
+    async def get_many(self, keys: Iterable[str]) -> List[Optional[str]]:
+        keys = [self.key(key) for key in keys]
+        return await self.client.mget(keys) if keys else []
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, only_if_missing: bool = False) -> bool:
+        result = await self.client.set(
+            self.key(key), encode(value), px=int(ttl * 1000) if ttl else None, nx=only_if_missing
+        )
+        return bool(result)
+
+    async def set_many(self, mapping: Dict[str, Any], ttl: Optional[float] = None):
+        if not mapping:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(self.key(key), encode(value), px=int(ttl * 1000) if ttl else None)
+            await pipe.execute()
+
+    async def delete(self, *keys: str) -> int:
+        return await self.client.delete(*(self.key(key) for key in keys)) if keys else 0
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if not ttl:
+            return await self.client.incrby(self.key(key), amount)
+        async with self.client.pipeline(transaction=True) as pipe:
+            # Creating the key at 0 with an expiry first makes the ttl apply only on creation
+            pipe.set(self.key(key), 0, px=int(ttl * 1000), nx=True)
+            pipe.incrby(self.key(key), amount)
+            _, value = await pipe.execute()
+        return value
+
+    async def expire(self, key: str, ttl: float) -> bool:
+        return bool(await self.client.pexpire(self.key(key), int(ttl * 1000)))
+
+    async def ttl(self, key: str) -> Optional[float]:
+        milliseconds = await self.client.pttl(self.key(key))
+        return milliseconds / 1000 if milliseconds >= 0 else None
+
+    async def ping(self) -> bool:
+        return bool(await self.client.ping())
+
+    async def close(self):
+        if hasattr(self.client, 'aclose'):
+            await self.client.aclose()
+        else:  # redis < 5
+            await self.client.close()
+        await self.pool.disconnect()
+
+
+# The active backend, replaced by init_state_store()
+current_store: StateStore = MemoryStateStore()
+
+
+def get_state_store() -> StateStore:
+    """The active backend, look it up at call time since init_state_store() replaces it"""
+    return current_store
+
+
+async def init_state_store(backend: str = Config.STATE_BACKEND) -> StateStore:
+    """Connect to Redis unless backend is 'memory', falling back to memory in 'auto' mode"""
+    global current_store
+    if backend != 'memory' and Config.REDIS_URL:
+        store = None
+        try:
+            store = RedisStateStore(Config.REDIS_URL)
+            await asyncio.wait_for(store.ping(), Config.REDIS_SOCKET_TIMEOUT)
+            current_store = store
+            logger.info("🧠 Shared state stored in Redis")
+            return current_store
+        except Exception as e:
+            if store is not None:
+                await store.close()
+            if backend == 'redis':
+                raise
+            logger.warning(f"⚠️ Redis unavailable ({e}), keeping state in process memory")
+    current_store = MemoryStateStore()
+    logger.info("🧠 Shared state stored in process memory")
+    return current_store
+
+
+async def close_state_store():
+    await current_store.close()
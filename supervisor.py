@@ -0,0 +1,420 @@
+# supervisor.py - Shard updates by chat over several bot worker processes
+import asyncio
+import itertools
+import json
+import multiprocessing
+import signal
+import socket
+import time
+from typing import Any, Dict, List, Optional
+from telegram import Bot, Update
+from config import Config
+from helpers.logger import get_logger
+from http_server import HTTPServer, HTTPRequest, HTTPResponse
+from metrics import CONTENT_TYPE, Counter, Gauge, Registry, merge_expositions
+from scheduler import ChatOrderedUpdateProcessor
+from webhook import WebhookServer
+
+logger = get_logger(__name__)
+
+# The supervisor's own metrics, separate from the registry every worker fills
+SUPERVISOR_REGISTRY = Registry()
+UPDATES_FORWARDED = Counter(
+    'bot_supervisor_updates_forwarded_total', 'Updates sent to workers', ['worker'], registry=SUPERVISOR_REGISTRY
+)
+UPDATES_DROPPED = Counter(
+    'bot_supervisor_updates_dropped_total', 'Updates lost because a worker died while they were sent',
+    ['worker'], registry=SUPERVISOR_REGISTRY
+)
+UPDATES_SHED = Counter(
+    'bot_supervisor_updates_shed_total', "Updates dropped because their worker's queue was full",
+    ['worker'], registry=SUPERVISOR_REGISTRY
+)
+WORKER_RESTARTS = Counter(
+    'bot_supervisor_worker_restarts_total', 'Worker processes restarted after exiting', ['worker'],
+    registry=SUPERVISOR_REGISTRY
+)
+WORKER_UP = Gauge('bot_supervisor_worker_up', 'Whether the worker is running and ready', ['worker'],
+                  registry=SUPERVISOR_REGISTRY)
+
+HEADER_SIZE = 4
+RESTART_BACKOFF_MAX = 30.0
+METRICS_TIMEOUT = 2.0
+
+
+# ====== FRAMING ======
+
+async def send_message(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+    data = json.dumps(message).encode()
+    writer.write(len(data).to_bytes(HEADER_SIZE, 'big') + data)
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """Next length-prefixed JSON message, or None once the peer has gone"""
+    try:
+        header = await reader.readexactly(HEADER_SIZE)
+        return json.loads(await reader.readexactly(int.from_bytes(header, 'big')))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+# ====== WORKER SIDE ======
+
+def worker_main(index: int, count: int, sock: socket.socket):
+    """Process entry point of one worker"""
+    # Ctrl+C reaches the whole process group, the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, count, sock))
+
+
+async def run_worker(index: int, count: int, sock: socket.socket):
+    """Run a TelegramBot fed with the updates the supervisor sends over sock"""
+    from bot import bot
+    from database.models import close_db
+    from metrics import REGISTRY, EventLoopLagMonitor
+
+    bot.worker_index = index
+    bot.worker_count = count
+    reader, writer = await asyncio.open_connection(sock=sock)
+    lag_monitor = EventLoopLagMonitor()
+
+    await bot.setup()
+    await bot.application.initialize()
+    await bot.application.start()
+    await bot.start_jobs()
+    if Config.ENABLE_METRICS:
+        lag_monitor.start()
+    await send_message(writer, {'type': 'ready'})
+    logger.info(f"👷 Worker {index} ready")
+
+    try:
+        while True:
+            message = await read_message(reader)
+            if message is None or message['type'] == 'stop':
+                break
+            if message['type'] == 'update':
+                update = Update.de_json(message['update'], bot.application.bot)
+                await bot.application.update_queue.put(update)
+            elif message['type'] == 'metrics':
+                await send_message(writer, {'type': 'metrics', 'id': message['id'], 'text': REGISTRY.render()})
+    finally:
+        await lag_monitor.stop()
+        await bot.stop()
+        await close_db()
+        writer.close()
+        logger.info(f"👷 Worker {index} stopped")
+
+
+# ====== SUPERVISOR SIDE ======
+
+class WorkerHandle:
+    """One worker process, its connection and the updates waiting for it"""
+
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.label = str(index)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.process: Optional[multiprocessing.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.ready = asyncio.Event()
+        self.receiver: Optional[asyncio.Task] = None
+        self.sender: Optional[asyncio.Task] = None
+        self.restarting: Optional[asyncio.Task] = None
+        self.metrics_requests: Dict[int, asyncio.Future] = {}
+        self.restarts = 0
+        self.started_at = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    """Receive every update once and shard it by chat over worker processes.
+
+    Updates arrive by webhook or long polling exactly as in single-process
+    mode. Each goes to worker chat_id % worker_count (updates without a
+    chat are keyed by user, the rest are spread round robin). Every chat
+    lands on one worker, and that worker's ChatOrderedUpdateProcessor keeps
+    its updates in order.
+
+    Workers talk to the supervisor over a socket pair using length-prefixed
+    JSON. A worker that exits is restarted with a growing backoff. Updates
+    for it wait in its bounded queue until it is back; once that queue is
+    full further updates for it are dropped and counted, so one dead shard
+    never holds up the others. An update being written when the worker
+    died is dropped and counted. /metrics on
+    METRICS_PORT merges every worker's registry with a worker label, plus
+    the supervisor's own metrics. /healthz and /readyz on HEALTH_CHECK_PORT
+    report whether all workers are up.
+    """
+
+    def __init__(self, worker_count: int = Config.WORKER_PROCESSES, queue_size: int = Config.UPDATE_QUEUE_MAX_SIZE):
+        self.worker_count = worker_count
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = [WorkerHandle(index, queue_size) for index in range(worker_count)]
+        # WebhookServer feeds self.update_queue and parses with self.bot, like it would an Application
+        self.update_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.bot: Optional[Bot] = None
+        self.round_robin = itertools.cycle(range(worker_count))
+        self.request_ids = itertools.count()
+        self.tasks: List[asyncio.Task] = []
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.webhook_server: Optional[WebhookServer] = None
+        self.http_servers: List[HTTPServer] = []
+        self.stopping = False
+        self.stop_event = asyncio.Event()
+
+    def shard(self, update: object) -> int:
+        key = ChatOrderedUpdateProcessor.ordering_key(update)
+        if key is None:
+            return next(self.round_robin)
+        chat_or_user = key if isinstance(key, int) else key[1]
+        return chat_or_user % self.worker_count
+
+    # ====== WORKERS ======
+
+    async def spawn(self, worker: WorkerHandle):
+        parent, child = socket.socketpair()
+        worker.process = self.context.Process(
+            target=worker_main, args=(worker.index, self.worker_count, child), name=f'worker-{worker.index}'
+        )
+        worker.process.start()
+        child.close()
+        worker.started_at = time.monotonic()
+        worker.ready.clear()
+        worker.reader, worker.writer = await asyncio.open_connection(sock=parent)
+        worker.receiver = asyncio.get_running_loop().create_task(self.receive(worker))
+        logger.info(f"👷 Started worker {worker.index} (pid {worker.process.pid})")
+
+    async def receive(self, worker: WorkerHandle):
+        """Handle messages from one worker until its connection closes"""
+        while True:
+            message = await read_message(worker.reader)
+            if message is None:
+                break
+            if message['type'] == 'ready':
+                worker.ready.set()
+                WORKER_UP.labels(worker.label).set(1)
+            elif message['type'] == 'metrics':
+                future = worker.metrics_requests.pop(message['id'], None)
+                if future is not None and not future.done():
+                    future.set_result(message['text'])
+        worker.ready.clear()
+        WORKER_UP.labels(worker.label).set(0)
+        for future in worker.metrics_requests.values():
+            future.cancel()
+        worker.metrics_requests.clear()
+
+    async def send(self, worker: WorkerHandle):
+        """Forward one worker's queued updates in order, waiting while it restarts"""
+        while True:
+            update = await worker.queue.get()
+            await worker.ready.wait()
+            try:
+                await send_message(worker.writer, {'type': 'update', 'update': update.to_dict()})
+                UPDATES_FORWARDED.labels(worker.label).inc()
+            except (ConnectionError, RuntimeError) as e:
+                UPDATES_DROPPED.labels(worker.label).inc()
+                logger.warning(f"⚠️ Lost update {update.update_id} sending it to worker {worker.index}: {e}")
+
+    async def monitor(self):
+        """Restart workers that exited, each on its own schedule"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(1)
+            for worker in self.workers:
+                if worker.alive or self.stopping or worker.restarting is not None:
+                    continue
+                worker.ready.clear()
+                WORKER_UP.labels(worker.label).set(0)
+                # Back off when a worker dies right after starting, reset once it ran for a while
+                uptime = time.monotonic() - worker.started_at
+                worker.restarts = 0 if uptime > RESTART_BACKOFF_MAX else worker.restarts + 1
+                delay = min(2 ** worker.restarts, RESTART_BACKOFF_MAX) if worker.restarts else 0
+                logger.error(
+                    f"💀 Worker {worker.index} exited with code {worker.process.exitcode}, restarting in {delay:.0f}s"
+                )
+                WORKER_RESTARTS.labels(worker.label).inc()
+                if worker.writer is not None:
+                    worker.writer.close()
+                worker.restarting = loop.create_task(self.restart(worker, delay))
+                self.tasks.append(worker.restarting)
+
+    async def restart(self, worker: WorkerHandle, delay: float):
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            if not self.stopping:
+                await self.spawn(worker)
+        except Exception as e:
+            logger.error(f"❌ Could not restart worker {worker.index}: {e}")
+        finally:
+            worker.restarting = None
+            if asyncio.current_task() in self.tasks:
+                self.tasks.remove(asyncio.current_task())
+
+    # ====== INTAKE ======
+
+    async def dispatch(self):
+        """Move updates from the intake queue to their worker's queue, never waiting on one worker"""
+        while True:
+            update = await self.update_queue.get()
+            worker = self.workers[self.shard(update)]
+            try:
+                worker.queue.put_nowait(update)
+            except asyncio.QueueFull:
+                UPDATES_SHED.labels(worker.label).inc()
+                logger.warning(f"⚠️ Worker {worker.index} queue full, dropped update {update.update_id}")
+
+    async def poll(self):
+        """Long-poll getUpdates, the supervisor is the only process talking to Telegram for updates"""
+        offset = None
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES, read_timeout=40
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self.update_queue.put(update)
+                offset = update.update_id + 1
+
+    async def start_intake(self):
+        if Config.USE_WEBHOOK:
+            try:
+                self.webhook_server = WebhookServer.from_config(self)
+                await self.webhook_server.start()
+                await self.bot.set_webhook(
+                    url=Config.WEBHOOK_URL,
+                    allowed_updates=Update.ALL_TYPES,
+                    secret_token=Config.WEBHOOK_SECRET_TOKEN,
+                    max_connections=100,
+                )
+                logger.info(f"📡 Supervisor receiving updates via webhook on port {self.webhook_server.port}")
+                return
+            except Exception as e:
+                logger.error(f"❌ Failed to start webhook, falling back to polling: {e}")
+                if self.webhook_server is not None:
+                    await self.webhook_server.stop()
+                    self.webhook_server = None
+        await self.bot.delete_webhook()
+        self.tasks.append(asyncio.get_running_loop().create_task(self.poll()))
+        logger.info("📡 Supervisor receiving updates via long polling")
+
+    # ====== METRICS AND HEALTH ======
+
+    async def collect_metrics(self, worker: WorkerHandle) -> Optional[str]:
+        if not worker.ready.is_set():
+            return None
+        request_id = next(self.request_ids)
+        future = worker.metrics_requests[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            await send_message(worker.writer, {'type': 'metrics', 'id': request_id})
+            return await asyncio.wait_for(future, METRICS_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError):
+            return None
+        finally:
+            worker.metrics_requests.pop(request_id, None)
+
+    async def handle_metrics(self, request: HTTPRequest) -> HTTPResponse:
+        texts = await asyncio.gather(*(self.collect_metrics(worker) for worker in self.workers))
+        expositions = {worker.label: text for worker, text in zip(self.workers, texts) if text is not None}
+        body = merge_expositions(expositions, 'worker') + SUPERVISOR_REGISTRY.render()
+        return HTTPResponse(200, body, content_type=CONTENT_TYPE)
+
+    async def handle_liveness(self, request: HTTPRequest) -> HTTPResponse:
+        return HTTPResponse(200, 'ok')
+
+    async def handle_readiness(self, request: HTTPRequest) -> HTTPResponse:
+        workers = {worker.label: worker.alive and worker.ready.is_set() for worker in self.workers}
+        ready = all(workers.values())
+        body = json.dumps({'ready': ready, 'workers': workers})
+        return HTTPResponse(200 if ready else 503, body, content_type='application/json')
+
+    async def start_http(self):
+        if Config.ENABLE_HEALTH_CHECK:
+            health = HTTPServer('0.0.0.0', Config.HEALTH_CHECK_PORT, name='health')
+            health.route('GET', '/healthz', self.handle_liveness)
+            health.route('GET', '/readyz', self.handle_readiness)
+            self.http_servers.append(health)
+        if Config.ENABLE_METRICS:
+            metrics = HTTPServer('0.0.0.0', Config.METRICS_PORT, name='metrics')
+            metrics.route('GET', '/metrics', self.handle_metrics)
+            self.http_servers.append(metrics)
+        for server in self.http_servers:
+            await server.start()
+
+    # ====== LIFECYCLE ======
+
+    async def run(self):
+        """Start the workers and intake, then run until stop()"""
+        logger.info(f"🧩 Supervisor starting {self.worker_count} worker processes")
+        await self.start_http()
+        self.bot = Bot(Config.TOKEN, base_url=Config.BOT_API_URL) if Config.BOT_API_URL else Bot(Config.TOKEN)
+        await self.bot.initialize()
+
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            await self.spawn(worker)
+            worker.sender = loop.create_task(self.send(worker))
+        self.tasks.append(loop.create_task(self.monitor()))
+        await asyncio.gather(*(worker.ready.wait() for worker in self.workers))
+
+        self.dispatcher = loop.create_task(self.dispatch())
+        await self.start_intake()
+        logger.info("🚀 Supervisor started successfully!")
+        await self.stop_event.wait()
+
+    async def stop(self, timeout: float = 30.0):
+        """Stop intake, let workers drain their queues, then stop them"""
+        if self.stopping:
+            return
+        self.stopping = True
+        if self.webhook_server is not None:
+            await self.webhook_server.stop()
+        # Stop polling and restarts, keep dispatching what was already received
+        for task in self.tasks:
+            task.cancel()
+
+        # Give queued updates a chance to reach their workers
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and (
+            not self.update_queue.empty() or any(not worker.queue.empty() for worker in self.workers if worker.alive)
+        ):
+            await asyncio.sleep(0.1)
+
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        for worker in self.workers:
+            if worker.sender is not None:
+                worker.sender.cancel()
+            if worker.alive and worker.writer is not None:
+                try:
+                    await send_message(worker.writer, {'type': 'stop'})
+                except ConnectionError:
+                    pass
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            await asyncio.to_thread(worker.process.join, max(deadline - time.monotonic(), 5))
+            if worker.process.is_alive():
+                logger.warning(f"⚠️ Worker {worker.index} did not stop in time, terminating it")
+                worker.process.terminate()
+                await asyncio.to_thread(worker.process.join, 5)
+            if worker.writer is not None:
+                worker.writer.close()
+
+        for server in self.http_servers:
+            await server.stop()
+        if self.bot is not None:
+            await self.bot.shutdown()
+        self.stop_event.set()
+        logger.info("✅ Supervisor stopped")
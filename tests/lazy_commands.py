@@ -0,0 +1,16 @@
+"""A command module for the lazy loading tests"""
+from telegram.ext import CommandHandler, MessageHandler, filters
+
+
+async def lazy(update, context):
+    pass
+
+
+async def echo(update, context):
+    pass
+
+
+def register_handlers(application):
+    application.add_handler(CommandHandler('lazy', lazy), 5)
+    application.add_handler(MessageHandler(filters.TEXT, echo), 5)
+    application.add_handler(CommandHandler('lazy', lazy), 6)
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+from antiraid import AntiRaid, RaidPolicy
+
+CHAT_ID = -1001
+
+
+def test_raid_mode_ends_without_polling(caplog):
+    async def run():
+        anti_raid = AntiRaid(RaidPolicy(limit=2, window=60, duration=0.2))
+        for user_id in range(3):
+            anti_raid.record_joins(CHAT_ID, [user_id])
+        assert CHAT_ID in anti_raid.raid_until
+
+        # A join halfway through extends raid mode, the timer re-arms for the rest
+        await asyncio.sleep(0.1)
+        assert anti_raid.record_joins(CHAT_ID, [3])
+        await asyncio.sleep(0.15)
+        assert CHAT_ID in anti_raid.raid_until
+
+        await asyncio.sleep(0.15)
+        assert CHAT_ID not in anti_raid.raid_until
+        assert not anti_raid.raid_timers
+
+    with caplog.at_level(logging.INFO, logger='antiraid'):
+        asyncio.run(run())
+    assert sum('Raid mode ended' in record.getMessage() for record in caplog.records) == 1
+
+
+def test_end_raid_cancels_the_timer():
+    async def run():
+        anti_raid = AntiRaid(RaidPolicy(limit=1, window=60, duration=60))
+        anti_raid.record_joins(CHAT_ID, [1, 2])
+        assert CHAT_ID in anti_raid.raid_timers
+        anti_raid.end_raid(CHAT_ID)
+        assert not anti_raid.raid_timers
+        assert not anti_raid.in_raid(CHAT_ID)
+
+    asyncio.run(run())
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+
+import pytest
+
+from database import backup as backup_module
+from database.backup import DELTA, FULL, BackupManager
+
+
+def create_database(path, rows=2000):
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, body BLOB)")
+        connection.executemany("INSERT INTO notes (id, body) VALUES (?, ?)",
+                               ((index, os.urandom(200)) for index in range(rows)))
+    return connection
+
+
+def contents(path):
+    connection = sqlite3.connect(path)
+    try:
+        assert connection.execute("PRAGMA integrity_check").fetchone() == ('ok',)
+        return connection.execute("SELECT id, body FROM notes ORDER BY id").fetchall()
+    finally:
+        connection.close()
+
+
+def manager(tmp_path, **options):
+    options.setdefault('max_files', 10)
+    options.setdefault('full_every', 10)
+    return BackupManager(directory=str(tmp_path / 'backups'), interval_hours=0, pages_per_step=16, step_pause=0,
+                         **options)
+
+
+def touch(connection, row=0):
+    with connection:
+        connection.execute("UPDATE notes SET body = ? WHERE id = ?", (os.urandom(200), row))
+
+
+def test_full_delta_and_shrunk_delta_restore(tmp_path):
+    source = str(tmp_path / 'bot.db')
+    connection = create_database(source)
+    backups = manager(tmp_path)
+
+    _, kind, full_pages = backups.run_backup(source)
+    assert kind == FULL
+    assert backups.run_backup(source) is None
+
+    touch(connection)
+    delta, kind, pages = backups.run_backup(source)
+    assert kind == DELTA and 0 < pages < full_pages
+    after_delta = contents(source)
+    restored = str(tmp_path / 'restored.db')
+    backups.restore(restored)
+    full_size = os.path.getsize(restored)
+
+    # Deleting most rows and vacuuming shrinks the file, the delta must truncate the restored copy
+    with connection:
+        connection.execute("DELETE FROM notes WHERE id >= 100")
+    connection.execute("VACUUM")
+    _, kind, _ = backups.run_backup(source)
+    assert kind == DELTA
+
+    backups.restore(restored)
+    assert contents(restored) == contents(source)
+    assert os.path.getsize(restored) < full_size / 4
+    backups.restore(restored, until=delta)
+    assert contents(restored) == after_delta
+    connection.close()
+
+
+def test_encrypted_round_trip(tmp_path, monkeypatch):
+    fernet = pytest.importorskip('cryptography.fernet')
+    # Small chunks, so every backup spans several Fernet tokens
+    monkeypatch.setattr(backup_module, 'ENCRYPTION_CHUNK', 4096)
+    source = str(tmp_path / 'bot.db')
+    connection = create_database(source)
+    backups = manager(tmp_path, encryption_key=fernet.Fernet.generate_key().decode())
+
+    name, _, _ = backups.run_backup(source)
+    touch(connection)
+    backups.run_backup(source)
+    assert name.endswith('.enc')
+    with open(os.path.join(backups.directory, name), 'rb') as fileobj:
+        assert b'SQLite format 3' not in fileobj.read()
+
+    restored = str(tmp_path / 'restored.db')
+    backups.restore(restored)
+    assert contents(restored) == contents(source)
+
+    backups.encryption_key = None
+    with pytest.raises(RuntimeError):
+        backups.restore(restored)
+    connection.close()
+
+
+def test_prune_drops_whole_old_chains(tmp_path):
+    source = str(tmp_path / 'bot.db')
+    connection = create_database(source, rows=50)
+    backups = manager(tmp_path, max_files=3, full_every=2)
+    for row in range(5):
+        touch(connection, row)
+        backups.run_backup(source)
+    assert [[backups.kind(name) for name in chain] for chain in backups.chains()] == [[FULL, DELTA], [FULL]]
+    connection.close()
+
+
+def test_prune_keeps_the_newest_chain(tmp_path):
+    source = str(tmp_path / 'bot.db')
+    connection = create_database(source, rows=50)
+    backups = manager(tmp_path, max_files=1, full_every=5)
+    for row in range(3):
+        touch(connection, row)
+        backups.run_backup(source)
+    assert [[backups.kind(name) for name in chain] for chain in backups.chains()] == [[FULL, DELTA, DELTA]]
+
+    restored = str(tmp_path / 'restored.db')
+    backups.restore(restored)
+    assert contents(restored) == contents(source)
+    connection.close()
@@ -0,0 +1,111 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, filters
+
+import bot as bot_module
+from bot import RetiredStub, TelegramBot
+
+TOKEN = '123456:test-token'
+
+
+def new_members_update(application: Application, chat_id: int = -100, user_id: int = 42) -> Update:
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Joiner'}
+    return Update.de_json({'update_id': 1, 'message': {
+        'message_id': 10, 'date': 0, 'new_chat_members': [user], 'from': user,
+        'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Group'},
+    }}, application.bot)
+
+
+def test_antiraid_and_welcome_both_see_a_join(monkeypatch):
+    monkeypatch.setattr(bot_module.Config, 'ENABLE_ANTIRAID', True)
+    monkeypatch.setattr(bot_module.Config, 'ENABLE_GREETINGS', True)
+
+    telegram_bot = TelegramBot()
+    application = telegram_bot.application = Application.builder().token(TOKEN).build()
+    telegram_bot.add_basic_handlers()
+    update = new_members_update(application)
+
+    # Like Application.process_update, only the first matching handler of each group runs
+    callbacks = []
+    for group in sorted(application.handlers):
+        for handler in application.handlers[group]:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                callbacks.append(handler.callback)
+                break
+
+    assert bot_module.anti_raid.handle_new_members in callbacks
+    assert bot_module.welcome_pipeline.handle_new_members in callbacks
+    assert callbacks.index(bot_module.anti_raid.handle_new_members) < \
+        callbacks.index(bot_module.welcome_pipeline.handle_new_members)
+
+
+def test_loading_a_lazy_module_mid_dispatch_keeps_the_handler_groups():
+    telegram_bot = TelegramBot()
+    application = telegram_bot.application = Application.builder().token(TOKEN).build()
+    entry = {'handlers': [{'kind': 'command', 'commands': ['lazy'], 'group': 5}]}
+
+    async def run():
+        await telegram_bot.register_lazy_module('json', entry)
+        # Iterate the groups the way Application.process_update does while the stub's module loads
+        for handlers in application.handlers.values():
+            for _ in handlers:
+                await telegram_bot.ensure_module_loaded('json')
+
+    asyncio.run(run())
+    assert [type(handler) for handler in application.handlers[5]] == [RetiredStub]
+    assert 'json' in telegram_bot.module_load_times
+
+
+def test_setup_runs_once(monkeypatch):
+    calls = []
+    telegram_bot = TelegramBot()
+    telegram_bot.is_setup = True
+    monkeypatch.setattr(bot_module, 'init_db', lambda: calls.append('init_db'))
+    asyncio.run(telegram_bot.setup())
+    assert calls == [] and telegram_bot.application is None
+
+
+def handler_order(application: Application):
+    return {
+        group: [(type(handler).__name__, getattr(handler.callback, '__name__', None)) for handler in handlers
+                if not isinstance(handler, RetiredStub)]
+        for group, handlers in application.handlers.items()
+    }
+
+
+def test_lazy_module_handlers_keep_their_eager_precedence():
+    async def before(update, context):
+        pass
+
+    async def after(update, context):
+        pass
+
+    def build(load):
+        telegram_bot = TelegramBot()
+        application = telegram_bot.application = Application.builder().token(TOKEN).build()
+        application.add_handler(CommandHandler('before', before), 5)
+        asyncio.run(load(telegram_bot))
+        application.add_handler(MessageHandler(filters.ALL, after), 5)
+        application.add_handler(MessageHandler(filters.ALL, after), 6)
+        return telegram_bot, application
+
+    async def eager(telegram_bot):
+        await telegram_bot.load_module('tests.lazy_commands')
+
+    async def lazy(telegram_bot):
+        await telegram_bot.register_lazy_module('tests.lazy_commands', {'handlers': [
+            {'kind': 'command', 'commands': ['lazy'], 'group': 5},
+            {'kind': 'message', 'filters': ['TEXT'], 'group': 5},
+            {'kind': 'command', 'commands': ['lazy'], 'group': 6},
+        ]})
+
+    _, eager_application = build(eager)
+    lazy_bot, lazy_application = build(lazy)
+    asyncio.run(lazy_bot.ensure_module_loaded('tests.lazy_commands'))
+
+    assert handler_order(lazy_application) == handler_order(eager_application)
+    assert handler_order(eager_application)[5] == [
+        ('CommandHandler', 'before'), ('CommandHandler', 'lazy'), ('MessageHandler', 'echo'), ('MessageHandler', 'after'),
+    ]
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from captcha import SOLVED, CaptchaPool, CaptchaVerifier
+from state_store import init_state_store
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import runpy, sys
+sys.path[:] = {path!r}
+runpy.run_path('main.py', run_name='__mp_main__')
+import logging_config
+print('bot' in sys.modules, logging_config.listener is not None)
+"""
+
+
+def test_spawned_children_do_not_import_the_bot():
+    # What a spawn-context worker does before running its task: take the parent's sys.path, re-run its main module
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(path=sys.path)], cwd=ROOT, capture_output=True, text=True, timeout=60,
+        env={**os.environ, 'BOT_TOKEN': '123456:test-token'},
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['False', 'False']
+
+
+def test_issue_500_challenges_from_a_200_challenge_pool():
+    async def run():
+        await init_state_store('memory')
+        pool = CaptchaPool(size=200, low_watermark=50, workers=2)
+        verifier = CaptchaVerifier(pool, timeout=60)
+        pool.start()
+        try:
+            deadline = time.monotonic() + 60
+            while len(pool) < 200 and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            assert len(pool) == 200
+
+            stalls = []
+
+            async def watch_loop():
+                while True:
+                    before = time.perf_counter()
+                    await asyncio.sleep(0.005)
+                    stalls.append(time.perf_counter() - before - 0.005)
+
+            watcher = asyncio.create_task(watch_loop())
+            challenges = await asyncio.gather(*(verifier.issue(-100, user_id) for user_id in range(500)))
+            watcher.cancel()
+
+            assert len(challenges) == 500
+            assert pool.misses > 0
+            # Rendering stays in the worker processes, the event loop never waits on it
+            assert max(stalls) < 0.1
+            assert await verifier.verify(-100, 7, challenges[7].answer) == SOLVED
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from database.export import export_data, import_data, write_records, FORMAT, VERSION
+from database.functions import (add_federation_ban, save_note, create_federation, get_chat_federation,
+                                is_federation_banned, join_federation)
+from database.models import close_db, db, init_db
+
+
+def run_with_database(tmp_path, monkeypatch, body):
+    monkeypatch.setattr(db, 'url', f'sqlite:///{tmp_path}/test.db')
+
+    async def run():
+        await init_db()
+        try:
+            await body()
+        finally:
+            await close_db()
+
+    asyncio.run(run())
+
+
+def chat_export(path, records):
+    """A chat export file with the given (table, row) records"""
+    counts = {}
+    for table, _ in records:
+        counts[table] = counts.get(table, 0) + 1
+
+    def all_records():
+        yield {'type': 'header', 'format': FORMAT, 'version': VERSION, 'scope': 'chat', 'chat_id': 1,
+               'created_at': time.time()}
+        for table, row in records:
+            yield {'type': 'row', 'table': table, 'row': row}
+        yield {'type': 'end', 'counts': counts}
+
+    with open(path, 'wb') as fileobj:
+        write_records(all_records(), fileobj)
+
+
+def test_chat_import_leaves_federations_alone(tmp_path, monkeypatch):
+    async def body():
+        await create_federation('victim', 'Victim federation', 100)
+        await create_federation('home', 'Home federation', 200)
+        await join_federation('home', -1)
+        path = str(tmp_path / 'crafted.ndjson.gz')
+        chat_export(path, [
+            ('notes', {'name': 'rules', 'content': 'Be nice'}),
+            ('federations', {'fed_id': 'victim', 'name': 'Victim federation', 'owner_id': 100, 'created_at': 0.0}),
+            ('federation_chats', {'fed_id': 'victim', 'joined_at': 0.0}),
+            ('federation_bans', {'fed_id': 'victim', 'user_id': 42, 'reason': 'crafted', 'banned_by': 1,
+                                 'created_at': 0.0}),
+        ])
+
+        counts = await import_data(path, -1)
+
+        assert counts == {'notes': 1}
+        assert await get_chat_federation(-1) == 'home'
+        assert not await is_federation_banned('victim', 42)
+
+    run_with_database(tmp_path, monkeypatch, body)
+
+
+def test_chat_round_trip(tmp_path, monkeypatch):
+    async def body():
+        await create_federation('fed', 'Federation', 100)
+        await join_federation('fed', -1)
+        await add_federation_ban('fed', 42, 'spam', 100)
+        await save_note(-1, 'rules', 'Be nice')
+        path = str(tmp_path / 'chat.ndjson.gz')
+
+        exported = await export_data(path, -1)
+        assert exported['federation_bans'] == 1
+        assert await import_data(path, -2) == {'notes': 1}
+        assert await db.fetchone("SELECT content FROM notes WHERE chat_id = ? AND name = ?", (-2, 'rules')) == ('Be nice',)
+        assert await get_chat_federation(-2) is None
+
+    run_with_database(tmp_path, monkeypatch, body)
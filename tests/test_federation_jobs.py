@@ -0,0 +1,130 @@
+import asyncio
+
+from telegram.error import Forbidden
+
+from database.functions import (create_federation, create_federation_job, delete_federation,
+                                get_unfinished_federation_jobs, is_federation_banned, join_federation)
+from database.models import db
+from federation_jobs import FederationJobEngine
+from tests.test_export import run_with_database
+
+FED_ID = 'fed-1'
+USER_ID = 42
+REPORT_CHAT = 1000
+CHATS = list(range(-1007, -1000))
+PAGE_SIZE = 3
+
+
+class FakeBot:
+    """Records ban calls per chat, blocks once `block_after` calls were made, fails in `forbidden` chats"""
+
+    def __init__(self, block_after=None, forbidden=()):
+        self.block_after = block_after
+        self.forbidden = set(forbidden)
+        self.calls = []
+        self.reports = []
+        self.blocked = asyncio.Event()
+
+    async def call(self, action, chat_id):
+        if self.block_after is not None and len(self.calls) >= self.block_after:
+            self.blocked.set()
+            await asyncio.Event().wait()
+        self.calls.append((action, chat_id))
+        if chat_id in self.forbidden:
+            raise Forbidden('bot is not a member of the supergroup chat')
+
+    async def ban_chat_member(self, chat_id, user_id):
+        await self.call('ban', chat_id)
+
+    async def unban_chat_member(self, chat_id, user_id, only_if_banned=False):
+        await self.call('unban', chat_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.reports.append((chat_id, text))
+
+
+async def create_federation_with_chats():
+    await create_federation(FED_ID, 'Test federation', 1)
+    for chat_id in CHATS:
+        await join_federation(FED_ID, chat_id)
+
+
+async def job_row(job_id):
+    return await db.fetchone("SELECT status, cursor, done, failed FROM federation_jobs WHERE job_id = ?", (job_id,))
+
+
+def test_job_resumes_from_cursor_after_restart(tmp_path, monkeypatch):
+    async def body():
+        await create_federation_with_chats()
+        first_bot = FakeBot(block_after=PAGE_SIZE + 1)
+        engine = FederationJobEngine(concurrency=1, page_size=PAGE_SIZE)
+        await engine.start(first_bot)
+        job = await engine.submit(FED_ID, 'ban', USER_ID, requested_by=1, report_chat_id=REPORT_CHAT)
+        # Stopped halfway through the second page
+        await first_bot.blocked.wait()
+        await engine.stop()
+        assert await job_row(job.job_id) == ('running', CHATS[PAGE_SIZE - 1], PAGE_SIZE, 0)
+
+        second_bot = FakeBot(forbidden={CHATS[-1]})
+        engine = FederationJobEngine(concurrency=1, page_size=PAGE_SIZE)
+        await engine.start(second_bot)
+        resumed = engine.get(job.job_id)
+        await resumed.task
+
+        first_chats = [chat_id for _, chat_id in first_bot.calls]
+        second_chats = [chat_id for _, chat_id in second_bot.calls]
+        assert second_chats == CHATS[PAGE_SIZE:]
+        assert len(set(first_chats) & set(second_chats)) <= PAGE_SIZE
+        assert sorted(set(first_chats) | set(second_chats)) == CHATS
+        assert (resumed.done, resumed.failed) == (len(CHATS) - 1, 1)
+        assert await job_row(job.job_id) == ('finished', CHATS[-1], len(CHATS) - 1, 1)
+        assert not await get_unfinished_federation_jobs()
+
+        [(chat_id, text)] = second_bot.reports
+        assert chat_id == REPORT_CHAT
+        assert f"was banned in {len(CHATS) - 1:,} chats" in text
+        assert "1 chats could not be updated" in text
+
+    run_with_database(tmp_path, monkeypatch, body)
+
+
+def test_unban_supersedes_running_ban(tmp_path, monkeypatch):
+    async def body():
+        await create_federation_with_chats()
+        bot = FakeBot(block_after=2)
+        engine = FederationJobEngine(concurrency=1, page_size=PAGE_SIZE)
+        await engine.start(bot)
+        ban = await engine.submit(FED_ID, 'ban', USER_ID)
+        await bot.blocked.wait()
+
+        bot.block_after = None
+        unban = await engine.submit(FED_ID, 'unban', USER_ID)
+        assert ban.task.done()
+        assert ban.status == 'superseded'
+        await unban.task
+
+        # No ban call lands after the unban started
+        assert bot.calls == [('ban', CHATS[0]), ('ban', CHATS[1])] + [('unban', chat_id) for chat_id in CHATS]
+        assert (await job_row(ban.job_id))[0] == 'superseded'
+        assert (await job_row(unban.job_id))[0] == 'finished'
+        assert not await is_federation_banned(FED_ID, USER_ID)
+
+    run_with_database(tmp_path, monkeypatch, body)
+
+
+def test_delete_federation_removes_chats_bans_and_jobs(tmp_path, monkeypatch):
+    async def body():
+        await create_federation_with_chats()
+        engine = FederationJobEngine()
+        await engine.start(FakeBot())
+        await (await engine.submit(FED_ID, 'ban', USER_ID)).task
+        job_id = await create_federation_job(FED_ID, 'unban', USER_ID, None, 1, None, 0, len(CHATS))
+
+        assert await delete_federation(FED_ID)
+        assert not await is_federation_banned(FED_ID, USER_ID)
+        assert await db.fetchone("SELECT COUNT(*) FROM federation_chats WHERE fed_id = ?", (FED_ID,)) == (0,)
+        assert (await job_row(job_id))[0] == 'cancelled'
+        assert not await get_unfinished_federation_jobs()
+        assert not await delete_federation(FED_ID)
+
+    run_with_database(tmp_path, monkeypatch, body)
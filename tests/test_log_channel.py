@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import NetworkError
+
+from log_channel import LogChannelSink
+
+CHANNEL = -100123
+
+
+class FlakyBot:
+    """Fails the first `failures` posts with a transient error, then posts"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise NetworkError('connection reset')
+        self.sent.append((chat_id, text))
+
+
+def test_stop_retries_transient_failures():
+    async def run():
+        sink = LogChannelSink(flush_interval=60, stop_timeout=5)
+        bot = FlakyBot(failures=2)
+        sink.start(bot)
+        sink.log(CHANNEL, 'first')
+        sink.log(CHANNEL, 'second')
+        await sink.stop()
+        return bot, sink
+
+    bot, sink = asyncio.run(run())
+    assert bot.sent == [(CHANNEL, 'first\n\nsecond')]
+    assert not sink.buffers
+
+
+def test_stop_logs_events_it_could_not_post(caplog):
+    async def run():
+        sink = LogChannelSink(flush_interval=60, stop_timeout=0.5)
+        sink.start(FlakyBot(failures=1000))
+        sink.log(CHANNEL, 'banned <b>spammer</b>')
+        start = time.monotonic()
+        with caplog.at_level(logging.ERROR, logger='log_channel'):
+            await sink.stop()
+        return time.monotonic() - start, sink
+
+    elapsed, sink = asyncio.run(run())
+    assert elapsed < 2
+    assert not sink.buffers
+    assert any('banned <b>spammer</b>' in record.getMessage() for record in caplog.records)
@@ -0,0 +1,47 @@
+import logging
+import multiprocessing
+import os
+import sys
+
+from logging_config import DedupFilter, log_file_path
+
+
+def fail_in_module_a():
+    raise KeyError('a')
+
+
+def fail_in_module_b():
+    raise KeyError('b')
+
+
+def error_record(failure) -> logging.LogRecord:
+    """A record logged from one shared call site, like the bot's error handler"""
+    try:
+        failure()
+    except KeyError:
+        return logging.LogRecord('bot', logging.ERROR, 'bot.py', 100, 'Handler error', None, sys.exc_info())
+
+
+def test_same_call_site_different_bugs_are_counted_apart():
+    dedup = DedupFilter(window=60, burst=1)
+    assert dedup.filter(error_record(fail_in_module_a))
+    assert dedup.filter(error_record(fail_in_module_b))
+    assert not dedup.filter(error_record(fail_in_module_a))
+    assert not dedup.filter(error_record(fail_in_module_b))
+    assert dedup.suppressed == 2
+
+
+def report_log_path(queue):
+    queue.put(log_file_path())
+
+
+def test_child_processes_log_to_their_own_file():
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=report_log_path, args=(queue,), name='worker-3')
+    process.start()
+    child_path = queue.get(timeout=30)
+    process.join(30)
+
+    root, extension = os.path.splitext(log_file_path())
+    assert child_path == f"{root}.worker-3{extension}"
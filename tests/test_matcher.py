@@ -0,0 +1,38 @@
+import re
+
+import pytest
+
+from matcher import TriggerMatcher
+
+
+def test_leading_global_flags_merge_into_the_alternation():
+    matcher = TriggerMatcher()
+    matcher.add_regex('digits', r'(?i)\d{5,}')
+    matcher.add_regex('lines', r'(?s)(?m)^x.y')
+    matcher.add_keyword('word', 'hello')
+    assert matcher.scan('hello 123456\nx\ny') == {'word': 0, 'digits': 6, 'lines': 13}
+    assert set(matcher.merged) == {'digits', 'lines'}
+
+
+def test_verbose_patterns_are_searched_on_their_own():
+    matcher = TriggerMatcher()
+    matcher.add_regex('verbose', r'(?x) \d+ [a-z]  # a number then a letter')
+    matcher.add_regex('plain', r'z+')
+    assert matcher.scan('12a zz') == {'verbose': 0, 'plain': 4}
+
+
+def test_invalid_pattern_fails_when_added():
+    matcher = TriggerMatcher()
+    with pytest.raises(re.error):
+        matcher.add_regex('bad', r'(?i')
+    assert len(matcher) == 0
+
+
+def test_offsets_survive_characters_that_lowercase_longer():
+    matcher = TriggerMatcher()
+    matcher.add_keyword('city', 'istanbul')
+    matcher.add_keyword('dotted', 'İzmir')
+    text = 'İİ istanbul İzmir'
+    found = matcher.scan(text)
+    assert found == {'city': 3, 'dotted': 12}
+    assert text[found['city']:].startswith('istanbul')
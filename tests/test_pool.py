@@ -0,0 +1,25 @@
+import pytest
+
+from database.models import db
+from tests.test_export import run_with_database
+
+
+def insert_user(connection, user_id):
+    connection.execute("INSERT INTO users (user_id, first_name) VALUES (?, ?)", (user_id, 'User'))
+
+
+def test_failed_write_rolls_back_writes_made_outside_a_transaction(tmp_path, monkeypatch):
+    def fails_on_second_write(connection):
+        insert_user(connection, 1)
+        insert_user(connection, 1)
+
+    async def body():
+        with pytest.raises(Exception):
+            await db.write(fails_on_second_write)
+        assert await db.fetchone("SELECT COUNT(*) FROM users WHERE user_id = 1") == (0,)
+
+        # A successful callable's writes outside `with connection` are still committed
+        await db.write(lambda connection: insert_user(connection, 2))
+        assert await db.fetchone("SELECT COUNT(*) FROM users WHERE user_id = 2") == (1,)
+
+    run_with_database(tmp_path, monkeypatch, body)
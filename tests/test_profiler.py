@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from profiler import Timed, TimingStats
+
+
+def spin(seconds):
+    """Burn CPU on the event loop thread"""
+    start = time.thread_time()
+    while time.thread_time() - start < seconds:
+        pass
+
+
+def test_result_and_errors_pass_through():
+    stats = TimingStats()
+
+    async def answer():
+        await asyncio.sleep(0)
+        return 42
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise KeyError('missing')
+
+    async def run():
+        assert await Timed(answer(), stats) == 42
+        with pytest.raises(KeyError):
+            await Timed(fail(), stats)
+
+    asyncio.run(run())
+    assert (stats.calls, stats.errors) == (2, 1)
+
+
+def test_cancellation_reaches_the_coroutine_and_is_not_an_error():
+    stats = TimingStats()
+    seen = []
+
+    async def sleeper():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            seen.append('cancelled')
+            raise
+
+    async def timed_sleeper():
+        await Timed(sleeper(), stats)
+
+    async def run():
+        task = asyncio.create_task(timed_sleeper())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert seen == ['cancelled']
+    assert (stats.calls, stats.errors) == (1, 0)
+
+
+def test_cpu_is_charged_only_for_the_coroutines_own_steps():
+    waiting, working = TimingStats(), TimingStats()
+
+    async def wait():
+        await asyncio.sleep(0.05)
+
+    async def work():
+        for _ in range(3):
+            spin(0.05)
+            await asyncio.sleep(0)
+
+    async def busy_neighbour():
+        for _ in range(5):
+            spin(0.04)
+            await asyncio.sleep(0)
+
+    async def run():
+        await asyncio.gather(Timed(wait(), waiting), Timed(work(), working), busy_neighbour())
+
+    asyncio.run(run())
+    # The neighbour spun for 0.2s while wait() was pending, none of it is wait()'s
+    assert waiting.wall >= 0.05
+    assert waiting.cpu < 0.02
+    # Its own 0.15s, without the neighbour's 0.2s
+    assert 0.14 <= working.cpu < 0.25
@@ -0,0 +1,20 @@
+import time
+
+from ratelimit import PriorityRateLimiter
+
+
+def test_group_bucket_allows_a_burst_of_the_per_minute_limit():
+    limiter = PriorityRateLimiter(group_rate=20 / 60, group_burst=20)
+    bucket = limiter.chat_bucket(-100)
+    now = time.monotonic()
+    assert [bucket.reserve(now) for _ in range(20)] == [0.0] * 20
+    assert bucket.reserve(now) > 0
+
+
+def test_eviction_keeps_buckets_under_a_flood_wait():
+    limiter = PriorityRateLimiter(max_tracked_chats=2)
+    limiter.chat_bucket(-1).penalize(time.monotonic(), 30)
+    limiter.chat_bucket(-2)
+    limiter.chat_bucket(-3)
+    assert list(limiter.chat_buckets) == [-3, -1]
+    assert limiter.chat_bucket(-1).delay(time.monotonic()) > 25
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from devtools.fake_redis import FakeRedis
+from state_store import MemoryStateStore, RedisStateStore
+
+
+def run_with_store(backend, body):
+    async def run():
+        if backend == 'memory':
+            await body(MemoryStateStore())
+            return
+        server = FakeRedis()
+        await server.start()
+        store = RedisStateStore(f'redis://127.0.0.1:{server.port}/0', password=None, prefix='test:')
+        try:
+            await body(store)
+        finally:
+            await store.close()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+backends = pytest.mark.parametrize('backend', ['memory', 'redis'])
+
+
+@backends
+def test_get_set_and_delete(backend):
+    async def body(store):
+        assert await store.get('missing') is None
+        assert await store.set('key', 42)
+        assert await store.get('key') == '42'
+        assert await store.delete('key', 'missing') == 1
+        assert await store.get('key') is None
+        assert await store.delete('key') == 0
+
+    run_with_store(backend, body)
+
+
+@backends
+def test_set_only_if_missing(backend):
+    async def body(store):
+        assert await store.set('lock', 'first', only_if_missing=True)
+        assert not await store.set('lock', 'second', only_if_missing=True)
+        assert await store.get('lock') == 'first'
+        assert await store.set('lock', 'third')
+        assert await store.get('lock') == 'third'
+
+    run_with_store(backend, body)
+
+
+@backends
+def test_set_with_ttl_expires(backend):
+    async def body(store):
+        await store.set('short', 'value', ttl=0.2)
+        await store.set('forever', 'value')
+        assert 0 < await store.ttl('short') <= 0.2
+        assert await store.ttl('forever') is None
+        await asyncio.sleep(0.3)
+        assert await store.get('short') is None
+        assert await store.ttl('short') is None
+        assert await store.set('short', 'again', only_if_missing=True)
+
+    run_with_store(backend, body)
+
+
+@backends
+def test_incr_applies_ttl_on_creation_only(backend):
+    async def body(store):
+        assert await store.incr('plain') == 1
+        assert await store.incr('plain', 5) == 6
+        assert await store.ttl('plain') is None
+
+        assert await store.incr('counter', ttl=0.3) == 1
+        await asyncio.sleep(0.15)
+        assert await store.incr('counter', ttl=0.3) == 2
+        # The second incr did not push the expiry back
+        assert await store.ttl('counter') <= 0.15
+        await asyncio.sleep(0.2)
+        assert await store.get('counter') is None
+        assert await store.incr('counter', ttl=0.3) == 1
+
+    run_with_store(backend, body)
+
+
+@backends
+def test_set_many_and_get_many(backend):
+    async def body(store):
+        assert await store.get_many([]) == []
+        await store.set_many({})
+        await store.set_many({'a': 1, 'b': 'two', 'c': b'three'}, ttl=0.2)
+        assert await store.get_many(['a', 'missing', 'b', 'c']) == ['1', None, 'two', 'three']
+        await asyncio.sleep(0.3)
+        assert await store.get_many(['a', 'b', 'c']) == [None, None, None]
+
+    run_with_store(backend, body)
+
+
+@backends
+def test_expire_and_json(backend):
+    async def body(store):
+        assert not await store.expire('missing', 1)
+        await store.set_json('settings', {'enabled': True, 'limit': 3})
+        assert await store.get_json('settings') == {'enabled': True, 'limit': 3}
+        assert await store.expire('settings', 0.2)
+        await asyncio.sleep(0.3)
+        assert await store.get_json('settings') is None
+
+    run_with_store(backend, body)
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from telegram import Update
+
+from supervisor import UPDATES_SHED, Supervisor
+
+
+def chat_update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': 'hi',
+        'chat': {'id': chat_id, 'type': 'group', 'title': 'Group'},
+    }}, None)
+
+
+class ExitedProcess:
+    exitcode = 1
+    pid = 0
+
+    def is_alive(self):
+        return False
+
+
+def test_full_worker_queue_does_not_stall_other_shards():
+    async def run():
+        supervisor = Supervisor(worker_count=2, queue_size=1)
+        shed_before = UPDATES_SHED.labels('0').value
+        dispatcher = asyncio.create_task(supervisor.dispatch())
+        for update_id in range(1, 4):
+            await supervisor.update_queue.put(chat_update(update_id, 10))
+        await supervisor.update_queue.put(chat_update(4, 11))
+        await asyncio.sleep(0.01)
+        dispatcher.cancel()
+
+        assert supervisor.workers[0].queue.qsize() == 1
+        assert supervisor.workers[1].queue.get_nowait().update_id == 4
+        assert UPDATES_SHED.labels('0').value - shed_before == 2
+
+    asyncio.run(run())
+
+
+def test_restart_backoff_of_one_worker_does_not_delay_another():
+    async def run():
+        supervisor = Supervisor(worker_count=2, queue_size=1)
+        spawned = {}
+
+        async def spawn(worker):
+            spawned[worker.index] = time.monotonic()
+
+        supervisor.spawn = spawn
+        for worker in supervisor.workers:
+            worker.process = ExitedProcess()
+        # Worker 0 died right after starting and backs off, worker 1 ran for a long time
+        supervisor.workers[0].started_at = time.monotonic()
+        supervisor.workers[1].started_at = time.monotonic() - 3600
+        monitor = asyncio.create_task(supervisor.monitor())
+        await asyncio.sleep(1.3)
+        monitor.cancel()
+        for task in supervisor.tasks:
+            task.cancel()
+
+        assert 1 in spawned and 0 not in spawned
+
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+from telegram.ext import Application
+
+from scheduler import AdmissionQueue, ChatOrderedUpdateProcessor
+from webhook import SECRET_HEADER, WebhookServer
+
+TOKEN = '123456:test-token'
+UPDATE = json.dumps({'update_id': 1}).encode()
+
+
+def build_application(queue_size: int = 10) -> Application:
+    processor = ChatOrderedUpdateProcessor(2, max_pending_updates=2)
+    return (
+        Application.builder().token(TOKEN)
+        .update_queue(AdmissionQueue(processor, maxsize=queue_size))
+        .concurrent_updates(processor)
+        .build()
+    )
+
+
+async def exchange(port: int, request: bytes, pause: float = 0) -> int:
+    """Send raw request bytes and return the response status"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    if pause:
+        await asyncio.sleep(pause)
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    return status
+
+
+def post(headers: dict, body: bytes = UPDATE) -> bytes:
+    lines = ['POST /webhook HTTP/1.1', f'Content-Length: {len(body)}', 'Connection: close']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + body
+
+
+def serve(application: Application, check, **options):
+    async def run():
+        server = WebhookServer(application, '127.0.0.1', 0, secret_token='s3cret', **options)
+        await server.start()
+        try:
+            await check(server)
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_secret_token():
+    async def check(server):
+        assert await exchange(server.port, post({SECRET_HEADER: 's3cret'})) == 200
+        assert await exchange(server.port, post({SECRET_HEADER: 'wrong'})) == 403
+        assert await exchange(server.port, post({SECRET_HEADER: 'sécret✓'})) == 403
+
+    serve(build_application(), check)
+
+
+def test_full_queue_sheds_with_503():
+    async def check(server):
+        assert await exchange(server.port, post({SECRET_HEADER: 's3cret'})) == 200
+        assert await exchange(server.port, post({SECRET_HEADER: 's3cret'})) == 503
+        assert server.rejected == 1
+
+    serve(build_application(queue_size=1), check, queue_timeout=0.05)
+
+
+def test_header_limits():
+    async def check(server):
+        server.http.request_timeout = 0.1
+        many = {f'X-Header-{index}': 'value' for index in range(200)}
+        assert await exchange(server.port, post(many)) == 431
+        assert await exchange(server.port, b'POST /webhook HTTP/1.1\r\nX-Slow: 1\r\n', pause=0.3) == 408
+
+    serve(build_application(), check)
+
+
+def test_invalid_content_length():
+    async def check(server):
+        for length in ('-5', 'ten'):
+            request = f'POST /webhook HTTP/1.1\r\nContent-Length: {length}\r\n{SECRET_HEADER}: s3cret\r\n\r\n'
+            assert await exchange(server.port, request.encode()) == 400
+
+    serve(build_application(), check)
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+from telegram import Bot, Update
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from database.functions import get_greeting
+from tests.test_export import run_with_database
+from welcome import set_welcome_command, welcome_command
+
+CHAT_ID = -1001
+ADMIN_ID = 10
+MEMBER_ID = 20
+
+
+def command(bot, user_id, text, message_id=1):
+    update = Update.de_json({
+        'update_id': message_id,
+        'message': {
+            'message_id': message_id, 'date': 0, 'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}],
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'chat': {'id': CHAT_ID, 'type': 'supergroup', 'title': 'Test'},
+        },
+    }, bot)
+    return update, SimpleNamespace(bot=bot, args=text.split()[1:])
+
+
+def run_with_bot(tmp_path, monkeypatch, body):
+    async def run():
+        api = FakeBotAPI()
+        api.admins[CHAT_ID] = {ADMIN_ID}
+        await api.start()
+        try:
+            async with Bot(api.token, base_url=api.base_url) as bot:
+                await body(api, bot)
+        finally:
+            await api.stop()
+
+    run_with_database(tmp_path, monkeypatch, run)
+
+
+def test_setwelcome_saves_text_and_keeps_settings(tmp_path, monkeypatch):
+    async def body(api, bot):
+        await welcome_command(*command(bot, ADMIN_ID, '/welcome off', 1))
+        await set_welcome_command(*command(bot, ADMIN_ID, '/setwelcome Hi {first} & welcome!', 2))
+        greeting = await get_greeting(CHAT_ID)
+        assert greeting['welcome_text'] == 'Hi {first} &amp; welcome!'
+        assert not greeting['welcome_enabled']
+
+        await set_welcome_command(*command(bot, ADMIN_ID, '/setwelcome', 3))
+        assert (await get_greeting(CHAT_ID))['welcome_text'] is None
+
+    run_with_bot(tmp_path, monkeypatch, body)
+
+
+def test_welcome_commands_are_admin_only(tmp_path, monkeypatch):
+    async def body(api, bot):
+        await set_welcome_command(*command(bot, MEMBER_ID, '/setwelcome Go away', 1))
+        await welcome_command(*command(bot, MEMBER_ID, '/welcome off', 2))
+        greeting = await get_greeting(CHAT_ID)
+        assert greeting['welcome_text'] is None
+        assert greeting['welcome_enabled']
+
+    run_with_bot(tmp_path, monkeypatch, body)
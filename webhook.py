@@ -0,0 +1,103 @@
+# webhook.py - Webhook ingestion server
+import asyncio
+import hmac
+import ssl
+from typing import Optional
+from urllib.parse import urlsplit
+from telegram import Update
+from telegram.ext import Application
+from config import Config
+from helpers.logger import get_logger
+from http_server import HTTPServer, HTTPRequest, HTTPResponse
+
+try:
+    import orjson
+
+    def loads(data: bytes):
+        return orjson.loads(data)
+except ImportError:
+    import json
+
+    def loads(data: bytes):
+        return json.loads(data)
+
+logger = get_logger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class WebhookServer:
+    """Accept Telegram update POSTs and feed them into the application's update queue.
+
+    The update queue is bounded (Config.UPDATE_QUEUE_MAX_SIZE) and only
+    drains while the update scheduler has room (Config.MAX_PENDING_UPDATES),
+    so when handlers fall behind the POST waits for room. If no room frees up within
+    WEBHOOK_QUEUE_TIMEOUT the request gets a 503 and Telegram redelivers it
+    later instead of the bot buffering without limit.
+    """
+
+    def __init__(self, application: Application, listen: str, port: int, path: str = '/webhook',
+                 secret_token: Optional[str] = None, ssl_context: Optional[ssl.SSLContext] = None,
+                 queue_timeout: float = 5.0):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.queue_timeout = queue_timeout
+        self.received = 0
+        self.rejected = 0
+        self.http = HTTPServer(listen, port, name='webhook', ssl_context=ssl_context)
+        self.http.route('POST', path, self.handle_update)
+
+    @classmethod
+    def from_config(cls, application: Application) -> 'WebhookServer':
+        """Build the server from the WEBHOOK_* settings"""
+        ssl_context = None
+        if Config.WEBHOOK_SSL_CERT and Config.WEBHOOK_SSL_PRIV:
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(Config.WEBHOOK_SSL_CERT, Config.WEBHOOK_SSL_PRIV)
+
+        return cls(
+            application,
+            Config.WEBHOOK_LISTEN,
+            Config.WEBHOOK_PORT,
+            path=urlsplit(Config.WEBHOOK_URL or '').path or '/webhook',
+            secret_token=Config.WEBHOOK_SECRET_TOKEN,
+            ssl_context=ssl_context,
+            queue_timeout=Config.WEBHOOK_QUEUE_TIMEOUT,
+        )
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    async def start(self):
+        """Start listening for update POSTs"""
+        await self.http.start()
+
+    async def stop(self):
+        """Stop listening for update POSTs"""
+        await self.http.stop()
+
+    async def handle_update(self, request: HTTPRequest) -> HTTPResponse:
+        """Parse one update POST and enqueue it"""
+        # Headers are decoded as latin-1, compare bytes since compare_digest rejects non-ASCII str
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, '').encode('latin-1'), self.secret_token.encode()
+        ):
+            return HTTPResponse(403, 'Invalid secret token')
+
+        try:
+            update = Update.de_json(loads(request.body), self.application.bot)
+        except Exception as e:
+            logger.warning(f"⚠️ Dropping malformed webhook payload: {e}")
+            return HTTPResponse(400, 'Invalid update')
+
+        try:
+            await asyncio.wait_for(self.application.update_queue.put(update), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Telegram retries non-2xx deliveries, so shedding here is lossless
+            self.rejected += 1
+            return HTTPResponse(503, 'Update queue full', headers={'Retry-After': '1'})
+
+        self.received += 1
+        return HTTPResponse(200, 'ok')
@@ -1 +1,244 @@
 # welcome.py - Welcome message handlers
+import asyncio
+import html
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from telegram import Bot, User, Update
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import ContextTypes
+from antiraid import anti_raid
+from config import Config
+from database.functions import get_greeting, record_last_welcome, set_welcome
+from decorators import user_admin
+from helpers.logger import get_logger
+from ratelimit import PRIORITY_DEFAULT, priority
+
+logger = get_logger(__name__)
+
+
+def user_fields(user: User) -> Dict[str, str]:
+    """Per-user placeholder values, HTML-escaped"""
+    first = html.escape(user.first_name or '')
+    last = html.escape(user.last_name or '')
+    return {
+        'first': first,
+        'last': last,
+        'fullname': f"{first} {last}".strip(),
+        'username': f"@{html.escape(user.username)}" if user.username else first,
+        'mention': f'<a href="tg://user?id={user.id}">{first or user.id}</a>',
+        'id': str(user.id),
+    }
+
+
+USER_FIELDS = ('first', 'last', 'fullname', 'username', 'mention', 'id')
+CHAT_FIELDS = ('chatname', 'count')
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+class WelcomeTemplate:
+    """A welcome text split once into literal text and placeholders.
+
+    Placeholders follow the usual {first}, {last}, {fullname}, {username},
+    {mention} and {id} for the new members, plus {chatname} and {count}
+    (members greeted in this message). When one message greets several
+    members, each user placeholder lists all of them. Unknown placeholders
+    and stray braces are kept as written.
+    """
+
+    __slots__ = ('source', 'parts', 'fields')
+
+    def __init__(self, source: str):
+        self.source = source
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        literal, position = '', 0
+        for match in PLACEHOLDER.finditer(source):
+            literal += source[position:match.start()]
+            position = match.end()
+            if match.group(1) in USER_FIELDS or match.group(1) in CHAT_FIELDS:
+                self.parts.append((literal, match.group(1)))
+                literal = ''
+            else:
+                literal += match.group(0)
+        self.parts.append((literal + source[position:], None))
+        self.fields = {field for _, field in self.parts if field is not None}
+
+    def render(self, users: List[User], chat_title: Optional[str]) -> str:
+        values = {'chatname': html.escape(chat_title or ''), 'count': str(len(users))}
+        user_values = [user_fields(user) for user in users] if self.fields.intersection(USER_FIELDS) else []
+        for field in self.fields.intersection(USER_FIELDS):
+            values[field] = ', '.join(fields[field] for fields in user_values if fields[field])
+        return ''.join(literal + (values[field] if field is not None else '') for literal, field in self.parts)
+
+
+class PendingWelcome:
+    """Members waiting to be greeted in one chat"""
+
+    __slots__ = ('users', 'chat_title', 'task')
+
+    def __init__(self, chat_title: Optional[str]):
+        self.users: Dict[int, User] = {}
+        self.chat_title = chat_title
+        self.task: Optional[asyncio.Task] = None
+
+
+class WelcomePipeline:
+    """Greet join bursts with one message instead of one per member.
+
+    The first join in a chat opens a debounce window of `delay` seconds;
+    everyone who joins before it closes (up to max_mentions, which sends
+    early) is greeted in a single message. Each chat's template is
+    compiled once and reused until its text changes, so a join costs a
+    dictionary insert and a welcome costs one settings read and one
+    sendMessage. The previous welcome is deleted when a new one goes out,
+    and chats in raid mode are not greeted at all.
+    """
+
+    def __init__(self, delay: float = Config.WELCOME_DEBOUNCE, max_mentions: int = Config.WELCOME_MAX_MENTIONS,
+                 max_templates: int = 10000):
+        self.delay = delay
+        self.max_mentions = max(max_mentions, 1)
+        self.max_templates = max_templates
+        self.templates: 'OrderedDict[int, WelcomeTemplate]' = OrderedDict()
+        self.pending: Dict[int, PendingWelcome] = {}
+        self.sent = 0
+        self.greeted = 0
+
+    def template(self, chat_id: int, source: str) -> WelcomeTemplate:
+        """The chat's compiled template, recompiled only when its text changed"""
+        template = self.templates.get(chat_id)
+        if template is None or template.source != source:
+            template = self.templates[chat_id] = WelcomeTemplate(source)
+            while len(self.templates) > self.max_templates:
+                self.templates.popitem(last=False)
+        self.templates.move_to_end(chat_id)
+        return template
+
+    def add(self, bot: Bot, chat_id: int, users: List[User], chat_title: Optional[str] = None):
+        """Queue new members for the chat's next welcome"""
+        pending = self.pending.get(chat_id)
+        if pending is None:
+            pending = self.pending[chat_id] = PendingWelcome(chat_title)
+        for user in users:
+            pending.users[user.id] = user
+        if pending.task is None:
+            pending.task = asyncio.get_running_loop().create_task(self.flush(bot, chat_id, pending))
+
+    async def flush(self, bot: Bot, chat_id: int, pending: PendingWelcome):
+        deadline = time.monotonic() + self.delay
+        while len(pending.users) < self.max_mentions and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.1, self.delay))
+        if self.pending.get(chat_id) is pending:
+            del self.pending[chat_id]
+
+        users = list(pending.users.values())
+        # More joiners than fit in one message carry over to the next window
+        if len(users) > self.max_mentions:
+            users, overflow = users[:self.max_mentions], users[self.max_mentions:]
+            self.add(bot, chat_id, overflow, pending.chat_title)
+        try:
+            await self.send(bot, chat_id, users, pending.chat_title)
+        except Exception as e:
+            logger.error(f"❌ Welcome in chat {chat_id} failed: {e}")
+
+    async def send(self, bot: Bot, chat_id: int, users: List[User], chat_title: Optional[str]):
+        if anti_raid.in_raid(chat_id):
+            return
+        greeting = await get_greeting(chat_id)
+        if not greeting['welcome_enabled']:
+            return
+        text = self.template(chat_id, greeting['welcome_text'] or Config.DEFAULT_WELCOME_MESSAGE).render(users, chat_title)
+        if not text.strip():
+            return
+
+        with priority(PRIORITY_DEFAULT):
+            message = await bot.send_message(chat_id, text, parse_mode=ParseMode.HTML)
+            self.sent += 1
+            self.greeted += len(users)
+            await record_last_welcome(chat_id, message.message_id)
+            previous = greeting['last_welcome_id']
+            if greeting['clean_welcome'] and previous:
+                try:
+                    await bot.delete_message(chat_id, previous)
+                except TelegramError as e:
+                    logger.debug(f"Could not delete previous welcome {previous} in chat {chat_id}: {e}")
+
+    async def handle_new_members(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Queue the human members of a new_chat_members service message"""
+        message = update.effective_message
+        if message is None or not message.new_chat_members:
+            return
+        users = [user for user in message.new_chat_members if not user.is_bot]
+        if users:
+            self.add(context.bot, message.chat_id, users, message.chat.title)
+
+    async def stop(self):
+        """Drop welcomes still waiting for their window to close"""
+        tasks = [pending.task for pending in self.pending.values() if pending.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.pending.clear()
+
+
+# ====== COMMANDS ======
+
+@user_admin
+async def welcome_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/welcome shows the chat's welcome settings, /welcome on|off and /welcome clean on|off change them"""
+    message = update.effective_message
+    chat_id = update.effective_chat.id
+    greeting = await get_greeting(chat_id)
+    enabled, clean = bool(greeting['welcome_enabled']), bool(greeting['clean_welcome'])
+    args = [arg.lower() for arg in context.args or []]
+
+    if args in (['on'], ['off']):
+        await set_welcome(chat_id, greeting['welcome_text'], args[0] == 'on', clean)
+        await message.reply_text(f"✅ Welcome messages turned {args[0]}.")
+    elif args in (['clean', 'on'], ['clean', 'off']):
+        await set_welcome(chat_id, greeting['welcome_text'], enabled, args[1] == 'on')
+        await message.reply_text(f"✅ Deleting the previous welcome turned {args[1]}.")
+    elif args:
+        await message.reply_text("Usage: /welcome [on|off] or /welcome clean [on|off]")
+    else:
+        text = greeting['welcome_text'] or Config.DEFAULT_WELCOME_MESSAGE
+        await message.reply_text(
+            f"👋 <b>Welcome settings</b>\n\n"
+            f"Enabled: {'yes' if enabled else 'no'}\n"
+            f"Delete previous welcome: {'yes' if clean else 'no'}\n"
+            f"Message{'' if greeting['welcome_text'] else ' (default)'}:\n<pre>{html.escape(text)}</pre>",
+            parse_mode=ParseMode.HTML
+        )
+
+
+@user_admin
+async def set_welcome_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/setwelcome <text>, or in reply to a message, sets the welcome; with neither it restores the default"""
+    message = update.effective_message
+    chat = update.effective_chat
+    parts = message.text_html.split(None, 1)
+    if len(parts) > 1:
+        text = parts[1]
+    elif message.reply_to_message and message.reply_to_message.text:
+        text = message.reply_to_message.text_html
+    else:
+        text = None
+    greeting = await get_greeting(chat.id)
+
+    if text is not None:
+        # Telegram checks the HTML, so only save a welcome whose preview went through
+        preview = WelcomeTemplate(text).render([update.effective_user], chat.title)
+        try:
+            await message.reply_text(f"✅ Welcome message saved. Preview:\n\n{preview}", parse_mode=ParseMode.HTML)
+        except BadRequest as e:
+            await message.reply_text(f"❌ That welcome can't be sent: {e.message}")
+            return
+    await set_welcome(chat.id, text, bool(greeting['welcome_enabled']), bool(greeting['clean_welcome']))
+    if text is None:
+        await message.reply_text("✅ Welcome message reset to the default.")
+
+
+# Global welcome pipeline
+welcome_pipeline = WelcomePipeline()